@@ -1,6 +1,10 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Sequence
+import numpy as np
+import pandas as pd
 from app.agents.types import ValidationStrategy
 
+BREAKDOWN_COLUMNS = ["format", "provider_reliability", "whatsapp_detection", "history", "consistency"]
+
 class ConfidenceAgent:
     """
     Agent 3: Calculates a confidence score (0-100) for the validation result.
@@ -72,4 +76,49 @@ class ConfidenceAgent:
             "breakdown": breakdown
         }
 
+    def calculate_scores(
+        self,
+        is_valid_format: Sequence[bool],
+        whatsapp_exists: Sequence[bool],
+        provider_used: Sequence[Optional[str]],
+        history_present: Sequence[bool]
+    ) -> pd.DataFrame:
+        """
+        Column form of calculate_score: one row per input position with `score`,
+        `classification` and one column per breakdown signal (BREAKDOWN_COLUMNS).
+        Row i equals calculate_score(is_valid_format[i], whatsapp_exists[i], ...).
+        """
+        valid = np.array([bool(v) for v in is_valid_format], dtype=bool)
+        whatsapp = np.array([bool(v) for v in whatsapp_exists], dtype=bool)
+        history = np.array([bool(v) for v in history_present], dtype=bool)
+        provider = pd.Series(list(provider_used), dtype=object)
+
+        frame = pd.DataFrame({
+            "format": np.where(valid, 20, 0),
+            "provider_reliability": np.select(
+                [(provider == "whapi").to_numpy(), (provider == "mock").to_numpy()], [25, 10], 0
+            ),
+            "whatsapp_detection": np.where(whatsapp, 30, 0),
+            "history": np.where(history, 10, 0),
+            "consistency": np.full(len(valid), 15)
+        })
+        score = frame[BREAKDOWN_COLUMNS].sum(axis=1).astype(float).clip(0, 100)
+        frame.insert(0, "score", score)
+        frame.insert(1, "classification", np.select([score >= 80, score >= 60], ["HIGH", "MEDIUM"], "LOW"))
+        return frame
+
+    def score_records(self, frame: pd.DataFrame) -> list:
+        """
+        calculate_scores() output -> calculate_score()-shaped dicts, in row order.
+        """
+        columns = {name: frame[name].tolist() for name in ["score", "classification"] + BREAKDOWN_COLUMNS}
+        return [
+            {
+                "score": columns["score"][i],
+                "classification": columns["classification"][i],
+                "breakdown": {name: columns[name][i] for name in BREAKDOWN_COLUMNS}
+            }
+            for i in range(len(frame))
+        ]
+
 confidence_agent = ConfidenceAgent()
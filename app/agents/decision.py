@@ -1,66 +1,93 @@
-from typing import Optional, Dict, Any
-from app.agents.types import ValidationStrategy, DecisionTrace, DecisionSignal
-from app.db.models import ValidationHistory
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, Sequence
+import numpy as np
+import pandas as pd
+from app.agents.types import ValidationStrategy, DecisionTrace, DecisionSignal, HistorySnapshot
+from app.core.config import settings
+from app.core.freshness import freshness_policy, FRESH, STALE, POSITIVE, NEGATIVE, INVALID
 from app.core.logger import logger
 
+# Reasoning when history answers, by outcome
+HISTORY_REASONS = {
+    POSITIVE: "Information already known and valid.",
+    NEGATIVE: "Known valid number without WhatsApp, checked recently.",
+    INVALID: "Known invalid number, checked recently."
+}
+STALE_REASON = " Served from stale history, refresh queued."
+
+def _flag(value: Any) -> bool:
+    # NaN (a missing cell that went through pandas) is truthy for bool(); count it as unset
+    return bool(value) and value == value
+
 class DecisionAgent:
     """
     Agent 1: Determines the validation strategy based on signals.
     """
+    # e.g., Brazil/India have high WhatsApp usage -> Immediate
+    HIGH_PRIORITY_COUNTRIES = ["BR", "IN", "ID", "US"]
     
     def decide(
         self, 
         phone_number: str, 
         country_code: str, 
-        history: Optional[ValidationHistory], 
-        numverify_data: Optional[Dict[str, Any]] = None
+        history: Optional[HistorySnapshot], 
+        numverify_data: Optional[Dict[str, Any]] = None,
+        allow_deferred: bool = True,
+        allow_stale: bool = True
     ) -> DecisionTrace:
+        """
+        allow_deferred=False (batch paths) validates standard-priority markets immediately
+        instead of queueing them. allow_stale=False (refresh workers) revalidates stale history
+        instead of serving it.
+        """
         
         steps = []
         
-        # Step 1: Check History (Cache)
-        if history and history.is_valid and history.whatsapp_available:
-            # If recently validated successfully (logic to check recency can be added here)
-            # For now, if we have a valid history, we skip re-validation to save cost
+        # Step 1: Check History (fresh within its outcome's window, or stale-while-revalidate)
+        state = freshness_policy.state(history, country_code) if history else None
+        if state == FRESH or (state == STALE and allow_stale):
+            outcome = freshness_policy.outcome(history)
+            freshness_policy.count_served(state)
             steps.append(DecisionSignal(
                 rule_name="History Check",
                 passed=True,
-                details="Found recent successful validation in history"
+                details=f"Found {state} {outcome} validation in history"
             ))
             return DecisionTrace(
                 steps=steps,
                 final_decision=ValidationStrategy.SKIP,
-                reasoning="Information already known and valid."
+                reasoning=HISTORY_REASONS[outcome] + (STALE_REASON if state == STALE else ""),
+                refresh=state == STALE
             )
         
         steps.append(DecisionSignal(
             rule_name="History Check",
             passed=False,
-            details="No valid recent history found"
+            details=f"History is {state}, revalidating" if state else "No valid recent history found"
         ))
 
         # Step 2: NumVerify Signals (Format & Line Type)
         if numverify_data:
-            is_valid_format = numverify_data.get("valid", False)
+            is_valid_format = _flag(numverify_data.get("valid", False))
             line_type = numverify_data.get("line_type", "")
             
+            source = "NumVerify" if numverify_data.get("source", "numverify") == "numverify" else "offline check"
+            
             steps.append(DecisionSignal(
                 rule_name="NumVerify Format",
                 passed=is_valid_format,
-                details=f"Format Valid: {is_valid_format}, Type: {line_type}"
+                details=f"Format Valid: {is_valid_format}, Type: {line_type}, Source: {source}"
             ))
             
             if not is_valid_format:
                 return DecisionTrace(
                     steps=steps,
                     final_decision=ValidationStrategy.SKIP,
-                    reasoning="Number format is invalid according to NumVerify."
+                    reasoning=f"Number format is invalid according to {source}."
                 )
         
         # Step 3: Country / Market Logic (Placeholder for penetration rates)
-        # e.g., Brazil/India have high WhatsApp usage -> Immediate
-        high_priority_countries = ["BR", "IN", "ID", "US"]
-        is_priority = country_code.upper() in high_priority_countries
+        is_priority = country_code.upper() in self.HIGH_PRIORITY_COUNTRIES
         
         steps.append(DecisionSignal(
             rule_name="Country Priority",
@@ -72,11 +99,11 @@ class DecisionAgent:
         if is_priority:
             decision = ValidationStrategy.IMMEDIATE
             reasoning = "High priority market, proceed with immediate validation."
+        elif allow_deferred and settings.DEFERRED_ENABLED:
+            # Standard markets go to the background queue instead of the request path
+            decision = ValidationStrategy.DEFERRED
+            reasoning = "Standard priority, queued for background validation."
         else:
-            # Default to Deferred for others if we want to save resources, 
-            # but for this MVP we might default to Immediate or Deferred based on requirements.
-            # Let's say we fallback to Immediate for now to ensure we get results, 
-            # or Deferred if we had a queue.
             decision = ValidationStrategy.IMMEDIATE 
             reasoning = "Standard priority, proceeding with validation."
 
@@ -86,4 +113,60 @@ class DecisionAgent:
             reasoning=reasoning
         )
 
+    def decide_batch(
+        self,
+        country_codes: Sequence[str],
+        histories: Sequence[Optional[HistorySnapshot]],
+        numverify_results: Sequence[Optional[Dict[str, Any]]],
+        allow_deferred: bool = True,
+        allow_stale: bool = True
+    ) -> pd.DataFrame:
+        """
+        Column form of decide: one row per input position with the `strategy`,
+        `reasoning` and `refresh` decide() would return (the per-step signals are not built).
+        """
+        now = datetime.now(timezone.utc)
+        states = [
+            freshness_policy.state(h, c, now) if h is not None else None
+            for h, c in zip(histories, country_codes)
+        ]
+        history_ok = np.array([s == FRESH or (s == STALE and allow_stale) for s in states], dtype=bool)
+        stale = history_ok & np.array([s == STALE for s in states], dtype=bool)
+        history_reason = np.array([
+            HISTORY_REASONS[freshness_policy.outcome(h)] + (STALE_REASON if s == STALE else "") if ok else ""
+            for h, s, ok in zip(histories, states, history_ok)
+        ], dtype=object)
+        stale_rows = int(stale.sum())
+        freshness_policy.count_served(FRESH, int(history_ok.sum()) - stale_rows)
+        freshness_policy.count_served(STALE, stale_rows)
+        checked = np.array([bool(nv) for nv in numverify_results], dtype=bool)
+        valid = np.array([bool(nv) and _flag(nv.get("valid", False)) for nv in numverify_results], dtype=bool)
+        source = pd.Series([
+            "NumVerify" if nv and nv.get("source", "numverify") == "numverify" else "offline check"
+            for nv in numverify_results
+        ], dtype=object)
+        is_priority = pd.Series(list(country_codes), dtype=object).str.upper().isin(self.HIGH_PRIORITY_COUNTRIES).to_numpy()
+        deferred = allow_deferred and settings.DEFERRED_ENABLED
+
+        # Same precedence as decide(): history, format, market
+        conditions = [history_ok, checked & ~valid, is_priority, np.full(len(history_ok), deferred)]
+        strategy = np.select(conditions, [
+            ValidationStrategy.SKIP.value,
+            ValidationStrategy.SKIP.value,
+            ValidationStrategy.IMMEDIATE.value,
+            ValidationStrategy.DEFERRED.value
+        ], ValidationStrategy.IMMEDIATE.value)
+        reasoning = np.select(conditions, [
+            history_reason,
+            ("Number format is invalid according to " + source + ".").to_numpy(),
+            "High priority market, proceed with immediate validation.",
+            "Standard priority, queued for background validation."
+        ], "Standard priority, proceeding with validation.")
+
+        return pd.DataFrame({
+            "strategy": pd.Series(strategy, dtype=object).map(ValidationStrategy),
+            "reasoning": reasoning,
+            "refresh": stale
+        })
+
 decision_agent = DecisionAgent()
@@ -1,56 +1,123 @@
-from sqlalchemy.orm import Session
+import itertools
+from sqlalchemy import case, func, insert
+from typing import Any, Dict, List
 from app.db.models import AgentDecision, ProviderHealth
 from app.agents.types import DecisionTrace, ValidationStrategy
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, insert_for_dialect
 from app.core.logger import logger
-from datetime import datetime
+from app.core.write_behind import WriteBehindBuffer
+from datetime import datetime, timezone
+
+class LearningWriter(WriteBehindBuffer):
+    """
+    Buffers decision records and per-provider counters, and writes both in
+    one transaction per flush.
+    Keys: ("decision", n) -> AgentDecision row, ("provider", name) -> aggregated counters.
+    """
+
+    def _merge(self, existing: Dict[str, Any], record: Dict[str, Any]) -> Dict[str, Any]:
+        # Only provider counters share keys; sum them
+        return {
+            **existing,
+            "success": existing["success"] + record["success"],
+            "failure": existing["failure"] + record["failure"],
+            "total_time": existing["total_time"] + record["total_time"]
+        }
+
+    def _provider_upsert(self, counters: Dict[str, Any]):
+        """
+        Adds a flush's counters to the provider's ProviderHealth row in one statement
+        (no read-modify-write, so concurrent flushes from other workers are not lost).
+        Latency is exponentially weighted: recent flushes dominate, old latency fades out.
+        """
+        new_ops = counters["success"] + counters["failure"]
+        interval_mean = counters["total_time"] / new_ops if new_ops else 0.0
+        stmt = insert_for_dialect()(ProviderHealth).values(
+            provider_name=counters["provider_name"],
+            success_count=counters["success"],
+            failure_count=counters["failure"],
+            avg_response_time=interval_mean
+        )
+        previous_avg = func.coalesce(ProviderHealth.avg_response_time, 0.0)
+        previous_ops = func.coalesce(ProviderHealth.success_count, 0) + func.coalesce(ProviderHealth.failure_count, 0)
+        if new_ops:
+            alpha = settings.PROVIDER_LATENCY_EWMA_ALPHA
+            avg_response_time = case(
+                (previous_ops == 0, stmt.excluded.avg_response_time),
+                else_=(1 - alpha) * previous_avg + alpha * stmt.excluded.avg_response_time
+            )
+        else:
+            avg_response_time = previous_avg
+        return stmt.on_conflict_do_update(
+            index_elements=[ProviderHealth.provider_name],
+            set_={
+                "success_count": func.coalesce(ProviderHealth.success_count, 0) + stmt.excluded.success_count,
+                "failure_count": func.coalesce(ProviderHealth.failure_count, 0) + stmt.excluded.failure_count,
+                "avg_response_time": avg_response_time,
+                "last_updated": func.now()
+            }
+        )
+
+    async def _write(self, records: List[Dict[str, Any]]):
+        # Records arrive without their keys, so split them by shape
+        decisions = [r for r in records if "phone_number" in r]
+        providers = [r for r in records if "provider_name" in r]
+        
+        async with AsyncSessionLocal() as db:
+            if decisions:
+                await db.execute(insert(AgentDecision), decisions)
+            
+            for counters in providers:
+                await db.execute(self._provider_upsert(counters))
+            
+            await db.commit()
+        logger.info(f"Flushed {len(decisions)} decisions and {len(providers)} provider metrics")
 
 class LearningAgent:
     """
     Agent 4: Background process to learn from decisions and outcomes.
+    Writes are buffered in memory and flushed in bulk (see LearningWriter).
     """
     
-    def record_decision(self, db: Session, phone: str, strategy: ValidationStrategy, trace: DecisionTrace):
+    def __init__(self):
+        self._writer = LearningWriter(
+            "LearningWriter",
+            max_size=settings.LEARNING_FLUSH_SIZE,
+            interval=settings.LEARNING_FLUSH_INTERVAL
+        )
+        self._sequence = itertools.count()
+
+    async def start(self):
+        await self._writer.start()
+
+    async def stop(self):
+        # Flushes whatever is still buffered
+        await self._writer.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return self._writer.stats()
+    
+    def record_decision(self, phone: str, strategy: ValidationStrategy, trace: DecisionTrace):
         """
         Stores the decision made by Agent 1 for future analysis.
         """
-        try:
-            decision_record = AgentDecision(
-                phone_number=phone,
-                strategy=strategy.value,
-                reasoning_trace=trace.dict()
-            )
-            db.add(decision_record)
-            db.commit()
-            logger.info(f"Recorded decision for {phone}")
-        except Exception as e:
-            logger.error(f"Failed to record decision: {e}")
-            db.rollback()
-
-    def update_provider_metrics(self, db: Session, provider_name: str, success: bool, response_time: float):
+        self._writer.add(("decision", next(self._sequence)), {
+            "phone_number": phone,
+            "strategy": strategy.value,
+            "reasoning_trace": trace.dict(),
+            "timestamp": datetime.now(timezone.utc)
+        })
+
+    def update_provider_metrics(self, provider_name: str, success: bool, response_time: float):
         """
         Updates success/failure rates for providers (Agent 2 feedback).
         """
-        try:
-            provider = db.query(ProviderHealth).filter(ProviderHealth.provider_name == provider_name).first()
-            if not provider:
-                provider = ProviderHealth(provider_name=provider_name)
-                db.add(provider)
-            
-            if success:
-                provider.success_count += 1
-            else:
-                provider.failure_count += 1
-                
-            # Simple moving average for response time (simplified)
-            current_avg = provider.avg_response_time
-            total_ops = provider.success_count + provider.failure_count
-            new_avg = ((current_avg * (total_ops - 1)) + response_time) / total_ops
-            provider.avg_response_time = new_avg
-            
-            db.commit()
-            logger.info(f"Updated metrics for {provider_name}")
-        except Exception as e:
-            logger.error(f"Failed to update provider metrics: {e}")
-            db.rollback()
+        self._writer.add(("provider", provider_name), {
+            "provider_name": provider_name,
+            "success": 1 if success else 0,
+            "failure": 0 if success else 1,
+            "total_time": response_time
+        })
 
 learning_agent = LearningAgent()
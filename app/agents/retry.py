@@ -1,9 +1,69 @@
+import asyncio
+import time
 import aiohttp
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from typing import Optional, Dict, Any
+from collections import Counter
+from contextlib import asynccontextmanager
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+from sqlalchemy import select
+from app.core.batching import MicroBatcher
+from app.core.cache import validation_cache, MISSING
+from app.core.circuit import CircuitBreaker, CircuitState, CircuitOpenError, breakers
 from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.format_store import format_store
+from app.core.hedging import Hedger
 from app.core.logger import logger
-from app.agents.types import ValidationResult, ValidationStrategy
+from app.core.metrics import provider_metrics
+from app.core.phone import parse_number, normalize_key
+from app.core.ratelimit import rate_limiters, PrioritySemaphore, QuotaExceededError, RateLimitedError, parse_retry_after
+from app.core.singleflight import SingleFlight
+from app.agents.learning import learning_agent
+from app.db.models import ProviderHealth
+
+def _count_retry(provider: str):
+    """tenacity before_sleep hook: counts each scheduled retry."""
+    def before_sleep(retry_state):
+        provider_metrics.record_retry(provider)
+    return before_sleep
+
+def _circuit_rejects(provider: str):
+    """
+    tenacity stop condition, checked before each retry attempt: give up unless the
+    provider's circuit admits another call. A half-open trial retries under the
+    admission its caller already holds (a failure would have reopened the circuit).
+    """
+    def stop(retry_state) -> bool:
+        breaker = breakers[provider]
+        if breaker.state == CircuitState.HALF_OPEN:
+            return False
+        return not breaker.allow_request()
+    return stop
+
+def _retryable(exc: BaseException) -> bool:
+    """Transport errors, and 429s whose Retry-After is short enough to wait out."""
+    if isinstance(exc, RateLimitedError):
+        return exc.retry_after <= settings.RATE_LIMIT_MAX_RETRY_AFTER
+    return isinstance(exc, (aiohttp.ClientError, TimeoutError))
+
+_backoff = wait_exponential(multiplier=1, min=2, max=10)
+
+def _wait_backoff(retry_state) -> float:
+    """Exponential backoff, except after a 429: the rate limiter already holds calls until Retry-After."""
+    if isinstance(retry_state.outcome.exception(), RateLimitedError):
+        return 0.0
+    return _backoff(retry_state)
+
+def _sleep_until_open(provider: str, poll: float = 0.05):
+    """tenacity sleep: backs off like asyncio.sleep but wakes early when the circuit opens."""
+    async def sleep(seconds: float):
+        deadline = time.monotonic() + seconds
+        while breakers[provider].state != CircuitState.OPEN:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(poll, remaining))
+    return sleep
 
 class RetryAgent:
     """
@@ -12,40 +72,353 @@ class RetryAgent:
     
     def __init__(self):
         self.timeout = aiohttp.ClientTimeout(total=10)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphores: Optional[Dict[str, PrioritySemaphore]] = None
+        # Requests holding / waiting for a provider slot, counted here rather than read off the connector
+        self._in_flight: Counter = Counter()
+        self._waiting: Counter = Counter()
+        # Connector events (opened, reused, queued), counted through aiohttp's request tracing
+        self._connections: Counter = Counter()
+        self._whapi_batcher: Optional[MicroBatcher] = None
+        # Concurrent lookups of the same number share one provider call
+        self._inflight = SingleFlight()
+        self.breakers: Dict[str, CircuitBreaker] = breakers
+        # WhatsApp providers eligible for routing; the mock fallback always runs last
+        self._whatsapp_providers: Dict[str, Callable[[str], Awaitable[bool]]] = {
+            "whapi": self._call_whapi,
+        }
+        # Second attempt fired by a hedge when no other provider is available
+        self._whatsapp_hedges: Dict[str, Callable[[str], Awaitable[bool]]] = {
+            "whapi": self._call_whapi_once,
+        }
+        self.hedger = Hedger()
+        # ProviderHealth rows: long-run priors until live samples are available
+        self._health: Dict[str, Dict[str, float]] = {}
+        self._health_task: Optional[asyncio.Task] = None
+        self._route_cache: Tuple[float, List[str]] = (0.0, [])
+
+    async def startup(self):
+        """
+        Opens the shared connection pool and starts the ProviderHealth refresh (called from the app lifespan).
+        """
+        await self._open_pool()
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._refresh_health_loop())
+
+    async def _open_pool(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_LIMIT,
+            limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=settings.HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=settings.HTTP_KEEPALIVE_TIMEOUT
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=self.timeout, trace_configs=[self._connection_tracing()]
+        )
+        logger.info("RetryAgent HTTP pool opened")
+
+    def _connection_tracing(self) -> aiohttp.TraceConfig:
+        def count(event: str):
+            async def handler(session, trace_config_ctx, params):
+                self._connections[event] += 1
+            return handler
+
+        tracing = aiohttp.TraceConfig()
+        tracing.on_connection_create_end.append(count("opened"))
+        tracing.on_connection_reuseconn.append(count("reused"))
+        tracing.on_connection_queued_start.append(count("queued"))
+        return tracing
+
+    async def shutdown(self):
+        """
+        Closes the shared connection pool.
+        """
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("RetryAgent HTTP pool closed")
+        self._session = None
 
-    async def validate_format(self, phone_number: str, country_code: str) -> Dict[str, Any]:
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Lazily open the pool for callers running outside the app lifespan (scripts)
+        if self._session is None or self._session.closed:
+            await self._open_pool()
+        return self._session
+
+    async def refresh_provider_health(self):
+        """
+        Reloads success rate and average latency per provider from ProviderHealth.
+        """
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(select(ProviderHealth))).scalars().all()
+        health = {}
+        for row in rows:
+            total = (row.success_count or 0) + (row.failure_count or 0)
+            if total:
+                health[row.provider_name] = {
+                    "success_rate": (row.success_count or 0) / total,
+                    "avg_response_time": row.avg_response_time or 0.0
+                }
+        self._health = health
+
+    async def _refresh_health_loop(self):
+        while True:
+            try:
+                await self.refresh_provider_health()
+            except Exception as e:
+                logger.error(f"ProviderHealth refresh failed: {e}")
+            await asyncio.sleep(settings.PROVIDER_HEALTH_REFRESH_INTERVAL)
+
+    def _provider_score(self, provider: str) -> float:
+        # Recent window when it has enough samples, ProviderHealth otherwise;
+        # unknown providers score as perfect so they get tried.
+        live = provider_metrics.snapshot(provider)
+        if live["count"] >= settings.ROUTING_MIN_SAMPLES:
+            success_rate, latency = 1.0 - live["error_rate"], live["mean"]
+        elif provider in self._health:
+            success_rate = self._health[provider]["success_rate"]
+            latency = self._health[provider]["avg_response_time"]
+        else:
+            success_rate, latency = 1.0, 0.0
+        return success_rate / (1.0 + latency)
+
+    def whatsapp_route(self) -> List[str]:
+        """
+        WhatsApp providers, best recent success rate and latency first (recomputed at most once a second).
+        """
+        providers = list(self._whatsapp_providers)
+        if len(providers) < 2:
+            return providers
+        computed_at, order = self._route_cache
+        now = time.monotonic()
+        if now - computed_at >= 1.0 or not order:
+            order = sorted(providers, key=self._provider_score, reverse=True)
+            self._route_cache = (now, order)
+        return order
+
+    def _limit(self, provider: str) -> PrioritySemaphore:
+        # Caps concurrent HTTP calls per provider, interactive callers first; created lazily
+        if self._semaphores is None:
+            self._semaphores = {
+                "numverify": PrioritySemaphore(settings.NUMVERIFY_MAX_CONCURRENCY),
+                "whapi": PrioritySemaphore(settings.WHAPI_MAX_CONCURRENCY),
+            }
+        return self._semaphores[provider]
+
+    @asynccontextmanager
+    async def _slot(self, provider: str):
         """
-        Validates format using NumVerify (or local fallback).
+        Holds one of the provider's concurrency slots for the length of an HTTP request.
+        Callers take their rate-limit token inside the slot, right before sending, so
+        tokens are not banked by callers still queued here and released in a burst.
         """
+        semaphore = self._limit(provider)
+        self._waiting[provider] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._waiting[provider] -= 1
+        self._in_flight[provider] += 1
+        try:
+            yield
+        finally:
+            self._in_flight[provider] -= 1
+            semaphore.release()
+
+    def _get_whapi_batcher(self) -> MicroBatcher:
+        if self._whapi_batcher is None:
+            self._whapi_batcher = MicroBatcher(
+                self._call_whapi_bulk,
+                max_size=settings.WHAPI_BATCH_MAX_SIZE,
+                max_wait=settings.WHAPI_BATCH_MAX_WAIT
+            )
+        return self._whapi_batcher
+
+    def batching_stats(self) -> Dict[str, Any]:
+        if self._whapi_batcher is None:
+            return {"calls": 0, "batches_sent": 0, "keys_sent": 0, "avg_batch_size": 0.0, "pending": 0}
+        return self._whapi_batcher.stats()
+
+    def provider_stats(self) -> Dict[str, Any]:
+        """
+        Sliding-window latency percentiles, error rates and retries per provider.
+        """
+        providers = sorted(set(provider_metrics.providers()) | set(self.breakers))
+        stats = {}
+        for provider in providers:
+            stats[provider] = provider_metrics.snapshot(provider)
+            if provider in self.breakers:
+                stats[provider]["circuit"] = self.breakers[provider].snapshot()
+            if provider in self._health:
+                stats[provider]["provider_health"] = self._health[provider]
+            if provider in rate_limiters:
+                stats[provider]["rate_limit"] = rate_limiters[provider].stats()
+        stats["whatsapp_route"] = self.whatsapp_route()
+        stats["hedging"] = self.hedger.stats()
+        return stats
+
+    def rate_limit_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {provider: limiter.stats() for provider, limiter in rate_limiters.items()}
+
+    def circuit_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {provider: breaker.snapshot() for provider, breaker in self.breakers.items()}
+
+    def coalescing_stats(self) -> Dict[str, Any]:
+        return self._inflight.stats()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Outbound request usage: in_use = requests holding a provider slot (taking their rate-limit
+        token or on the wire), waiting = requests queued for a slot. Connector activity since
+        startup: connections opened, requests that reused a kept-alive connection, and requests
+        that queued for a free connection at the pool limit. The number of open / idle connections
+        is not reported: aiohttp has no public API for it, and its private attributes change between releases.
+        """
+        by_provider = {
+            provider: {"in_use": self._in_flight[provider], "waiting": self._waiting[provider]}
+            for provider in sorted(set(self._in_flight) | set(self._waiting))
+        }
+        stats = {
+            "active": self._session is not None and not self._session.closed,
+            "in_use": sum(self._in_flight.values()),
+            "waiting": sum(self._waiting.values()),
+            "by_provider": by_provider,
+            "connections": {event: self._connections[event] for event in ("opened", "reused", "queued")}
+        }
+        if stats["active"]:
+            stats["limit"] = self._session.connector.limit
+            stats["limit_per_host"] = self._session.connector.limit_per_host
+        return stats
+
+    async def validate_format(self, phone_number: str, country_code: str, need_carrier: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Validates format locally (phonenumbers) and escalates to NumVerify only
+        for valid numbers whose carrier is needed but not known offline.
+        """
+        if need_carrier is None:
+            need_carrier = settings.CARRIER_LOOKUP_ENABLED
+        
+        cache_key = (normalize_key(phone_number, country_code), need_carrier)
+        await validation_cache.format.load([cache_key])
+        cached = validation_cache.format.get(cache_key)
+        if cached is not MISSING:
+            return cached
+        
+        return await self._inflight.do(
+            ("numverify",) + cache_key,
+            lambda: self._validate_format_uncached(phone_number, country_code, need_carrier, cache_key)
+        )
+
+    async def _validate_format_uncached(self, phone_number: str, country_code: str, need_carrier: bool, cache_key: tuple) -> Dict[str, Any]:
+        local = parse_number(phone_number, country_code)
+        if not local["valid"]:
+            # Invalid numbers never reach the paid API
+            validation_cache.format.set(cache_key, local)
+            return local
+        if not need_carrier or local.get("carrier"):
+            validation_cache.format.set(cache_key, local)
+            return local
+        
+        if settings.FORMAT_STORE_ENABLED:
+            # Earlier NumVerify answers, from this or any other process
+            stored = await format_store.get(cache_key[0], country_code)
+            if stored is not None:
+                validation_cache.format.set(cache_key, stored)
+                return stored
+        
         if not settings.NUMVERIFY_API_KEY:
-             logger.warning("NumVerify API Key missing, skipping enhanced format check.")
-             return {"valid": True, "line_type": "unknown (api_key_missing)"}
+             logger.warning("NumVerify API Key missing, using offline format data.")
+             validation_cache.format.set(cache_key, local)
+             return local
+
+        breaker = self.breakers["numverify"]
+        if not breaker.allow_request():
+            # Circuit open: offline data now instead of waiting on a failing API (not cached)
+            return local
 
-        url = f"http://apilayer.net/api/validate?access_key={settings.NUMVERIFY_API_KEY}&number={phone_number}&country_code={country_code}&format=1"
+        url = f"http://apilayer.net/api/validate?access_key={settings.NUMVERIFY_API_KEY}&number={local['number']}&format=1"
         
+        limiter = rate_limiters["numverify"]
+        # True / False once NumVerify answered or failed; stays None when the call was
+        # throttled, out of quota or cancelled, which are not provider failures
+        outcome: Optional[bool] = None
         try:
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        logger.info(f"NumVerify response for {phone_number}: {data}")
-                        return data
-                    else:
-                        logger.error(f"NumVerify failed: {response.status}")
-                        return {"valid": False, "line_type": "unknown (error)", "carrier": "unknown (error)"}
-        except Exception as e:
-            logger.error(f"NumVerify exception for {phone_number}: {str(e)}")
-            return {"valid": False, "line_type": "unknown (exception)", "carrier": "unknown (exception)"}
+            session = await self._get_session()
+            async with self._slot("numverify"):
+                try:
+                    await limiter.acquire()
+                except QuotaExceededError as e:
+                    logger.warning(f"{e}, using offline format data.")
+                    return local
+                start = time.perf_counter()
+                try:
+                    async with session.get(url) as response:
+                        if response.status == 429:
+                            limiter.block(parse_retry_after(response.headers.get("Retry-After")))
+                            return local
+                        if response.status == 200:
+                            data = await response.json()
+                            logger.info(f"NumVerify response for {phone_number}: {data}")
+                            if "valid" not in data:
+                                # API-level error payload (bad key, quota, ...)
+                                error = data.get("error") or {}
+                                logger.error(f"NumVerify error payload: {error}")
+                                if error.get("code") == 104:
+                                    # Monthly usage limit reached
+                                    limiter.exhaust_quota()
+                                elif error.get("code") == 106:
+                                    # Rate limit reached
+                                    limiter.block(1.0)
+                                else:
+                                    outcome = False
+                                return local
+                            outcome = True
+                            data["source"] = "numverify"
+                            data["e164"] = local["e164"]
+                            validation_cache.format.set(cache_key, data)
+                            if settings.FORMAT_STORE_ENABLED:
+                                format_store.record(cache_key[0], country_code, data)
+                            return data
+                        else:
+                            outcome = False
+                            logger.error(f"NumVerify failed: {response.status}")
+                            return local
+                except Exception as e:
+                    outcome = False
+                    logger.error(f"NumVerify exception for {phone_number}: {str(e)}")
+                    return local
+                finally:
+                    provider_metrics.observe("numverify", time.perf_counter() - start, outcome is True)
+        finally:
+            if outcome is None:
+                breaker.release()
+            else:
+                breaker.record(outcome)
 
     @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10),
-        retry=retry_if_exception_type((aiohttp.ClientError, TimeoutError))
+        stop=stop_after_attempt(3) | _circuit_rejects("whapi"),
+        wait=_wait_backoff,
+        retry=retry_if_exception(_retryable),
+        before_sleep=_count_retry("whapi"),
+        sleep=_sleep_until_open("whapi")
     )
-    async def _call_whapi(self, phone_number: str) -> bool:
-        """Primary Provider: Whapi.cloud"""
+    async def _call_whapi_bulk(self, phone_numbers: List[str]) -> Dict[str, bool]:
+        """Primary Provider: Whapi.cloud, many contacts per request"""
+        return await self._post_whapi_contacts(phone_numbers)
+
+    async def _post_whapi_contacts(self, phone_numbers: List[str]) -> Dict[str, bool]:
+        """One Whapi request, no retries"""
         if not settings.WHAPI_API_TOKEN:
             raise ValueError("Whapi Token missing")
+        if self.breakers["whapi"].state == CircuitState.OPEN:
+            # Opened while this call waited for its retry; not retried
+            raise CircuitOpenError("whapi")
+        limiter = rate_limiters["whapi"]
             
         # Example Endpoint - Adjust strictly to Whapi API docs
         url = "https://gate.whapi.cloud/contacts"
@@ -55,45 +428,168 @@ class RetryAgent:
         }
         payload = {
             "blocking": "wait",
-            "contacts": [phone_number]
+            "contacts": phone_numbers
         }
         
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # Parse Whapi response to check if 'status' is 'valid'
-                    contacts = data.get("contacts", [])
-                    if contacts:
-                        return contacts[0].get("status") == "valid"
-                    return False
-                raise aiohttp.ClientError(f"Whapi Error: {response.status}")
+        session = await self._get_session()
+        async with self._slot("whapi"):
+            await limiter.acquire()
+            # Timed per attempt: every tenacity retry lands here again
+            start = time.perf_counter()
+            # Stays None when throttled or cancelled (a losing hedge): not provider failures
+            outcome: Optional[bool] = None
+            try:
+                async with session.post(url, json=payload, headers=headers) as response:
+                    if response.status == 429:
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        limiter.block(retry_after)
+                        raise RateLimitedError("whapi", retry_after)
+                    if response.status == 200:
+                        data = await response.json()
+                        # Parse Whapi response to check if 'status' is 'valid'
+                        contacts = data.get("contacts", [])
+                        results = {}
+                        for i, contact in enumerate(contacts):
+                            # Contacts echo their 'input'; fall back to request order
+                            key = contact.get("input")
+                            if key not in phone_numbers and i < len(phone_numbers):
+                                key = phone_numbers[i]
+                            results[key] = contact.get("status") == "valid"
+                        # Numbers Whapi did not return are not on WhatsApp
+                        for phone_number in phone_numbers:
+                            results.setdefault(phone_number, False)
+                        outcome = True
+                        return results
+                    raise aiohttp.ClientError(f"Whapi Error: {response.status}")
+            except RateLimitedError:
+                raise
+            except Exception:
+                outcome = False
+                raise
+            finally:
+                provider_metrics.observe("whapi", time.perf_counter() - start, outcome is True)
+                if outcome is not None:
+                    self.breakers["whapi"].record(outcome)
+
+    async def _call_whapi(self, phone_number: str) -> bool:
+        """Single-number Whapi check, micro-batched with concurrent callers when enabled"""
+        if not settings.WHAPI_API_TOKEN:
+            raise ValueError("Whapi Token missing")
+        if settings.WHAPI_BATCHING_ENABLED:
+            return await self._get_whapi_batcher().submit(phone_number)
+        results = await self._call_whapi_bulk([phone_number])
+        return results[phone_number]
+
+    async def _call_whapi_once(self, phone_number: str) -> bool:
+        """Single-number Whapi request outside the batcher and retries (hedge attempt)"""
+        results = await self._post_whapi_contacts([phone_number])
+        return results[phone_number]
+
+    async def _call_hedged(self, provider: str, phone_number: str) -> Tuple[bool, str, bool]:
+        """
+        Calls `provider`; if it is slower than its learned hedge delay, also asks the next
+        routed provider with a closed circuit (or the same provider again) and keeps the
+        first answer. Returns (available, answering provider, hedge won).
+        """
+        backup = next(
+            (p for p in self.whatsapp_route() if p != provider and self.breakers[p].state == CircuitState.CLOSED),
+            None
+        )
+        if backup is not None:
+            hedge_provider, hedge = backup, self._whatsapp_providers[backup]
+        else:
+            hedge_provider, hedge = provider, self._whatsapp_hedges[provider]
+
+        delay = self.hedger.delay(provider)
+        if provider == "whapi" and settings.WHAPI_BATCHING_ENABLED:
+            # Metrics time the HTTP call; batched callers also wait for the batch to fill
+            delay += settings.WHAPI_BATCH_MAX_WAIT
+
+        is_valid, hedge_won = await self.hedger.run(
+            lambda: self._whatsapp_providers[provider](phone_number),
+            lambda: hedge(phone_number),
+            delay
+        )
+        return is_valid, hedge_provider if hedge_won else provider, hedge_won
 
     @retry(
         stop=stop_after_attempt(2),
-        wait=wait_exponential(multiplier=1, min=2, max=5)
+        wait=wait_exponential(multiplier=1, min=2, max=5),
+        before_sleep=_count_retry("mock")
     )
     async def _call_mock(self, phone_number: str) -> bool:
         """Fallback: Mock Provider"""
         logger.info(f"Using Mock Provider for {phone_number}")
+        provider_metrics.observe("mock", 0.0, True)
         return True
 
-    async def check_whatsapp_availability(self, phone_number: str) -> Dict[str, Any]:
+    async def check_whatsapp_availability(self, phone_number: str, country_code: Optional[str] = None) -> Dict[str, Any]:
         """
-        Orchestrates the failover: Whapi -> Mock
+        Orchestrates the failover: routed providers (open circuits skipped) -> Mock
         """
+        cache_key = normalize_key(phone_number, country_code)
+        await validation_cache.whatsapp.load([cache_key])
+        cached = validation_cache.whatsapp.get(cache_key)
+        if cached is not MISSING:
+            return {**cached, "tried": [], "cached": True}
+        
+        return await self._inflight.do(
+            ("whatsapp", cache_key),
+            lambda: self._check_whatsapp_uncached(phone_number, cache_key)
+        )
+
+    async def _check_whatsapp_uncached(self, phone_number: str, cache_key: str) -> Dict[str, Any]:
         providers_tried = []
+        circuit_open = []
+        start = time.perf_counter()
         
-        # 1. Try Whapi
-        try:
-            is_valid = await self._call_whapi(phone_number)
-            return {"available": is_valid, "provider": "whapi", "tried": ["whapi"]}
-        except Exception as e:
-            logger.warning(f"Whapi failed: {e}")
-            providers_tried.append("whapi")
+        # 1. Real providers in routing order; open circuits fail fast
+        for provider in self.whatsapp_route():
+            attempt_start = time.perf_counter()
+            try:
+                if not self.breakers[provider].allow_request():
+                    raise CircuitOpenError(provider)
+                try:
+                    if settings.HEDGE_ENABLED:
+                        is_valid, answered_by, hedged = await self._call_hedged(provider, phone_number)
+                    else:
+                        is_valid = await self._whatsapp_providers[provider](phone_number)
+                        answered_by, hedged = provider, False
+                except (aiohttp.ClientError, TimeoutError):
+                    # ProviderHealth: no answer (config errors and open circuits are not the provider's fault)
+                    learning_agent.update_provider_metrics(provider, False, time.perf_counter() - attempt_start)
+                    raise
+                finally:
+                    # A recorded outcome already moved a half-open circuit on; otherwise
+                    # (throttled, out of quota, cancelled) the trial admission goes back
+                    self.breakers[provider].release()
+                # ProviderHealth: the provider answered, whether or not the number is on WhatsApp
+                learning_agent.update_provider_metrics(answered_by, True, time.perf_counter() - attempt_start)
+                result = {
+                    "available": is_valid,
+                    "provider": answered_by,
+                    "tried": providers_tried + [provider],
+                    "circuit_open": circuit_open,
+                    "hedged": hedged,
+                    "response_time": time.perf_counter() - start
+                }
+                # Only real provider answers are cached, never the mock fallback
+                validation_cache.whatsapp.set(cache_key, {"available": is_valid, "provider": answered_by})
+                return result
+            except CircuitOpenError:
+                circuit_open.append(provider)
+            except Exception as e:
+                logger.warning(f"{provider} failed: {e}")
+                providers_tried.append(provider)
 
         # 2. Fallback to Mock
         is_valid = await self._call_mock(phone_number)
-        return {"available": is_valid, "provider": "mock", "tried": providers_tried + ["mock"]}
+        return {
+            "available": is_valid,
+            "provider": "mock",
+            "tried": providers_tried + ["mock"],
+            "circuit_open": circuit_open,
+            "response_time": time.perf_counter() - start
+        }
 
 retry_agent = RetryAgent()
@@ -1,6 +1,7 @@
 from enum import Enum
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
+from datetime import datetime
 
 class ValidationStrategy(str, Enum):
     IMMEDIATE = "immediate"
@@ -16,6 +17,7 @@ class DecisionTrace(BaseModel):
     steps: List[DecisionSignal]
     final_decision: ValidationStrategy
     reasoning: str
+    refresh: bool = False  # Answered from stale history; the caller queues a background refresh
 
 class ValidationResult(BaseModel):
     phone_number: str
@@ -26,3 +28,15 @@ class ValidationResult(BaseModel):
     confidence_score: float = 0.0
     strategy_used: ValidationStrategy
     trace: Optional[DecisionTrace] = None
+
+class HistorySnapshot(BaseModel):
+    """Detached copy of a ValidationHistory row, safe to cache across sessions."""
+    phone_number: str
+    phone_key: Optional[str] = None
+    country_code: Optional[str] = None
+    is_valid: Optional[bool] = None
+    carrier: Optional[str] = None
+    line_type: Optional[str] = None
+    whatsapp_available: Optional[bool] = None
+    confidence_score: Optional[float] = None
+    last_validated: Optional[datetime] = None
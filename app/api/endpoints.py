@@ -1,43 +1,304 @@
-from fastapi import APIRouter, Depends, BackgroundTasks, UploadFile, File
-from fastapi.responses import Response
-from sqlalchemy.orm import Session
-from app.api.models import ValidateRequest, ValidateResponse, ConfidenceBreakdown
-from app.core.database import get_db
+from fastapi import APIRouter, Depends, UploadFile, File, Request, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
+from starlette.datastructures import FormData, UploadFile as StarletteUploadFile
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api.models import ValidateRequest, ValidateResponse, ConfidenceBreakdown, BatchJobResponse, DeferredValidationResponse
+from app.core.database import get_async_db, AsyncSessionLocal
 from app.agents.decision import decision_agent
 from app.agents.retry import retry_agent
 from app.agents.confidence import confidence_agent
 from app.agents.learning import learning_agent
 from app.agents.types import ValidationStrategy
-from app.db.models import ValidationHistory
-from app.core.csv_processor import process_csv_batch
-from typing import Dict, Any
+from app.db.models import BatchJob, BatchJobRow, DeferredValidation
+from app.core.csv_processor import process_batch, stream_csv_batch, RESULT_COLUMNS
+from app.core.formats import detect_format, check_format, media_type, extension, UnsupportedFormatError, BadInputError
+from app.core.jobs import job_manager
+from app.core.bulk import stream_bulk, BulkItem
+from app.core.deferred import deferred_queue
+from app.core.history import get_history, history_writer
+from app.core.cache import validation_cache
+from app.core.freshness import freshness_policy, refresh_scheduler
+from app.core.format_store import format_store
+from app.core.shared_state import shared_state
+from app.core.config import settings
+from app.core.metrics import render_prometheus
+from pydantic import ValidationError
+from typing import Dict, Any, AsyncIterator, Optional, List
+import codecs
+import csv
+import io
+import json
 
 router = APIRouter()
 
 @router.post("/validate/batch")
-async def batch_validate(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def batch_validate(
+    file: UploadFile = File(...),
+    keep_original: bool = Query(False, description="Keep the uploaded columns in front of the results"),
+    output_format: Optional[str] = Query(None, description="csv, parquet, arrow, ndjson or xlsx; defaults to the input format")
+):
     """
-    Upload CSV -> Process -> Return CSV
+    Upload CSV / Parquet / Arrow / NDJSON / XLSX (by extension or content type) -> Process -> Return the same format
     """
     content = await file.read()
-    processed_csv = await process_csv_batch(content, db)
+    try:
+        input_format = detect_format(file.filename, file.content_type)
+        output_format = check_format(output_format) if output_format else input_format
+        processed, stats = await process_batch(content, input_format, output_format, keep_original=keep_original)
+    except UnsupportedFormatError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except BadInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return Response(
-        content=processed_csv,
+        content=processed,
+        media_type=media_type(output_format),
+        headers={
+            "Content-Disposition": f"attachment; filename=validated_results{extension(output_format)}",
+            "X-Rows-Processed": str(stats.processed_rows),
+            "X-Rows-Failed": str(stats.failed_rows),
+            "X-Rows-Duplicate": str(stats.duplicate_rows),
+            "X-Rows-From-History": str(stats.history_rows),
+            "X-History-Queries": str(stats.history_queries),
+            "X-Calls-Coalesced": str(stats.coalesced_calls),
+            "X-Rows-Per-Second": f"{stats.rows_per_second:.2f}"
+        }
+    )
+
+
+async def _read_upload_chunks(upload: StarletteUploadFile, form: FormData) -> AsyncIterator[bytes]:
+    try:
+        while True:
+            chunk = await upload.read(settings.BATCH_STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await form.close()
+
+class _UploadStreamingResponse(StreamingResponse):
+    """
+    Streams while the request body is still being read. StreamingResponse also
+    listens on `receive` for a disconnect, which would swallow body messages;
+    here the body reader is the only receiver and sees the disconnect itself.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@router.post("/validate/batch/stream")
+async def batch_validate_stream(
+    request: Request,
+    keep_original: bool = Query(False, description="Keep the uploaded columns in front of the results")
+):
+    """
+    Upload CSV -> Stream result CSV rows as they are validated.
+    A raw `text/csv` body is validated as it arrives; a multipart upload (field 'file')
+    is only read once the whole form has been received.
+    """
+    headers = {"Content-Disposition": "attachment; filename=validated_results.csv"}
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        return _UploadStreamingResponse(
+            stream_csv_batch(request.stream(), keep_original=keep_original),
+            media_type="text/csv",
+            headers=headers
+        )
+
+    # The form is parsed here rather than via File(...) so the upload stays
+    # open until the streaming response has finished reading it.
+    form = await request.form()
+    upload = form.get("file")
+    if not isinstance(upload, StarletteUploadFile):
+        await form.close()
+        raise HTTPException(status_code=400, detail="Expected a CSV upload in the 'file' field")
+    
+    return StreamingResponse(
+        stream_csv_batch(_read_upload_chunks(upload, form), keep_original=keep_original),
         media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=validated_results.csv"}
+        headers=headers
     )
 
+@router.post("/validate/batch/jobs", response_model=BatchJobResponse, status_code=202)
+async def submit_batch_job(file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db)):
+    """
+    Upload CSV (or Parquet / Arrow / NDJSON / XLSX) -> Job ID. Rows are validated in the background, see GET /validate/batch/jobs/{job_id}
+    """
+    content = await file.read()
+    try:
+        job = await job_manager.submit(db, content, file.filename, detect_format(file.filename, file.content_type))
+    except UnsupportedFormatError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except BadInputError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return job_manager.progress(job)
+
+@router.get("/validate/batch/jobs/{job_id}", response_model=BatchJobResponse)
+async def get_batch_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(BatchJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_manager.progress(job)
+
+async def _iter_job_results(job_id: str) -> AsyncIterator[bytes]:
+    # Own session: the response body is produced after the request handler returned
+    async with AsyncSessionLocal() as db:
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=RESULT_COLUMNS, lineterminator="\n")
+        writer.writeheader()
+        rows = await db.stream_scalars(
+            select(BatchJobRow.result)
+            .where(BatchJobRow.job_id == job_id, BatchJobRow.done == True)  # noqa: E712
+            .order_by(BatchJobRow.row_index)
+            .execution_options(yield_per=1000)
+        )
+        i = 0
+        async for result in rows:
+            writer.writerow(result)
+            i += 1
+            if i % 1000 == 0:
+                yield output.getvalue().encode("utf-8")
+                output.seek(0)
+                output.truncate()
+        yield output.getvalue().encode("utf-8")
+
+@router.get("/validate/batch/jobs/{job_id}/results")
+async def get_batch_job_results(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Download the rows finished so far (partial while the job is running)
+    """
+    job = await db.get(BatchJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return StreamingResponse(
+        _iter_job_results(job_id),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f"attachment; filename=validated_results_{job_id}.csv",
+            "X-Job-Status": job.status,
+            "X-Rows-Processed": str(job.processed_rows),
+            "X-Rows-Total": str(job.total_rows)
+        }
+    )
+
+def _bulk_item(index: int, item: Any) -> BulkItem:
+    """A decoded JSON value -> (index, (phone, country)), or (index, error) if it is not a ValidateRequest."""
+    if isinstance(item, Exception):
+        return index, str(item)
+    try:
+        request = ValidateRequest.model_validate(item)
+    except ValidationError as e:
+        return index, "; ".join(f"{'.'.join(map(str, err['loc'])) or 'item'}: {err['msg']}" for err in e.errors())
+    return index, (request.phone_number, request.country_code)
+
+def _decode_line(line: bytes) -> Any:
+    try:
+        return json.loads(line.decode("utf-8"))
+    except UnicodeDecodeError as e:
+        return ValueError(f"Invalid UTF-8: {e}")
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+async def _iter_ndjson_items(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[List[BulkItem]]:
+    """
+    NDJSON body -> the items of each chunk as it arrives. A malformed line is
+    reported on its own line; past BULK_MAX_ITEMS the rest of the body is not read.
+    """
+    async def line_groups() -> AsyncIterator[List[bytes]]:
+        buffer = head
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            yield lines
+        yield [buffer]
+
+    index = 0
+    async for lines in line_groups():
+        batch: List[BulkItem] = []
+        for line in lines:
+            if not line.strip():
+                continue
+            if index >= settings.BULK_MAX_ITEMS:
+                batch.append((index, f"At most {settings.BULK_MAX_ITEMS} items per request; the rest was not read"))
+                yield batch
+                return
+            batch.append(_bulk_item(index, _decode_line(line)))
+            index += 1
+        if batch:
+            yield batch
+
+async def _read_bulk_array(head: bytes, chunks: AsyncIterator[bytes]) -> List[BulkItem]:
+    """JSON array body (at most BULK_MAX_BODY_BYTES) -> its items; a malformed array fails the request."""
+    body = bytearray(head)
+    async for chunk in chunks:
+        body += chunk
+        if len(body) > settings.BULK_MAX_BODY_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"JSON array bodies are limited to {settings.BULK_MAX_BODY_BYTES} bytes; send NDJSON for more"
+            )
+    try:
+        items = json.loads(bytes(body).decode("utf-8"))
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Body is not valid UTF-8: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON array: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Invalid JSON array")
+    if len(items) > settings.BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_ITEMS} items per request")
+    return [_bulk_item(index, item) for index, item in enumerate(items)]
+
+async def _one_batch(batch: List[BulkItem]) -> AsyncIterator[List[BulkItem]]:
+    yield batch
+
+@router.post("/validate/bulk")
+async def bulk_validate(
+    request: Request,
+    compact: bool = Query(False, description="Leave out reasoning, confidence breakdown and provider metadata")
+):
+    """
+    JSON array or NDJSON of ValidateRequest objects -> NDJSON results, one line per
+    item as its window finishes (completion order, each line carries its input `index`).
+    NDJSON is validated while the body is still arriving; a JSON array is read in full
+    first (up to BULK_MAX_BODY_BYTES).
+    """
+    chunks = request.stream()
+    # The first non-blank byte tells a JSON array from NDJSON
+    head = b""
+    async for chunk in chunks:
+        head += chunk
+        if len(head) >= len(codecs.BOM_UTF8) and head.removeprefix(codecs.BOM_UTF8).strip():
+            break
+    head = head.removeprefix(codecs.BOM_UTF8).lstrip()
+
+    if head.startswith(b"["):
+        items = await _read_bulk_array(head, chunks)
+        invalid = sum(1 for _, item in items if isinstance(item, str))
+        return StreamingResponse(
+            stream_bulk(_one_batch(items), compact=compact),
+            media_type="application/x-ndjson",
+            headers={"X-Items-Total": str(len(items)), "X-Items-Invalid": str(invalid)}
+        )
+    return _UploadStreamingResponse(
+        stream_bulk(_iter_ndjson_items(head, chunks), compact=compact),
+        media_type="application/x-ndjson"
+    )
 
 @router.post("/validate", response_model=ValidateResponse)
 async def validate_phone_number(
     request: ValidateRequest, 
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # 1. Check History
-    history = db.query(ValidationHistory).filter(ValidationHistory.phone_number == request.phone_number).first()
-    
+    # 1. Check History (rows past their hard expiry count as unknown)
+    history = freshness_policy.usable(
+        await get_history(db, request.phone_number, request.country_code), request.country_code
+    )
+    # Hand the pooled connection back while providers are called: the format store's
+    # batched reads need one too, and a pool held by waiting requests would starve them.
+    # The session reconnects if the request goes on to queue a deferred validation.
+    await db.close()
+
     # 2. Pre-check / NumVerify (Agent 2 Helper) called early for Decision signals
     numverify_result = await retry_agent.validate_format(request.phone_number, request.country_code)
     
@@ -51,22 +312,20 @@ async def validate_phone_number(
     
     whatsapp_result = {"available": False, "provider": "skipped"}
     retry_meta = {}
+    deferred_id = None
     
     # 4. Execution Logic
     if trace.final_decision == ValidationStrategy.IMMEDIATE:
         # Run Validation
-        whatsapp_result = await retry_agent.check_whatsapp_availability(request.phone_number)
+        whatsapp_result = await retry_agent.check_whatsapp_availability(request.phone_number, request.country_code)
         retry_meta = whatsapp_result
-        
-        # Update Background Stats (Learning - Provider Health)
-        if whatsapp_result["provider"] != "mock": # Don't skew stats with mock
-             background_tasks.add_task(
-                 learning_agent.update_provider_metrics,
-                 db, 
-                 whatsapp_result["provider"],
-                 whatsapp_result["available"],
-                 1.0 # Placeholder response time, can improve later
-             )
+        # ProviderHealth is fed by RetryAgent for every real provider call, batch rows included
+
+    elif trace.final_decision == ValidationStrategy.DEFERRED:
+        # Queued for the background workers; poll GET /validate/deferred/{deferred_id}
+        deferred = await deferred_queue.enqueue(db, request.phone_number, request.country_code)
+        deferred_id = deferred.id
+        whatsapp_result = {"available": False, "provider": "deferred"}
 
     elif trace.final_decision == ValidationStrategy.SKIP and history:
         # Use Cached Data
@@ -74,6 +333,9 @@ async def validate_phone_number(
             "available": history.whatsapp_available, 
             "provider": "cache"
         }
+        if trace.refresh:
+            # Stale-while-revalidate: answer now, re-check in the background
+            refresh_scheduler.request(request.phone_number, request.country_code)
     
     # 5. Confidence Scoring
     confidence = confidence_agent.calculate_score(
@@ -84,11 +346,20 @@ async def validate_phone_number(
     )
     
     # 6. Learning (Record Decision)
-    background_tasks.add_task(learning_agent.record_decision, db, request.phone_number, trace.final_decision, trace)
+    learning_agent.record_decision(request.phone_number, trace.final_decision, trace)
     
-    # 7. Update History (if new or changed)
-    # (Simplified: Just update timestamp or create new)
-    # In real app, upsert logic.
+    # 7. Update History (batched upsert, skipped when the answer came from history;
+    #    deferred validations are written by the queue workers)
+    if trace.final_decision != ValidationStrategy.DEFERRED and (
+        trace.final_decision != ValidationStrategy.SKIP or not history
+    ):
+        history_writer.record(
+            request.phone_number,
+            request.country_code,
+            numverify_result,
+            whatsapp_result,
+            confidence["score"]
+        )
     
     return ValidateResponse(
         success=True,
@@ -108,10 +379,89 @@ async def validate_phone_number(
         ),
         decision_trace=trace,
         retry_metadata=retry_meta,
-        reasoning=trace.reasoning
+        reasoning=trace.reasoning,
+        deferred_id=deferred_id
+    )
+
+@router.get("/validate/deferred/{deferred_id}", response_model=DeferredValidationResponse)
+async def get_deferred_validation(deferred_id: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Status of a deferred validation; `result` is filled once a worker has validated it
+    """
+    entry = await db.get(DeferredValidation, deferred_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Deferred validation not found")
+    return DeferredValidationResponse(
+        deferred_id=entry.id,
+        status=entry.status,
+        phone_number=entry.phone_number,
+        country_code=entry.country_code,
+        attempts=entry.attempts,
+        result=entry.result,
+        error=entry.error,
+        created_at=entry.created_at,
+        finished_at=entry.finished_at
     )
 
 @router.get("/analytics/insights")
-def get_insights(db: Session = Depends(get_db)):
+async def get_insights(db: AsyncSession = Depends(get_async_db)):
     # Simple placeholder for analytics
     return {"status": "Analytics module ready"}
+
+@router.get("/analytics/deferred")
+async def get_deferred_stats(db: AsyncSession = Depends(get_async_db)):
+    """
+    Deferred queue depth by status and worker throughput settings.
+    """
+    return await deferred_queue.stats(db)
+
+@router.get("/analytics/pool")
+def get_pool_stats():
+    """
+    Outbound HTTP requests in flight and waiting per provider, connection reuse, Whapi micro-batching and call coalescing.
+    """
+    return {
+        **retry_agent.pool_stats(),
+        "whapi_batching": retry_agent.batching_stats(),
+        "coalescing": retry_agent.coalescing_stats()
+    }
+
+@router.get("/analytics/providers")
+def get_provider_stats():
+    """
+    Per-provider latency percentiles (p50/p95/p99), error rates, retries, rate limits, quotas and circuit state, plus the WhatsApp routing order and hedging counters.
+    """
+    return retry_agent.provider_stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus text exposition: providers, circuits, caches, HTTP pool and batch throughput.
+    """
+    return PlainTextResponse(
+        render_prometheus(
+            validation_cache.stats(),
+            retry_agent.pool_stats(),
+            retry_agent.batching_stats(),
+            retry_agent.coalescing_stats(),
+            retry_agent.circuit_stats(),
+            retry_agent.hedger.stats(),
+            retry_agent.rate_limit_stats()
+        ),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@router.get("/analytics/cache")
+def get_cache_stats():
+    """
+    Hit/miss/eviction counters for each in-process cache tier (and the shared level behind them),
+    the persistent NumVerify store, history freshness and cross-worker state sync.
+    """
+    return {
+        **validation_cache.stats(),
+        "shared_state": shared_state.stats(),
+        "history_writer": history_writer.stats(),
+        "history_freshness": freshness_policy.stats(),
+        "format_store": format_store.stats(),
+        "learning_writer": learning_agent.stats()
+    }
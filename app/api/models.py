@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
+from datetime import datetime
 from app.agents.types import ValidationStrategy, DecisionTrace
 
 class ValidateRequest(BaseModel):
@@ -31,3 +32,29 @@ class ValidateResponse(BaseModel):
     retry_metadata: Optional[Dict[str, Any]] = None
     
     reasoning: str
+    deferred_id: Optional[str] = None  # Set when validation_strategy is deferred, see GET /validate/deferred/{id}
+
+class DeferredValidationResponse(BaseModel):
+    deferred_id: str
+    status: str  # queued, running, done, failed
+    phone_number: str
+    country_code: Optional[str] = None
+    attempts: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class BatchJobResponse(BaseModel):
+    job_id: str
+    status: str
+    filename: Optional[str] = None
+    total_rows: int
+    processed_rows: int
+    failed_rows: int
+    rows_per_second: float
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from typing import List, Dict, Any, Tuple, Optional, Callable, Awaitable
+from pydantic import BaseModel
+from app.agents.decision import decision_agent
+from app.agents.retry import retry_agent
+from app.agents.confidence import confidence_agent
+from app.agents.types import ValidationStrategy, HistorySnapshot
+from app.core.history import get_history_many, history_writer
+from app.core.cache import validation_cache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.freshness import freshness_policy, refresh_scheduler, FRESH, STALE
+from app.core.logger import logger
+from app.core.metrics import batch_metrics
+from app.core.phone import normalize_key, parse_number
+from app.core.ratelimit import Priority, request_priority
+from app.core.singleflight import CoalescedTally, coalesced_tally
+
+class BatchStats(BaseModel):
+    total_rows: int = 0
+    processed_rows: int = 0
+    failed_rows: int = 0
+    unique_numbers: int = 0
+    duplicate_rows: int = 0  # Rows repeating a number seen earlier in the batch
+    history_rows: int = 0  # Rows answered from validation history (no provider call)
+    history_queries: int = 0  # SELECTs run to prefetch the batch's history
+    stale_rows: int = 0  # History rows answered while stale, refresh queued
+    coalesced_calls: int = 0  # Provider lookups that joined an identical in-flight call
+    elapsed_seconds: float = 0.0
+    rows_per_second: float = 0.0
+
+class BatchEngine:
+    """
+    Runs the validation pipeline over many rows in stages: history is
+    prefetched for the whole batch in chunked queries, rows it answers skip
+    the provider stages, the provider stages (format, WhatsApp) run
+    concurrently per row for the rest and the local stages (decision,
+    scoring) run once over all rows as columns.
+    Rows in flight are bounded here; per-provider HTTP concurrency is bounded
+    inside RetryAgent. Results are returned in input order. Provider calls made
+    for batch rows wait in the BATCH lane, behind interactive requests.
+    """
+
+    def __init__(self, row_concurrency: int = settings.BATCH_CONCURRENCY):
+        self.row_concurrency = max(1, row_concurrency)
+
+    async def _for_each(
+        self,
+        indices: List[int],
+        fn: Callable[[int], Awaitable[None]],
+        errors: List[Optional[str]],
+        rows: List[Tuple[str, str]]
+    ):
+        """
+        Runs fn(index) with at most row_concurrency in flight; a failure is recorded
+        in errors[index] and the row drops out of the later stages.
+        """
+        pending = iter(indices)
+
+        async def worker():
+            # Workers share one iterator, so at most row_concurrency rows are in flight
+            for index in pending:
+                try:
+                    await fn(index)
+                except Exception as e:
+                    logger.error(f"Batch row {index} ({rows[index][0]}) failed: {e}")
+                    errors[index] = str(e)
+
+        workers = min(self.row_concurrency, len(indices))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+    async def run(
+        self,
+        rows: List[Tuple[str, str]],
+        prefetched: Optional[Dict[str, Optional[HistorySnapshot]]] = None,
+        allow_stale: bool = True
+    ) -> Tuple[List[Dict[str, Any]], BatchStats]:
+        """
+        Validates (phone, country) rows with bounded concurrency.
+        `prefetched` ({normalize_key: snapshot}, from get_history_many) skips the
+        history prefetch when the caller already loaded it for a larger request.
+        allow_stale=False revalidates stale history instead of serving it (refresh workers).
+        """
+        stats = BatchStats(total_rows=len(rows))
+        keys = [normalize_key(phone, country) for phone, country in rows]
+        stats.unique_numbers = len(set(keys))
+        stats.duplicate_rows = len(rows) - stats.unique_numbers
+        n = len(rows)
+        formats: List[Optional[Dict[str, Any]]] = [None] * n
+        whatsapp: List[Dict[str, Any]] = [{"available": False} for _ in range(n)]
+        errors: List[Optional[str]] = [None] * n
+        tally = CoalescedTally()
+        start = time.perf_counter()
+
+        async def check_format(index: int):
+            phone, country = rows[index]
+            formats[index] = await retry_agent.validate_format(phone, country)
+
+        async def check_whatsapp(index: int):
+            phone, country = rows[index]
+            whatsapp[index] = await retry_agent.check_whatsapp_availability(phone, country)
+
+        lane = request_priority.set(Priority.BATCH)
+        counting = coalesced_tally.set(tally)
+        try:
+            # 1. History for the whole batch (cache, then chunked IN queries)
+            known = prefetched
+            if known is None:
+                async with AsyncSessionLocal() as db:
+                    known, stats.history_queries = await get_history_many(db, rows)
+            # Rows past their hard expiry count as unknown
+            histories: List[Optional[HistorySnapshot]] = [
+                freshness_policy.usable(known.get(key), country) for key, (_, country) in zip(keys, rows)
+            ]
+            # Rows history will answer (SKIP): no format lookup, display fields from an offline parse
+            servable = (FRESH, STALE) if allow_stale else (FRESH,)
+            answered = {
+                i for i in range(n)
+                if histories[i] is not None and freshness_policy.state(histories[i], rows[i][1]) in servable
+            }
+            for i in answered:
+                formats[i] = {
+                    **parse_number(*rows[i]),
+                    **{field: getattr(histories[i], field) for field in ("carrier", "line_type") if getattr(histories[i], field)}
+                }
+
+            # 2. Format checks for the other rows (I/O, concurrent), other workers' cached answers loaded in one round trip
+            unanswered = [i for i in range(n) if i not in answered]
+            await validation_cache.format.load({(keys[i], settings.CARRIER_LOOKUP_ENABLED) for i in unanswered})
+            await self._for_each(unanswered, check_format, errors, rows)
+
+            # 3. Decision for every surviving row at once
+            live = [i for i in range(n) if errors[i] is None]
+            decisions = decision_agent.decide_batch(
+                [rows[i][1] for i in live],
+                [histories[i] for i in live],
+                [formats[i] for i in live],
+                allow_deferred=False,
+                allow_stale=allow_stale
+            )
+            strategies = dict(zip(live, decisions["strategy"].tolist()))
+            reasonings = dict(zip(live, decisions["reasoning"].tolist()))
+            for i in (i for i, refresh in zip(live, decisions["refresh"].tolist()) if refresh):
+                refresh_scheduler.request(*rows[i])
+                stats.stale_rows += 1
+
+            # 4. Action: WhatsApp checks for IMMEDIATE rows (I/O, concurrent), history answers for SKIP
+            for i in live:
+                if strategies[i] == ValidationStrategy.SKIP and histories[i]:
+                    whatsapp[i] = {"available": histories[i].whatsapp_available}
+            immediate = [i for i in live if strategies[i] == ValidationStrategy.IMMEDIATE]
+            await validation_cache.whatsapp.load({keys[i] for i in immediate})
+            await self._for_each(immediate, check_whatsapp, errors, rows)
+        finally:
+            coalesced_tally.reset(counting)
+            request_priority.reset(lane)
+
+        # 5. Score every surviving row at once
+        live = [i for i in range(n) if errors[i] is None]
+        confidences = dict(zip(live, confidence_agent.score_records(confidence_agent.calculate_scores(
+            [formats[i].get("valid", False) for i in live],
+            [whatsapp[i].get("available", False) for i in live],
+            [whatsapp[i].get("provider", "none") for i in live],
+            [bool(histories[i]) for i in live]
+        ))))
+
+        # 6. Persist (write-behind) and assemble results in input order
+        results: List[Dict[str, Any]] = []
+        for i, (phone, country) in enumerate(rows):
+            if errors[i] is not None:
+                stats.failed_rows += 1
+                results.append({"phone": phone, "country": country, "error": errors[i]})
+                continue
+            if strategies[i] != ValidationStrategy.SKIP or not histories[i]:
+                history_writer.record(phone, country, formats[i], whatsapp[i], confidences[i]["score"])
+            else:
+                stats.history_rows += 1
+            stats.processed_rows += 1
+            results.append({
+                "phone": phone,
+                "country": country,
+                "numverify": formats[i],
+                "whatsapp": whatsapp[i],
+                "strategy": strategies[i],
+                "reasoning": reasonings[i],
+                "confidence": confidences[i],
+                "error": None
+            })
+
+        stats.elapsed_seconds = time.perf_counter() - start
+        stats.coalesced_calls = tally.count
+        if stats.elapsed_seconds > 0:
+            stats.rows_per_second = len(rows) / stats.elapsed_seconds
+        batch_metrics.record(
+            stats.total_rows, stats.failed_rows, stats.duplicate_rows,
+            stats.elapsed_seconds, stats.rows_per_second
+        )
+        logger.info(
+            f"Batch finished: {stats.processed_rows}/{stats.total_rows} rows "
+            f"({stats.failed_rows} failed, {stats.duplicate_rows} duplicates, "
+            f"{stats.history_rows} from history in {stats.history_queries} queries, "
+            f"{stats.coalesced_calls} coalesced calls) in {stats.elapsed_seconds:.2f}s, "
+            f"{stats.rows_per_second:.1f} rows/sec"
+        )
+        return results, stats
+
+batch_engine = BatchEngine()
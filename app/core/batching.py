@@ -0,0 +1,87 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+from app.core.ratelimit import Priority, request_priority
+
+class MicroBatcher:
+    """
+    Gathers single-key lookups from concurrent callers and resolves them with
+    one bulk call per batch. A batch is sent when it reaches max_size keys or
+    max_wait seconds after its first key arrived, whichever comes first.
+    Each caller gets the result (or exception) for its own key. A batch is
+    sent in the most urgent priority lane among its callers.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        max_size: int,
+        max_wait: float
+    ):
+        self.handler = handler
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait)
+        self._pending: Dict[Hashable, List[asyncio.Future]] = {}
+        self._priority = Priority.BATCH
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+        self.batches_sent = 0
+        self.keys_sent = 0
+        self.calls = 0
+
+    async def submit(self, key: Hashable) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.calls += 1
+        self._priority = min(self._priority, request_priority.get())
+        # The same key twice in one batch is only sent once
+        self._pending.setdefault(key, []).append(future)
+
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        priority, self._priority = self._priority, Priority.BATCH
+        task = asyncio.get_running_loop().create_task(self._send(batch, priority))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch: Dict[Hashable, List[asyncio.Future]], priority: Priority):
+        # Runs in its own task, so this only affects the bulk call below
+        request_priority.set(priority)
+        self.batches_sent += 1
+        self.keys_sent += len(batch)
+        try:
+            results = await self.handler(list(batch))
+        except Exception as e:
+            for futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for key, futures in batch.items():
+            for future in futures:
+                if future.done():
+                    continue
+                if key in results:
+                    future.set_result(results[key])
+                else:
+                    future.set_exception(KeyError(f"No result for {key} in bulk response"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "batches_sent": self.batches_sent,
+            "keys_sent": self.keys_sent,
+            "avg_batch_size": round(self.keys_sent / self.batches_sent, 2) if self.batches_sent else 0.0,
+            "pending": len(self._pending)
+        }
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+from app.agents.types import HistorySnapshot, ValidationStrategy
+from app.core.batch_engine import batch_engine
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.history import get_history_many
+from app.core.logger import logger
+
+def bulk_result(index: int, result: Dict[str, Any], compact: bool = False) -> Dict[str, Any]:
+    """
+    One batch engine result as a /validate/bulk line. Compact lines leave out
+    the reasoning, confidence breakdown and provider metadata.
+    """
+    phone = result["phone"]
+    if result.get("error") is not None:
+        return {
+            "index": index,
+            "success": False,
+            "phone_number": phone,
+            "country_code": result["country"],
+            "error": str(result["error"])
+        }
+
+    numverify = result["numverify"]
+    whatsapp = result["whatsapp"]
+    confidence = result["confidence"]
+    line = {
+        "index": index,
+        "success": True,
+        "phone_number": phone,
+        "formatted_number": numverify.get("international_format", phone),
+        "country_code": result["country"],
+        "carrier": numverify.get("carrier"),
+        "line_type": numverify.get("line_type"),
+        "whatsapp_available": whatsapp.get("available", False),
+        "validation_strategy": ValidationStrategy(result["strategy"]).value,
+        "confidence_score": confidence["score"]
+    }
+    if not compact:
+        line["confidence_breakdown"] = {
+            "score": confidence["score"],
+            "classification": confidence["classification"],
+            "signals": confidence["breakdown"],
+            "recommendation": confidence["classification"]
+        }
+        line["retry_metadata"] = whatsapp
+        line["reasoning"] = result["reasoning"]
+    return line
+
+def _render_lines(lines: List[Dict[str, Any]]) -> bytes:
+    return "".join(json.dumps(line, default=str) + "\n" for line in lines).encode("utf-8")
+
+# A parsed /validate/bulk item: (index, (phone, country)), or (index, error) when it was rejected
+BulkItem = Tuple[int, Union[Tuple[str, str], str]]
+
+async def stream_bulk(batches: AsyncIterator[List[BulkItem]], compact: bool = False) -> AsyncIterator[bytes]:
+    """
+    Validates items while they are still being read. Each batch from `batches`
+    (a whole JSON array, or the NDJSON lines of one chunk of the body) has its
+    history loaded in one query and is validated in windows of
+    BATCH_STREAM_WINDOW, up to BULK_WINDOWS_IN_FLIGHT at once. NDJSON lines for
+    each window are yielded as soon as it finishes, so lines arrive in
+    completion order and carry their input `index`. Rejected items go out as
+    soon as they are read. Reading pauses while BULK_WINDOWS_IN_FLIGHT windows
+    are pending, so a fast client cannot queue up the whole body.
+    """
+    start = time.perf_counter()
+    total = failed = queries = 0
+    window = max(1, settings.BATCH_STREAM_WINDOW)
+    limit = max(1, settings.BULK_WINDOWS_IN_FLIGHT)
+    in_flight = asyncio.Semaphore(limit)
+
+    async def run_window(items: List[BulkItem], prefetched: Dict[str, Optional[HistorySnapshot]]):
+        async with in_flight:
+            results, stats = await batch_engine.run([row for _, row in items], prefetched)
+        return items, results, stats
+
+    batches = batches.__aiter__()
+    reading: Optional[asyncio.Future] = None
+    exhausted = False
+    pending: Set[asyncio.Task] = set()
+    try:
+        while not exhausted or pending:
+            if reading is None and not exhausted and len(pending) < limit:
+                reading = asyncio.ensure_future(batches.__anext__())
+            done, _ = await asyncio.wait(pending | ({reading} if reading else set()), return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                if task is not reading:
+                    pending.discard(task)
+                    items, results, stats = task.result()
+                    failed += stats.failed_rows
+                    yield _render_lines([
+                        bulk_result(index, result, compact) for (index, _), result in zip(items, results)
+                    ])
+                    continue
+
+                reading = None
+                try:
+                    batch = task.result()
+                except StopAsyncIteration:
+                    exhausted = True
+                    continue
+                total += len(batch)
+                invalid = [(index, item) for index, item in batch if isinstance(item, str)]
+                rows = [(index, item) for index, item in batch if not isinstance(item, str)]
+                if invalid:
+                    failed += len(invalid)
+                    yield _render_lines([
+                        {"index": index, "success": False, "error": error} for index, error in invalid
+                    ])
+                if not rows:
+                    continue
+                async with AsyncSessionLocal() as db:
+                    prefetched, batch_queries = await get_history_many(db, [row for _, row in rows])
+                queries += batch_queries
+                for offset in range(0, len(rows), window):
+                    pending.add(asyncio.create_task(run_window(rows[offset:offset + window], prefetched)))
+    finally:
+        # Client went away: stop reading and validating
+        for task in pending | ({reading} if reading else set()):
+            task.cancel()
+        await asyncio.gather(*pending, *([reading] if reading else []), return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"Bulk validation: {total} items ({failed} failed, history in {queries} queries) "
+            f"in {elapsed:.2f}s, {rate:.1f} items/sec"
+        )
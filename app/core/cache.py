@@ -0,0 +1,156 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional
+from app.agents.types import HistorySnapshot
+from app.core.config import settings
+from app.core.shared_cache import SharedBackend, SharedCache
+
+MISSING = object()
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry expiry and LRU eviction.
+    Not thread-safe; meant for use from the event loop. With a `shared`
+    level attached, sets and invalidations are also sent there and load()
+    pulls in entries other worker processes have cached; `decode` rebuilds
+    values the shared level stores as JSON.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache", decode: Optional[Callable[[Any], Any]] = None):
+        self.name = name
+        self.decode = decode
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.shared: Optional[SharedCache] = None
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _store(self, key: Hashable, value: Any, ttl: float):
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._store(key, value, ttl)
+        if self.shared is not None:
+            self.shared.put(self.name, key, value, ttl)
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(self.name, key)
+
+    async def load(self, keys: Iterable[Hashable]):
+        """
+        Copies the entries for `keys` that are missing here from the shared level,
+        in one round trip. A no-op without a shared level.
+        """
+        if self.shared is None:
+            return
+        now = time.monotonic()
+        missing = []
+        for key in keys:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                missing.append(key)
+        if not missing:
+            return
+        for key, (value, remaining) in (await self.shared.fetch(self.name, missing, self.decode)).items():
+            self._store(key, value, remaining)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+def _decode_history(value: Any) -> Optional[HistorySnapshot]:
+    # Misses are cached too (None)
+    return HistorySnapshot.model_validate(value) if value is not None else None
+
+class ValidationCache:
+    """
+    Cache tiers keyed on the normalized number:
+    history rows, format (NumVerify / offline) results and WhatsApp availability.
+    After connect() each tier is backed by the shared cache, so worker
+    processes reuse each other's answers.
+    """
+
+    def __init__(self):
+        self.history = TTLCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_HISTORY_TTL, "history", _decode_history)
+        self.format = TTLCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_FORMAT_TTL, "format")
+        self.whatsapp = TTLCache(settings.CACHE_MAX_ENTRIES, settings.CACHE_WHATSAPP_TTL, "whatsapp")
+        self.shared: Optional[SharedCache] = None
+
+    async def connect(self, backend: Optional[SharedBackend]):
+        """
+        Puts the shared level behind every tier; None keeps the cache in-process.
+        """
+        if backend is None:
+            return
+        self.shared = SharedCache(backend)
+        for tier in (self.history, self.format, self.whatsapp):
+            tier.shared = self.shared
+        await self.shared.start()
+
+    async def disconnect(self):
+        """Flushes pending shared writes; the backend itself is closed by its owner."""
+        if self.shared is None:
+            return
+        await self.shared.stop()
+        for tier in (self.history, self.format, self.whatsapp):
+            tier.shared = None
+        self.shared = None
+
+    def invalidate(self, key: str):
+        """
+        Drops the history and WhatsApp tiers for a number, e.g. after its history row was written.
+        """
+        self.history.invalidate(key)
+        self.whatsapp.invalidate(key)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "history": self.history.stats(),
+            "format": self.format.stats(),
+            "whatsapp": self.whatsapp.stats()
+        }
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
+
+validation_cache = ValidationCache()
@@ -0,0 +1,149 @@
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, Dict, Optional
+from app.core.config import settings
+from app.core.logger import logger
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+    CLOSED: calls flow; opens after `failure_threshold` consecutive failures or when the
+            error rate over the last `window_size` calls reaches `error_rate_threshold`.
+    OPEN: calls are rejected immediately until `recovery_timeout` has passed.
+    HALF_OPEN: up to `half_open_max_calls` callers are let through as a trial;
+               a success closes the circuit, a failure opens it again. A trial that
+               ends without an outcome (throttled, out of quota, cancelled) must
+               release() its admission, or the circuit would stay half-open for good.
+    With several worker processes, a circuit opened by one is opened on all
+    (SharedStateSync); each then runs its own half-open trial.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = settings.CIRCUIT_FAILURE_THRESHOLD,
+        error_rate_threshold: float = settings.CIRCUIT_ERROR_RATE_THRESHOLD,
+        window_size: int = settings.CIRCUIT_WINDOW_SIZE,
+        min_calls: int = settings.CIRCUIT_MIN_CALLS,
+        recovery_timeout: float = settings.CIRCUIT_RECOVERY_TIMEOUT,
+        half_open_max_calls: int = settings.CIRCUIT_HALF_OPEN_MAX_CALLS
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_calls = min_calls
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._state = CircuitState.CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=max(1, window_size))
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._opened_wall: Optional[float] = None  # Wall-clock open time, until published
+        self._half_open_admitted = 0
+        self.rejected = 0
+        self.opened_count = 0
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._transition(CircuitState.HALF_OPEN)
+        return self._state
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and self._half_open_admitted < self.half_open_max_calls:
+            self._half_open_admitted += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def release(self):
+        """Gives back a half-open admission whose call ended without recording an outcome."""
+        if self._state == CircuitState.HALF_OPEN and self._half_open_admitted > 0:
+            self._half_open_admitted -= 1
+
+    def record_success(self):
+        self._outcomes.append(True)
+        self._consecutive_failures = 0
+        if self._state == CircuitState.HALF_OPEN:
+            self._transition(CircuitState.CLOSED)
+
+    def record_failure(self):
+        self._outcomes.append(False)
+        self._consecutive_failures += 1
+        if self._state == CircuitState.HALF_OPEN:
+            self._transition(CircuitState.OPEN)
+        elif self._state == CircuitState.CLOSED and self._should_open():
+            self._transition(CircuitState.OPEN)
+
+    def record(self, ok: bool):
+        if ok:
+            self.record_success()
+        else:
+            self.record_failure()
+
+    def _should_open(self) -> bool:
+        if self._consecutive_failures >= self.failure_threshold:
+            return True
+        if len(self._outcomes) >= self.min_calls:
+            failures = sum(1 for ok in self._outcomes if not ok)
+            return failures / len(self._outcomes) >= self.error_rate_threshold
+        return False
+
+    def _transition(self, state: CircuitState):
+        if state == self._state:
+            return
+        logger.warning(f"Circuit '{self.name}': {self._state.value} -> {state.value}")
+        self._state = state
+        self._half_open_admitted = 0
+        if state == CircuitState.OPEN:
+            self._opened_at = time.monotonic()
+            self._opened_wall = time.time()
+            self.opened_count += 1
+        elif state == CircuitState.CLOSED:
+            self._outcomes.clear()
+            self._consecutive_failures = 0
+
+    def take_opened(self) -> Optional[float]:
+        """Wall-clock time this circuit opened, if it did since the last call."""
+        opened, self._opened_wall = self._opened_wall, None
+        return opened
+
+    def adopt_open(self, opened_at: float):
+        """
+        Opens a closed circuit that another worker opened at `opened_at` (wall clock),
+        for the rest of that worker's recovery timeout.
+        """
+        elapsed = max(0.0, time.time() - opened_at)
+        if self._state != CircuitState.CLOSED or elapsed >= self.recovery_timeout:
+            return
+        logger.warning(f"Circuit '{self.name}': opened on another worker")
+        self._transition(CircuitState.OPEN)
+        self._opened_at = time.monotonic() - elapsed
+        self._opened_wall = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        failures = sum(1 for ok in self._outcomes if not ok)
+        return {
+            "state": self.state.value,
+            "consecutive_failures": self._consecutive_failures,
+            "window_error_rate": failures / len(self._outcomes) if self._outcomes else 0.0,
+            "rejected": self.rejected,
+            "opened_count": self.opened_count
+        }
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+breakers: Dict[str, CircuitBreaker] = {
+    "numverify": CircuitBreaker("numverify"),
+    "whapi": CircuitBreaker("whapi"),
+}
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Optional, Dict
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Agentic Phone Validator"
@@ -8,10 +8,119 @@ class Settings(BaseSettings):
     # Validation Providers
     NUMVERIFY_API_KEY: Optional[str] = None
     WHAPI_API_TOKEN: Optional[str] = None
+    CARRIER_LOOKUP_ENABLED: bool = False  # Opt-in: call NumVerify (billed per lookup) when the carrier is unknown offline
+    NUMVERIFY_MAX_CONCURRENCY: int = 10  # Concurrent HTTP calls per provider
+    WHAPI_MAX_CONCURRENCY: int = 10
+    WHAPI_BATCHING_ENABLED: bool = True  # Group concurrent WhatsApp checks into bulk requests
+    WHAPI_BATCH_MAX_SIZE: int = 50  # Contacts per Whapi request
+    WHAPI_BATCH_MAX_WAIT: float = 0.05  # Seconds to wait for a batch to fill
+    NUMVERIFY_RATE_PER_SECOND: float = 5.0  # Token bucket refill (0 = unlimited)
+    NUMVERIFY_BURST: float = 10.0  # Requests that may go out back to back
+    NUMVERIFY_DAILY_QUOTA: int = 0  # Requests per UTC day (0 = unlimited)
+    NUMVERIFY_MONTHLY_QUOTA: int = 0  # Requests per UTC month (0 = unlimited)
+    WHAPI_RATE_PER_SECOND: float = 10.0
+    WHAPI_BURST: float = 20.0
+    WHAPI_DAILY_QUOTA: int = 0
+    WHAPI_MONTHLY_QUOTA: int = 0
+    RATE_LIMIT_MAX_RETRY_AFTER: float = 10.0  # Longer Retry-After answers fail over instead of waiting
+    
+    # Provider Metrics
+    METRICS_WINDOW_SECONDS: float = 300.0  # Sliding window for percentiles / error rates
+    METRICS_WINDOW_MAX_SAMPLES: int = 10_000  # Per provider
+    PROVIDER_LATENCY_EWMA_ALPHA: float = 0.2  # Weight of the latest flush in ProviderHealth.avg_response_time
+
+    # Circuit Breaker / Routing
+    CIRCUIT_FAILURE_THRESHOLD: int = 5  # Consecutive failed attempts that open a circuit
+    CIRCUIT_ERROR_RATE_THRESHOLD: float = 0.5  # Failure ratio over the last CIRCUIT_WINDOW_SIZE attempts
+    CIRCUIT_WINDOW_SIZE: int = 20
+    CIRCUIT_MIN_CALLS: int = 10  # Attempts needed before the error rate is trusted
+    CIRCUIT_RECOVERY_TIMEOUT: float = 30.0  # Seconds open before half-open trial calls
+    CIRCUIT_HALF_OPEN_MAX_CALLS: int = 5  # Callers let through while half-open
+    ROUTING_MIN_SAMPLES: int = 20  # Live samples needed before they outrank ProviderHealth
+    PROVIDER_HEALTH_REFRESH_INTERVAL: float = 60.0  # Seconds between ProviderHealth reloads
+
+    # Hedged Requests (WhatsApp checks)
+    HEDGE_ENABLED: bool = False
+    HEDGE_PERCENTILE: float = 95.0  # Hedge once the primary is slower than this latency percentile
+    HEDGE_MIN_DELAY: float = 0.05  # Seconds, floor for the learned delay
+    HEDGE_DEFAULT_DELAY: float = 1.0  # Seconds, used until HEDGE_MIN_SAMPLES latencies are known
+    HEDGE_MIN_SAMPLES: int = 20
+    HEDGE_BUDGET_RATIO: float = 0.05  # Max extra requests as a share of checks
+    HEDGE_BUDGET_BURST: float = 10.0  # Hedges that may fire back to back
+
+    # Outbound HTTP Pool (shared by RetryAgent)
+    HTTP_POOL_LIMIT: int = 100
+    HTTP_POOL_LIMIT_PER_HOST: int = 20
+    HTTP_DNS_CACHE_TTL: int = 300  # Seconds
+    HTTP_KEEPALIVE_TIMEOUT: float = 30.0  # Seconds
+    
+    # In-process Cache
+    CACHE_MAX_ENTRIES: int = 100_000  # Per tier, LRU eviction beyond this
+    CACHE_HISTORY_TTL: float = 300.0  # Seconds
+    CACHE_FORMAT_TTL: float = 86_400.0
+    CACHE_WHATSAPP_TTL: float = 3_600.0
+    
+    # Persistent NumVerify Cache (format_lookups table)
+    FORMAT_STORE_ENABLED: bool = True
+    FORMAT_STORE_TTL: float = 180 * 86_400.0  # Seconds a stored NumVerify answer is reused
+    FORMAT_STORE_READ_BATCH: int = 500  # Lookups per IN (...) query
+    FORMAT_STORE_READ_WAIT: float = 0.005  # Seconds to gather concurrent lookups into one query
     
     # Database
-    DATABASE_URL: str = "sqlite:///./agent_memory.db"
+    DATABASE_URL: str = "sqlite:///./agent_memory.db"  # postgresql://... uses asyncpg for the async engine
+    DB_POOL_SIZE: int = 10  # Ignored for SQLite
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    HISTORY_FLUSH_SIZE: int = 500  # Pending history rows that trigger an upsert
+    HISTORY_FLUSH_INTERVAL: float = 2.0  # Seconds between upserts
+    WRITE_BEHIND_MAX_PENDING: int = 100_000  # Unwritten records a write-behind buffer keeps while writes fail; the oldest go first
+    HISTORY_PREFETCH_CHUNK_SIZE: int = 30_000  # Numbers per IN (...) query when a batch loads its history (SQLite 3.32+ binds up to 32,766)
+    HISTORY_FRESH_POSITIVE: float = 30 * 86_400.0  # Seconds a valid, on-WhatsApp outcome is served without rechecking
+    HISTORY_FRESH_NEGATIVE: float = 7 * 86_400.0  # Valid number, not on WhatsApp
+    HISTORY_FRESH_INVALID: float = 90 * 86_400.0  # Invalid format
+    HISTORY_FRESH_BY_COUNTRY: Dict[str, Dict[str, float]] = {}  # e.g. {"IN": {"negative": 86400}}
+    HISTORY_STALE_WHILE_REVALIDATE: float = 7 * 86_400.0  # Past freshness, served while a refresh is queued; then expired (0 = off)
+    LEARNING_FLUSH_SIZE: int = 1000  # Buffered decisions/metrics that trigger a write
+    LEARNING_FLUSH_INTERVAL: float = 5.0  # Seconds between LearningAgent writes
     
+    # Batch Processing
+    BATCH_CONCURRENCY: int = 100  # Rows in flight at once
+    BATCH_STREAM_WINDOW: int = 100  # Rows validated per flush in streaming mode
+    BATCH_STREAM_CHUNK_SIZE: int = 64 * 1024  # Bytes read from the upload at a time
+    BATCH_STREAM_MAX_RECORD_CHARS: int = 1024 * 1024  # Longest streamed CSV record (quoted newlines included); longer ends the stream with an error row
+    BATCH_READ_CHUNK_ROWS: int = 50_000  # Rows per chunk / record batch when reading bulk uploads
+    BULK_MAX_ITEMS: int = 100_000  # Requests accepted by one /validate/bulk call
+    BULK_MAX_BODY_BYTES: int = 32 * 1024 * 1024  # JSON array bodies are read in full; NDJSON bodies are streamed
+    BULK_WINDOWS_IN_FLIGHT: int = 4  # /validate/bulk windows (of BATCH_STREAM_WINDOW rows) validated at once
+    
+    # Deferred Validations
+    DEFERRED_ENABLED: bool = True  # /validate queues standard-priority markets instead of checking inline
+    DEFERRED_WORKERS: int = 1
+    DEFERRED_CLAIM_SIZE: int = 50  # Queue entries claimed per worker round
+    DEFERRED_MAX_ROWS_PER_SECOND: float = 20.0  # Drain rate across workers (0 = unlimited)
+    DEFERRED_POLL_INTERVAL: float = 1.0  # Seconds between polls when the queue looks empty
+    DEFERRED_MAX_ATTEMPTS: int = 3
+    DEFERRED_RETRY_DELAY: float = 60.0  # Seconds before a failed entry is retried
+
+    DEFERRED_LEASE_SECONDS: float = 300.0  # A running entry claimed longer ago is taken over by another worker
+
+    # Batch Jobs
+    JOB_WORKERS: int = 2  # Jobs processed in parallel
+    JOB_CHECKPOINT_ROWS: int = 200  # Rows committed per checkpoint
+    JOB_LEASE_SECONDS: float = 120.0  # A running job without a checkpoint for this long is resumed elsewhere
+
+    # Multiple Workers (uvicorn --workers N)
+    AUTO_MIGRATE: bool = True  # Migrate the schema at startup (under a lock); off = run `python -m app.db.migrations` first
+    CACHE_BACKEND: str = "memory"  # memory (per process), sqlite (workers on one host) or redis (any hosts)
+    CACHE_SQLITE_PATH: str = "./shared_cache.db"
+    CACHE_SQLITE_MMAP_BYTES: int = 256 * 1024 * 1024
+    REDIS_URL: str = "redis://localhost:6379/0"
+    SHARED_KEY_PREFIX: str = "whacheck:"  # Namespace for every shared key
+    SHARED_CACHE_FLUSH_INTERVAL: float = 0.05  # Seconds between batched writes to the shared cache
+    SHARED_STATE_SYNC_INTERVAL: float = 1.0  # Seconds between rate-limit / quota / circuit syncs
+
     class Config:
         env_file = ".env"
         case_sensitive = True
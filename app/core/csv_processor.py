@@ -1,92 +1,299 @@
 import pandas as pd
 import io
-from typing import List, Dict, Any
-from app.api.models import ValidateRequest
-from app.agents.decision import decision_agent
-from app.agents.retry import retry_agent
-from app.agents.confidence import confidence_agent
-from app.agents.types import ValidationStrategy
-from app.db.models import ValidationHistory
+import csv
+import codecs
+import time
+from typing import List, Dict, Any, Tuple, Optional, AsyncIterator
+from app.core.batch_engine import batch_engine, BatchStats
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.formats import iter_frames, TableWriter, BadInputError
+from app.core.history import get_history_many
 from app.core.logger import logger
-from sqlalchemy.orm import Session
-import asyncio
 
-async def process_csv_batch(content: bytes, db: Session) -> bytes:
+RESULT_COLUMNS = [
+    "Original_Phone",
+    "Formatted_Number",
+    "Line_Type",
+    "Carrier",
+    "Country",
+    "WhatsApp_Available",
+    "Confidence_Score",
+    "Validation_Trace"
+]
+
+def _detect_columns(columns: List[str]) -> Tuple[str, Optional[str]]:
     """
-    Process a CSV file: 
-    1. Parse phone numbers
-    2. Run validation for each
-    3. Return CSV with results
+    Picks the phone column (first header mentioning phone/mobile/number, else the 1st column)
+    and the country column, if any.
     """
-    # Load CSV
-    df = pd.read_csv(io.BytesIO(content))
-    
-    # Identify Phone Number Column (Naive approach: look for 'phone', 'mobile', 'call' or 1st col)
     phone_col = None
-    for col in df.columns:
+    for col in columns:
         if "phone" in col.lower() or "mobile" in col.lower() or "number" in col.lower():
             phone_col = col
             break
     if not phone_col:
-        phone_col = df.columns[0]
-        
-    results = []
+        phone_col = columns[0]
     
-    # Process each row (limited concurrency for prototype)
-    # In a real app, this would be a proper Task Queue (Celery/RQ)
-    for _, row in df.iterrows():
-        phone = str(row[phone_col])
-        
-        # Extract country code from CSV if available, otherwise default to US
-        country = "US"
-        if "country_code" in df.columns:
-            country = str(row["country_code"])
-        elif "country" in df.columns:
-            country = str(row["country"])
-        
-        
-        # 1. History
-        history = db.query(ValidationHistory).filter(ValidationHistory.phone_number == phone).first()
-        
-        # 2. Pre-check
-        numverify_result = await retry_agent.validate_format(phone, country)
-        
-        # 3. Decision
-        trace = decision_agent.decide(phone, country, history, numverify_result)
-        
-        # 4. Action
-        whatsapp_result = {"available": False}
-        if trace.final_decision == ValidationStrategy.IMMEDIATE:
-            whatsapp_result = await retry_agent.check_whatsapp_availability(phone)
-        elif trace.final_decision == ValidationStrategy.SKIP and history:
-            whatsapp_result = {"available": history.whatsapp_available}
-            
-        # 5. Score
-        confidence = confidence_agent.calculate_score(
-            numverify_result.get("valid", False),
-            whatsapp_result.get("available", False),
-            whatsapp_result.get("provider", "none"),
-            bool(history)
-        )
-        
-        # Collect Result
-        results.append({
-            "Original_Phone": f"'{phone}",  # Prefix with ' to prevent Excel scientific notation
-            "Formatted_Number": numverify_result.get("international_format", numverify_result.get("number", phone)),
-            "Line_Type": numverify_result.get("line_type", "unknown"),
-            "Carrier": numverify_result.get("carrier", "unknown"),
-            "Country": numverify_result.get("country_name", country),
-            "WhatsApp_Available": whatsapp_result.get("available", False),
-            "Confidence_Score": confidence["score"],
-            "Validation_Trace": trace.reasoning[:100] + "..." if len(trace.reasoning) > 100 else trace.reasoning
-        })
-        
-    # Create Result DataFrame
-    result_df = pd.DataFrame(results)
+    country_col = None
+    if "country_code" in columns:
+        country_col = "country_code"
+    elif "country" in columns:
+        country_col = "country"
+    return phone_col, country_col
+
+def _result_values(result: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    One batch engine result as a tuple in RESULT_COLUMNS order.
+    """
+    phone = result["phone"]
+    country = result["country"]
+    
+    if result.get("error"):
+        return (phone, phone, "unknown", "unknown", country, False, 0.0, f"Error: {result['error']}"[:100])
+    
+    numverify_result = result["numverify"]
+    reasoning = result["reasoning"]
+    return (
+        phone,
+        numverify_result.get("international_format", numverify_result.get("number", phone)),
+        numverify_result.get("line_type", "unknown"),
+        numverify_result.get("carrier", "unknown"),
+        numverify_result.get("country_name", country),
+        result["whatsapp"].get("available", False),
+        result["confidence"]["score"],
+        reasoning[:100] + "..." if len(reasoning) > 100 else reasoning
+    )
+
+def format_result_row(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Flattens a batch engine result into the output CSV columns.
+    """
+    return dict(zip(RESULT_COLUMNS, _result_values(result)))
+
+def result_frame(results: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Batch engine results -> DataFrame with RESULT_COLUMNS, built column by column.
+    """
+    columns = list(zip(*map(_result_values, results))) or [()] * len(RESULT_COLUMNS)
+    return pd.DataFrame({name: list(values) for name, values in zip(RESULT_COLUMNS, columns)}, columns=RESULT_COLUMNS)
+
+def _frame_rows(frame: pd.DataFrame, phone_col: str, country_col: Optional[str]) -> List[Tuple[str, str]]:
+    # Whole columns at once; rows without a country default to US
+    phones = frame[phone_col].tolist()
+    if country_col:
+        countries = frame[country_col].replace("", "US").tolist()
+    else:
+        countries = ["US"] * len(phones)
+    return list(zip(phones, countries))
+
+def extract_rows(content: bytes, input_format: str = "csv") -> List[Tuple[str, str]]:
+    """
+    Parses an upload (any supported format) into (phone, country) pairs.
+    """
+    rows: List[Tuple[str, str]] = []
+    columns = None
+    for frame in iter_frames(content, input_format):
+        if columns is None:
+            # Identify Phone Number Column (Naive approach: look for 'phone', 'mobile', 'call' or 1st col)
+            columns = _detect_columns(list(frame.columns))
+        rows.extend(_frame_rows(frame, *columns))
+    return rows
+
+def with_original_columns(original: pd.DataFrame, results: pd.DataFrame) -> pd.DataFrame:
+    """
+    Input columns followed by the result columns; input columns whose name
+    clashes with a result column get an 'Input_' prefix.
+    """
+    renamed = original.rename(columns={c: f"Input_{c}" for c in original.columns if c in RESULT_COLUMNS})
+    return pd.concat([renamed.reset_index(drop=True), results], axis=1)
+
+def _merge_stats(total: BatchStats, part: BatchStats):
+    for field in ("total_rows", "processed_rows", "failed_rows", "unique_numbers", "duplicate_rows",
+                  "history_rows", "history_queries", "coalesced_calls"):
+        setattr(total, field, getattr(total, field) + getattr(part, field))
+
+async def process_batch(
+    content: bytes,
+    input_format: str = "csv",
+    output_format: Optional[str] = None,
+    keep_original: bool = False
+) -> Tuple[bytes, BatchStats]:
+    """
+    Format-agnostic batch pipeline:
+    1. Read the upload in chunks of BATCH_READ_CHUNK_ROWS rows (record batches for Parquet/Arrow)
+    2. Run validation for each chunk (concurrently, see BatchEngine)
+    3. Encode results (in input order) as `output_format`, the input format by default
+    keep_original=True puts the uploaded columns in front of the results.
+    Duplicate and unique counts are per chunk.
+    """
+    writer = TableWriter(output_format or input_format)
+    stats = BatchStats()
+    start = time.perf_counter()
+    columns = None
+    original_columns: List[str] = []
+    for frame in iter_frames(content, input_format):
+        if columns is None:
+            # Identify Phone Number Column (Naive approach: look for 'phone', 'mobile', 'call' or 1st col)
+            columns = _detect_columns(list(frame.columns))
+            original_columns = list(frame.columns)
+        results, part = await batch_engine.run(_frame_rows(frame, *columns))
+        _merge_stats(stats, part)
+        output = result_frame(results)
+        if keep_original:
+            output = with_original_columns(frame, output)
+        writer.write(output)
     
-    # Merge back with original (optional, or just return result_df)
-    # let's just return the result_df for clarity + original phone matches
+    if columns is None:
+        # No data rows: still return the header / schema
+        output = result_frame([])
+        if keep_original:
+            output = with_original_columns(pd.DataFrame(columns=original_columns, dtype=object), output)
+        writer.write(output)
+    
+    stats.elapsed_seconds = time.perf_counter() - start
+    if stats.elapsed_seconds > 0:
+        stats.rows_per_second = stats.total_rows / stats.elapsed_seconds
+    return writer.close(), stats
+
+async def process_csv_batch(content: bytes, keep_original: bool = False) -> Tuple[bytes, BatchStats]:
+    """
+    Process a CSV file: CSV in, CSV out (see process_batch).
+    """
+    return await process_batch(content, "csv", "csv", keep_original=keep_original)
+
+def _complete_records_end(text: str, start: int = 0, quoted: bool = False) -> Tuple[int, bool]:
+    """
+    Scans text[start:], where `quoted` says whether `start` is inside a quoted
+    field, for the last newline that ends a complete CSV record. Returns (index
+    just past it or 0 if there is none, whether the end of text is inside quotes),
+    so callers appending text only scan what is new.
+    """
+    end = 0
+    pos = start
+    while True:
+        quote = text.find('"', pos)
+        segment_end = len(text) if quote < 0 else quote
+        if not quoted:
+            newline = text.rfind("\n", pos, segment_end)
+            if newline >= 0:
+                end = newline + 1
+        if quote < 0:
+            return end, quoted
+        quoted = not quoted
+        pos = quote + 1
+
+async def _iter_csv_record_batches(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[List[str]]]:
+    """
+    Incrementally decodes and parses CSV records from a stream of byte chunks,
+    yielding the complete records of each chunk together.
+    Only the current partial record is buffered between chunks, up to
+    BATCH_STREAM_MAX_RECORD_CHARS (an unclosed quote would otherwise buffer the whole upload).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    quoted = False
+    async for chunk in chunks:
+        scanned = len(buffer)
+        buffer += decoder.decode(chunk)
+        end, quoted = _complete_records_end(buffer, scanned, quoted)
+        if end:
+            yield _parse_records(buffer[:end])
+            buffer = buffer[end:]
+        if len(buffer) > settings.BATCH_STREAM_MAX_RECORD_CHARS:
+            raise BadInputError(
+                f"Could not read the csv upload: a record runs past "
+                f"{settings.BATCH_STREAM_MAX_RECORD_CHARS} characters (unclosed quote?)"
+            )
     
-    output = io.BytesIO()
-    result_df.to_csv(output, index=False)
-    return output.getvalue()
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield _parse_records(buffer)
+
+def _parse_records(text: str) -> List[List[str]]:
+    try:
+        return list(csv.reader(io.StringIO(text)))
+    except csv.Error as e:
+        raise BadInputError(f"Could not read the csv upload: {e}") from e
+
+def _render_rows(
+    results: List[Dict[str, Any]],
+    header: Optional[List[str]] = None,
+    originals: Optional[List[List[str]]] = None
+) -> bytes:
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    if header is not None:
+        writer.writerow(header)
+    if originals is None:
+        writer.writerows(_result_values(result) for result in results)
+    else:
+        writer.writerows(list(original) + list(_result_values(result)) for original, result in zip(originals, results))
+    return output.getvalue().encode("utf-8")
+
+async def stream_csv_batch(chunks: AsyncIterator[bytes], keep_original: bool = False) -> AsyncIterator[bytes]:
+    """
+    Streaming variant of process_csv_batch.
+    The history of each chunk read from the upload is loaded in one query,
+    then its rows are validated in windows of BATCH_STREAM_WINDOW and result
+    rows are yielded as soon as each window finishes, so memory stays bounded
+    by the chunk size rather than the file size.
+    """
+    start = time.perf_counter()
+    total = 0
+    failed = 0
+    try:
+        if not keep_original:
+            # Header goes out immediately so clients get their first byte right away
+            yield _render_rows([], header=RESULT_COLUMNS)
+        
+        columns = None
+        async for records in _iter_csv_record_batches(chunks):
+            records = [record for record in records if record]
+            if columns is None:
+                if not records:
+                    continue
+                columns, records = records[0], records[1:]
+                if keep_original:
+                    yield _render_rows([], header=[f"Input_{c}" if c in RESULT_COLUMNS else c for c in columns] + RESULT_COLUMNS)
+                phone_col, country_col = _detect_columns(columns)
+                phone_idx = columns.index(phone_col)
+                country_idx = columns.index(country_col) if country_col else None
+                width = len(columns)
+            if not records:
+                continue
+
+            rows = []
+            for record in records:
+                phone = record[phone_idx] if phone_idx < len(record) else ""
+                country = "US"
+                if country_idx is not None and country_idx < len(record):
+                    country = record[country_idx] or "US"
+                rows.append((phone, country))
+
+            # One history query per chunk read; windows keep the first results coming early
+            async with AsyncSessionLocal() as db:
+                known, _ = await get_history_many(db, rows)
+            for offset in range(0, len(rows), settings.BATCH_STREAM_WINDOW):
+                window = rows[offset:offset + settings.BATCH_STREAM_WINDOW]
+                results, stats = await batch_engine.run(window, prefetched=known)
+                total += stats.total_rows
+                failed += stats.failed_rows
+                originals = None
+                if keep_original:
+                    originals = [(record + [""] * width)[:width] for record in records[offset:offset + len(window)]]
+                yield _render_rows(results, originals=originals)
+
+        if columns is None and keep_original:
+            yield _render_rows([], header=RESULT_COLUMNS)
+    except BadInputError as e:
+        # The response has started: report the bad input as a last error row
+        logger.warning(f"Streamed batch stopped: {e}")
+        if columns is None and keep_original:
+            yield _render_rows([], header=RESULT_COLUMNS)
+        yield _render_rows([{"phone": "", "country": "", "error": str(e)}],
+                           originals=[[""] * width] if columns is not None and keep_original else None)
+    finally:
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Streamed batch: {total} rows ({failed} failed) in {elapsed:.2f}s, {rate:.1f} rows/sec")
@@ -0,0 +1,274 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Set
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.batch_engine import batch_engine
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, insert_for_dialect
+from app.core.logger import logger
+from app.core.phone import normalize_key
+from app.db.models import DeferredValidation, PRIORITY_REQUEST, WAITING_STATUSES
+
+def summarize_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """BatchEngine row result -> what GET /validate/deferred/{id} returns."""
+    numverify = result.get("numverify") or {}
+    whatsapp = result.get("whatsapp") or {}
+    confidence = result.get("confidence") or {}
+    return {
+        "valid": numverify.get("valid", False),
+        "formatted_number": numverify.get("international_format"),
+        "carrier": numverify.get("carrier"),
+        "line_type": numverify.get("line_type"),
+        "whatsapp_available": whatsapp.get("available", False),
+        "provider": whatsapp.get("provider"),
+        "confidence_score": confidence.get("score"),
+        "classification": confidence.get("classification")
+    }
+
+class DeferredQueue:
+    """
+    Persistent priority queue of validations taken off the request path.
+    Workers claim the most urgent entries, validate them through the BatchEngine
+    (results land in ValidationHistory via the history writer) and pace
+    themselves to DEFERRED_MAX_ROWS_PER_SECOND. A claim is a lease: entries
+    left running longer than DEFERRED_LEASE_SECONDS (their process stopped)
+    are claimed again by any worker, in this or another process.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.DEFERRED_WORKERS,
+        claim_size: int = settings.DEFERRED_CLAIM_SIZE,
+        max_rows_per_second: float = settings.DEFERRED_MAX_ROWS_PER_SECOND
+    ):
+        self.workers = max(1, workers)
+        self.claim_size = max(1, claim_size)
+        self.max_rows_per_second = max_rows_per_second
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._claims: Set[str] = set()  # Tokens of claims still being worked on
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._claims:
+            # Hand interrupted entries back right away instead of waiting for their lease to run out
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(DeferredValidation)
+                    .where(DeferredValidation.claim_token.in_(self._claims), DeferredValidation.status == "running")
+                    .values(status="queued", claim_token=None, claimed_at=None)
+                )
+                await db.commit()
+            self._claims.clear()
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        phone_number: str,
+        country_code: str,
+        priority: int = PRIORITY_REQUEST
+    ) -> DeferredValidation:
+        """
+        Queues a validation and returns its entry; a number already waiting is not queued twice.
+        The insert is ON CONFLICT DO NOTHING against the one-waiting-entry-per-number
+        index, so concurrent requests for a number end up sharing one entry.
+        """
+        phone_key = normalize_key(phone_number, country_code)
+        waiting = and_(DeferredValidation.phone_key == phone_key, DeferredValidation.status.in_(WAITING_STATUSES))
+        insert = insert_for_dialect()
+        while True:
+            entry_id = uuid.uuid4().hex
+            inserted = (await db.execute(
+                insert(DeferredValidation)
+                .values(
+                    id=entry_id,
+                    phone_key=phone_key,
+                    phone_number=phone_number,
+                    country_code=country_code,
+                    priority=priority,
+                    status="queued",
+                    attempts=0
+                )
+                .on_conflict_do_nothing(
+                    index_elements=[DeferredValidation.phone_key],
+                    index_where=DeferredValidation.status.in_(WAITING_STATUSES)
+                )
+            )).rowcount == 1
+            if not inserted:
+                # Already waiting: only ever make it more urgent
+                await db.execute(
+                    update(DeferredValidation)
+                    .where(waiting, DeferredValidation.priority > priority)
+                    .values(priority=priority)
+                )
+            await db.commit()
+
+            entry = (await db.execute(
+                select(DeferredValidation)
+                .where(DeferredValidation.id == entry_id if inserted else waiting)
+                .execution_options(populate_existing=True)
+            )).scalars().first()
+            if entry is not None:
+                break
+            # The waiting entry finished in between; queue the number again
+
+        if inserted:
+            self.enqueued += 1
+            if self._wakeup is not None:
+                self._wakeup.set()
+        return entry
+
+    async def _claim(self, db: AsyncSession) -> List[DeferredValidation]:
+        """
+        Claims up to claim_size due entries. The UPDATE repeats the conditions,
+        so when workers race for an entry exactly one of them gets it (SQLite
+        has no SELECT ... FOR UPDATE SKIP LOCKED).
+        """
+        now = datetime.now(timezone.utc)
+        claimable = or_(
+            and_(
+                DeferredValidation.status == "queued",
+                or_(DeferredValidation.not_before.is_(None), DeferredValidation.not_before <= now)
+            ),
+            and_(
+                DeferredValidation.status == "running",
+                or_(
+                    DeferredValidation.claimed_at.is_(None),
+                    DeferredValidation.claimed_at < now - timedelta(seconds=settings.DEFERRED_LEASE_SECONDS)
+                )
+            )
+        )
+        candidates = (await db.execute(
+            select(DeferredValidation.id, DeferredValidation.status)
+            .where(claimable)
+            .order_by(DeferredValidation.priority, DeferredValidation.created_at)
+            .limit(self.claim_size)
+        )).all()
+        if not candidates:
+            return []
+        abandoned = sum(1 for _, status in candidates if status == "running")
+        if abandoned:
+            logger.info(f"Taking over {abandoned} deferred validations whose lease expired")
+
+        token = uuid.uuid4().hex
+        self._claims.add(token)
+        claimed = (await db.execute(
+            update(DeferredValidation)
+            .where(DeferredValidation.id.in_([entry_id for entry_id, _ in candidates]), claimable)
+            .values(
+                status="running",
+                claim_token=token,
+                claimed_at=now,
+                attempts=DeferredValidation.attempts + 1
+            )
+        )).rowcount
+        await db.commit()
+        if not claimed:
+            # Another worker won every candidate
+            self._claims.discard(token)
+            return []
+        return (await db.execute(
+            select(DeferredValidation)
+            .where(DeferredValidation.claim_token == token)
+            .order_by(DeferredValidation.priority, DeferredValidation.created_at)
+        )).scalars().all()
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                processed = await self._drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Deferred queue worker error: {e}")
+                processed = 0
+
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.DEFERRED_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _drain_once(self) -> int:
+        started = time.monotonic()
+        # Short sessions: no connection (or SQLite write lock) is held during the provider calls
+        async with AsyncSessionLocal() as db:
+            entries = await self._claim(db)
+        if not entries:
+            return 0
+        token = entries[0].claim_token
+
+        # Stale history is what refresh entries are here to replace, so never serve it
+        results, _ = await batch_engine.run(
+            [(e.phone_number, e.country_code) for e in entries], allow_stale=False
+        )
+
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            for entry, result in zip(entries, results):
+                if result.get("error") is None:
+                    values = {"status": "done", "result": summarize_result(result), "error": None, "finished_at": now}
+                elif entry.attempts >= settings.DEFERRED_MAX_ATTEMPTS:
+                    values = {"status": "failed", "error": str(result["error"])[:500], "finished_at": now}
+                else:
+                    values = {
+                        "status": "queued",
+                        "error": str(result["error"])[:500],
+                        "not_before": now + timedelta(seconds=settings.DEFERRED_RETRY_DELAY)
+                    }
+                # Only while this claim still holds the entry (its lease may have been taken over)
+                updated = (await db.execute(
+                    update(DeferredValidation)
+                    .where(
+                        DeferredValidation.id == entry.id,
+                        DeferredValidation.claim_token == token,
+                        DeferredValidation.status == "running"
+                    )
+                    .values(**values)
+                )).rowcount
+                if updated and values["status"] == "done":
+                    self.completed += 1
+                elif updated and values["status"] == "failed":
+                    self.failed += 1
+            await db.commit()
+        self._claims.discard(token)
+
+        # Pace the drain: each worker takes its share of the configured rate
+        if self.max_rows_per_second > 0:
+            budget = len(entries) * self.workers / self.max_rows_per_second
+            remaining = budget - (time.monotonic() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+        return len(entries)
+
+    async def stats(self, db: AsyncSession) -> Dict[str, Any]:
+        counts = dict((await db.execute(
+            select(DeferredValidation.status, func.count()).group_by(DeferredValidation.status)
+        )).all())
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "workers": len(self._tasks),
+            "max_rows_per_second": self.max_rows_per_second,
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "failed_permanently": self.failed
+        }
+
+deferred_queue = DeferredQueue()
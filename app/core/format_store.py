@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from sqlalchemy import select
+from app.core.batching import MicroBatcher
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, insert_for_dialect
+from app.core.logger import logger
+from app.core.write_behind import WriteBehindBuffer
+from app.db.models import FormatLookup
+
+# Rows per INSERT statement, keeps SQLite under its bound-parameter limit
+UPSERT_CHUNK_SIZE = 500
+
+# NumVerify response fields kept in format_lookups (country_code is stored as `region`)
+STORED_FIELDS = (
+    "number", "local_format", "international_format", "country_prefix",
+    "country_name", "location", "carrier", "line_type"
+)
+
+def _store_key(phone_key: str, country_code: Optional[str]) -> Tuple[str, str]:
+    return phone_key, (country_code or "").strip().upper()
+
+def _as_result(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Stored row -> the NumVerify-shaped dict validate_format returns."""
+    result = {"valid": True, **{field: row.get(field) for field in STORED_FIELDS}}
+    result["country_code"] = row.get("region")
+    result["e164"] = row["phone_key"]
+    result["source"] = "numverify"
+    return result
+
+class FormatStore(WriteBehindBuffer):
+    """
+    NumVerify answers kept in the format_lookups table, keyed by (canonical
+    number, country), for FORMAT_STORE_TTL. They survive restarts and are
+    shared by every process using the database. Lookups from concurrent
+    callers are grouped into one IN (...) query; new answers are written
+    behind in batched upserts.
+    """
+
+    def __init__(self, name: str, max_size: int, interval: float, ttl: float = settings.FORMAT_STORE_TTL):
+        super().__init__(name, max_size, interval)
+        self.ttl = ttl
+        self._reader: Optional[MicroBatcher] = None
+        self.hits = 0
+        self.misses = 0
+        self.read_errors = 0
+
+    def _get_reader(self) -> MicroBatcher:
+        # Created lazily so it binds to the running event loop
+        if self._reader is None:
+            self._reader = MicroBatcher(
+                self._read,
+                max_size=settings.FORMAT_STORE_READ_BATCH,
+                max_wait=settings.FORMAT_STORE_READ_WAIT
+            )
+        return self._reader
+
+    async def _read(self, keys: List[Hashable]) -> Dict[Hashable, Optional[Dict[str, Any]]]:
+        found: Dict[Hashable, Optional[Dict[str, Any]]] = {key: None for key in keys}
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(FormatLookup).where(FormatLookup.phone_key.in_({phone_key for phone_key, _ in keys}))
+            )).scalars()
+            for row in rows:
+                key = (row.phone_key, row.country_code)
+                fetched = row.fetched_at
+                if fetched is not None and fetched.tzinfo is None:
+                    # SQLite hands back naive datetimes; they are stored in UTC
+                    fetched = fetched.replace(tzinfo=timezone.utc)
+                if key in found and fetched is not None and fetched >= cutoff:
+                    found[key] = _as_result({
+                        column: getattr(row, column) for column in ("phone_key", "region") + STORED_FIELDS
+                    })
+        return found
+
+    async def get(self, phone_key: str, country_code: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        The stored NumVerify answer, or None when there is none (or it is too old).
+        A failing read is logged and treated as a miss.
+        """
+        key = _store_key(phone_key, country_code)
+        pending = self._buffer.get(key)
+        if pending is not None:
+            self.hits += 1
+            return _as_result(pending)
+        try:
+            result = await self._get_reader().submit(key)
+        except Exception as e:
+            self.read_errors += 1
+            logger.error(f"{self.name} read failed: {e}")
+            return None
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def record(self, phone_key: str, country_code: Optional[str], numverify_result: Dict[str, Any]):
+        """
+        Queues a successful NumVerify answer for the table.
+        """
+        key = _store_key(phone_key, country_code)
+        self.add(key, {
+            "phone_key": key[0],
+            "country_code": key[1],
+            "region": numverify_result.get("country_code"),
+            **{field: numverify_result.get(field) for field in STORED_FIELDS},
+            "fetched_at": datetime.now(timezone.utc)
+        })
+
+    async def _write(self, records: List[Dict[str, Any]]):
+        insert = insert_for_dialect()
+        async with AsyncSessionLocal() as db:
+            for start in range(0, len(records), UPSERT_CHUNK_SIZE):
+                stmt = insert(FormatLookup).values(records[start:start + UPSERT_CHUNK_SIZE])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[FormatLookup.phone_key, FormatLookup.country_code],
+                    set_={column: stmt.excluded[column] for column in ("region", "fetched_at") + STORED_FIELDS}
+                )
+                await db.execute(stmt)
+            await db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            **super().stats(),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "read_errors": self.read_errors,
+            "reads": self._reader.stats() if self._reader is not None else None
+        }
+
+format_store = FormatStore(
+    "FormatStore",
+    max_size=settings.HISTORY_FLUSH_SIZE,
+    interval=settings.HISTORY_FLUSH_INTERVAL
+)
@@ -0,0 +1,236 @@
+import io
+import json
+import zipfile
+from typing import Any, Iterator, List, Optional
+import pandas as pd
+from app.core.config import settings
+
+# Format name -> (file extensions, content types, response media type)
+FORMATS = {
+    "csv": ((".csv",), ("text/csv", "application/csv"), "text/csv"),
+    "parquet": ((".parquet", ".pq"), ("application/vnd.apache.parquet", "application/x-parquet"),
+                "application/vnd.apache.parquet"),
+    "arrow": ((".arrow", ".feather", ".ipc", ".arrows"),
+              ("application/vnd.apache.arrow.file", "application/vnd.apache.arrow.stream"),
+              "application/vnd.apache.arrow.file"),
+    "ndjson": ((".ndjson", ".jsonl"), ("application/x-ndjson", "application/jsonl", "application/json-lines"),
+               "application/x-ndjson"),
+    "xlsx": ((".xlsx",), ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",),
+             "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+class UnsupportedFormatError(ValueError):
+    """Unknown format, or its optional dependency (pyarrow / openpyxl) is not installed."""
+
+class BadInputError(ValueError):
+    """The upload is not valid data in its format (corrupt file, malformed line, ...)."""
+
+# What the readers raise on malformed input: pandas / json / pyarrow ValueErrors,
+# missing workbook parts, truncated archives and files
+_PARSE_ERRORS = (ValueError, KeyError, OSError, EOFError, zipfile.BadZipFile)
+
+def detect_format(filename: Optional[str] = None, content_type: Optional[str] = None, default: str = "csv") -> str:
+    """
+    Format name from the file extension, else the content type, else `default`.
+    """
+    name = (filename or "").lower()
+    for fmt, (extensions, _, _) in FORMATS.items():
+        if name.endswith(extensions):
+            return fmt
+    media = (content_type or "").split(";")[0].strip().lower()
+    for fmt, (_, content_types, _) in FORMATS.items():
+        if media in content_types:
+            return fmt
+    return default
+
+def check_format(fmt: str) -> str:
+    fmt = fmt.lower()
+    if fmt not in FORMATS:
+        raise UnsupportedFormatError(f"Unsupported format '{fmt}', expected one of: {', '.join(FORMATS)}")
+    return fmt
+
+def media_type(fmt: str) -> str:
+    return FORMATS[fmt][2]
+
+def extension(fmt: str) -> str:
+    return FORMATS[fmt][0][0]
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise UnsupportedFormatError("Parquet/Arrow support needs pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError as e:
+        raise UnsupportedFormatError("Excel support needs openpyxl (pip install openpyxl)") from e
+    return openpyxl
+
+def _cell_text(value: Any) -> str:
+    # Text as the user sees it: no '1.4e10' or '14155552671.0' for numbers, '' for empty cells
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _text_frame(columns: List[str], rows: List[List[Any]]) -> pd.DataFrame:
+    width = len(columns)
+    return pd.DataFrame(
+        [[_cell_text(v) for v in (list(row) + [None] * width)[:width]] for row in rows],
+        columns=columns,
+        dtype=object
+    )
+
+def _arrow_text_frame(pa, batch) -> pd.DataFrame:
+    # Cast every column to string in Arrow (integers keep their exact digits)
+    columns = {}
+    for name, column in zip(batch.schema.names, batch.columns):
+        if pa.types.is_floating(column.type):
+            columns[name] = [_cell_text(v) for v in column.to_pylist()]
+        else:
+            columns[name] = pa.compute.fill_null(pa.compute.cast(column, pa.string()), "").to_pylist()
+    return pd.DataFrame(columns, columns=batch.schema.names, dtype=object)
+
+def iter_frames(content: bytes, fmt: str, chunk_rows: int = settings.BATCH_READ_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Reads an upload as a sequence of text-only DataFrames of at most `chunk_rows` rows.
+    Parquet and Arrow are read record batch by record batch, never as one table.
+    An empty (or whitespace-only) upload is bad input in every format.
+    """
+    fmt = check_format(fmt)
+    if not content or content.isspace():
+        raise BadInputError(f"The {fmt} upload is empty")
+    try:
+        yield from _read_frames(content, fmt, chunk_rows)
+    except (UnsupportedFormatError, BadInputError):
+        raise
+    except _PARSE_ERRORS as e:
+        raise BadInputError(f"Could not read the {fmt} upload: {e}") from e
+
+def _read_frames(content: bytes, fmt: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    if fmt == "csv":
+        reader = pd.read_csv(io.BytesIO(content), dtype=str, keep_default_na=False, chunksize=chunk_rows)
+        for frame in reader:
+            yield frame.reset_index(drop=True)
+    elif fmt == "parquet":
+        pa = _pyarrow()
+        parquet_file = pa.parquet.ParquetFile(io.BytesIO(content))
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows):
+            yield _arrow_text_frame(pa, batch)
+    elif fmt == "arrow":
+        pa = _pyarrow()
+        try:
+            reader = pa.ipc.open_file(io.BytesIO(content))
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        except pa.ArrowInvalid:
+            batches = iter(pa.ipc.open_stream(io.BytesIO(content)))
+        for batch in batches:
+            for start in range(0, batch.num_rows, chunk_rows):
+                yield _arrow_text_frame(pa, batch.slice(start, chunk_rows))
+    elif fmt == "ndjson":
+        columns: List[str] = []
+        records: List[dict] = []
+        for line in io.BytesIO(content):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise BadInputError("NDJSON lines must be JSON objects")
+            for key in record:
+                if key not in columns:
+                    columns.append(key)
+            records.append(record)
+            if len(records) >= chunk_rows:
+                yield _text_frame(columns, [[r.get(c) for c in columns] for r in records])
+                records = []
+        if records:
+            yield _text_frame(columns, [[r.get(c) for c in columns] for r in records])
+    elif fmt == "xlsx":
+        openpyxl = _openpyxl()
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [_cell_text(v) or f"column_{i + 1}" for i, v in enumerate(header)]
+            chunk: List[List[Any]] = []
+            for row in rows:
+                if all(v is None for v in row):
+                    continue
+                chunk.append(list(row))
+                if len(chunk) >= chunk_rows:
+                    yield _text_frame(columns, chunk)
+                    chunk = []
+            if chunk:
+                yield _text_frame(columns, chunk)
+        finally:
+            workbook.close()
+
+class TableWriter:
+    """
+    Accumulates output frames in one format; Parquet, Arrow, CSV and NDJSON
+    are encoded frame by frame, Excel once at close().
+    """
+
+    def __init__(self, fmt: str):
+        self.fmt = check_format(fmt)
+        self._buffer = io.BytesIO()
+        self._writer = None
+        self._schema = None
+        self._frames: List[pd.DataFrame] = []
+        self._header = True
+        if self.fmt in ("parquet", "arrow"):
+            self._pa = _pyarrow()
+        elif self.fmt == "xlsx":
+            _openpyxl()
+
+    def _arrow_table(self, frame: pd.DataFrame):
+        pa = self._pa
+        if self._schema is None:
+            # Text columns are always strings, even when a frame has only nulls in them
+            fields = []
+            for name in frame.columns:
+                dtype = frame[name].dtype
+                if pd.api.types.is_bool_dtype(dtype):
+                    fields.append(pa.field(name, pa.bool_()))
+                elif pd.api.types.is_float_dtype(dtype):
+                    fields.append(pa.field(name, pa.float64()))
+                else:
+                    fields.append(pa.field(name, pa.string()))
+            self._schema = pa.schema(fields)
+        return pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False)
+
+    def write(self, frame: pd.DataFrame):
+        if self.fmt == "csv":
+            frame.to_csv(self._buffer, index=False, header=self._header)
+        elif self.fmt == "ndjson":
+            if len(frame):
+                self._buffer.write(frame.to_json(orient="records", lines=True).rstrip("\n").encode("utf-8") + b"\n")
+        elif self.fmt in ("parquet", "arrow"):
+            table = self._arrow_table(frame)
+            if self._writer is None:
+                if self.fmt == "parquet":
+                    self._writer = self._pa.parquet.ParquetWriter(self._buffer, self._schema)
+                else:
+                    self._writer = self._pa.ipc.new_file(self._buffer, self._schema)
+            self._writer.write_table(table)
+        else:
+            self._frames.append(frame)
+        self._header = False
+
+    def close(self) -> bytes:
+        if self._writer is not None:
+            self._writer.close()
+        if self.fmt == "xlsx":
+            frame = pd.concat(self._frames, ignore_index=True) if self._frames else pd.DataFrame()
+            frame.to_excel(self._buffer, index=False, engine="openpyxl")
+        return self._buffer.getvalue()
@@ -0,0 +1,138 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from app.agents.types import HistorySnapshot
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, insert_for_dialect
+from app.core.phone import normalize_key
+from app.core.write_behind import WriteBehindBuffer
+from app.db.models import DeferredValidation, PRIORITY_REFRESH, WAITING_STATUSES
+
+# Outcome classes, each with its own freshness window
+POSITIVE = "positive"  # Valid and on WhatsApp
+NEGATIVE = "negative"  # Valid, not on WhatsApp
+INVALID = "invalid"  # Invalid format
+
+# Age states of a history row
+FRESH = "fresh"  # Served as is
+STALE = "stale"  # Served while a refresh is queued (stale-while-revalidate)
+EXPIRED = "expired"  # Never served
+
+class FreshnessPolicy:
+    """
+    How long a validation_history outcome may answer for a number. Positive,
+    negative and invalid outcomes have separate windows, optionally overridden
+    per country. A row older than its window but within `stale_window` more
+    is stale: it can still be served while a refresh is queued. Older rows
+    are expired and treated as if there were no history.
+    """
+
+    def __init__(
+        self,
+        positive: float = settings.HISTORY_FRESH_POSITIVE,
+        negative: float = settings.HISTORY_FRESH_NEGATIVE,
+        invalid: float = settings.HISTORY_FRESH_INVALID,
+        by_country: Optional[Dict[str, Dict[str, float]]] = None,
+        stale_window: float = settings.HISTORY_STALE_WHILE_REVALIDATE
+    ):
+        self.windows = {POSITIVE: positive, NEGATIVE: negative, INVALID: invalid}
+        self.by_country = {
+            country.upper(): overrides
+            for country, overrides in (settings.HISTORY_FRESH_BY_COUNTRY if by_country is None else by_country).items()
+        }
+        self.stale_window = max(0.0, stale_window)
+        self.served = {FRESH: 0, STALE: 0}
+        self.expired = 0
+
+    def outcome(self, history: HistorySnapshot) -> str:
+        if not history.is_valid:
+            return INVALID
+        return POSITIVE if history.whatsapp_available else NEGATIVE
+
+    def window(self, outcome: str, country_code: Optional[str]) -> float:
+        overrides = self.by_country.get((country_code or "").upper(), {})
+        return overrides.get(outcome, self.windows[outcome])
+
+    def state(self, history: HistorySnapshot, country_code: Optional[str] = None, now: Optional[datetime] = None) -> str:
+        if history.last_validated is None:
+            return EXPIRED
+        validated = history.last_validated
+        if validated.tzinfo is None:
+            # SQLite hands back naive datetimes; they are stored in UTC
+            validated = validated.replace(tzinfo=timezone.utc)
+        age = ((now or datetime.now(timezone.utc)) - validated).total_seconds()
+        window = self.window(self.outcome(history), country_code or history.country_code)
+        if age <= window:
+            return FRESH
+        if age <= window + self.stale_window:
+            return STALE
+        return EXPIRED
+
+    def usable(self, history: Optional[HistorySnapshot], country_code: Optional[str] = None) -> Optional[HistorySnapshot]:
+        """
+        The history row, or None once it is past its hard expiry.
+        """
+        if history is None:
+            return None
+        if self.state(history, country_code) == EXPIRED:
+            self.expired += 1
+            return None
+        return history
+
+    def count_served(self, state: str, rows: int = 1):
+        self.served[state] += rows
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "windows": self.windows,
+            "by_country": self.by_country,
+            "stale_window": self.stale_window,
+            "served_fresh": self.served[FRESH],
+            "served_stale": self.served[STALE],
+            "expired": self.expired,
+            "refresh": refresh_scheduler.stats()
+        }
+
+class RefreshScheduler(WriteBehindBuffer):
+    """
+    Collects numbers answered from stale history and queues them on the
+    deferred validation queue (PRIORITY_REFRESH) in one transaction per
+    flush. Numbers already queued or running are not queued again.
+    """
+
+    def __init__(self, name: str, max_size: int, interval: float):
+        super().__init__(name, max_size, interval)
+        self.queued = 0
+
+    async def _write(self, records: List[Dict[str, Any]]):
+        # Numbers already waiting keep their entry (one waiting entry per number, see enqueue)
+        insert = insert_for_dialect()
+        async with AsyncSessionLocal() as db:
+            queued = (await db.execute(
+                insert(DeferredValidation)
+                .values([
+                    {"id": uuid.uuid4().hex, "priority": PRIORITY_REFRESH, "status": "queued", "attempts": 0, **record}
+                    for record in records
+                ])
+                .on_conflict_do_nothing(
+                    index_elements=[DeferredValidation.phone_key],
+                    index_where=DeferredValidation.status.in_(WAITING_STATUSES)
+                )
+            )).rowcount
+            await db.commit()
+        self.queued += queued
+
+    def request(self, phone_number: str, country_code: Optional[str]):
+        key = normalize_key(phone_number, country_code)
+        self.add(key, {"phone_key": key, "phone_number": phone_number, "country_code": country_code})
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "queued": self.queued}
+
+freshness_policy = FreshnessPolicy()
+
+refresh_scheduler = RefreshScheduler(
+    "RefreshScheduler",
+    max_size=settings.HISTORY_FLUSH_SIZE,
+    interval=settings.HISTORY_FLUSH_INTERVAL
+)
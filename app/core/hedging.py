@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+from app.core.config import settings
+from app.core.metrics import provider_metrics
+
+class Hedger:
+    """
+    Hedged calls: when the primary call has not answered after a delay learned
+    from recent latencies (HEDGE_PERCENTILE of the provider's window), a second
+    call is fired and the first successful answer wins; the other is cancelled.
+    Hedges draw from a budget that earns `budget_ratio` tokens per call, capped
+    at `budget_burst`, so they add at most that share of extra requests.
+    """
+
+    def __init__(
+        self,
+        percentile: float = settings.HEDGE_PERCENTILE,
+        min_delay: float = settings.HEDGE_MIN_DELAY,
+        default_delay: float = settings.HEDGE_DEFAULT_DELAY,
+        min_samples: int = settings.HEDGE_MIN_SAMPLES,
+        budget_ratio: float = settings.HEDGE_BUDGET_RATIO,
+        budget_burst: float = settings.HEDGE_BUDGET_BURST
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self._tokens = budget_burst
+        # provider -> (computed at, delay); percentiles sort the window, so reuse for a second
+        self._delays: Dict[str, Tuple[float, float]] = {}
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.budget_exhausted = 0
+
+    def delay(self, provider: str) -> float:
+        now = time.monotonic()
+        cached = self._delays.get(provider)
+        if cached and now - cached[0] < 1.0:
+            return cached[1]
+        latencies = provider_metrics.snapshot(provider)
+        if latencies["count"] >= self.min_samples:
+            delay = max(self.min_delay, provider_metrics.percentile(provider, self.percentile) or 0.0)
+        else:
+            delay = self.default_delay
+        self._delays[provider] = (now, delay)
+        return delay
+
+    def _take_token(self) -> bool:
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        self.budget_exhausted += 1
+        return False
+
+    async def run(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        hedge: Callable[[], Awaitable[Any]],
+        delay: float
+    ) -> Tuple[Any, bool]:
+        """
+        Returns (result, hedge_won). Raises the primary's error when no call succeeds.
+        """
+        self.calls += 1
+        self._tokens = min(self.budget_burst, self._tokens + self.budget_ratio)
+
+        primary_task = asyncio.ensure_future(primary())
+        tasks = [primary_task]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._take_token():
+                return await primary_task, False
+
+            self.fired += 1
+            hedge_task = asyncio.ensure_future(hedge())
+            tasks.append(hedge_task)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.won += 1
+                        return task.result(), task is hedge_task
+            # Both failed
+            return primary_task.result(), False
+        finally:
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.HEDGE_ENABLED,
+            "calls": self.calls,
+            "fired": self.fired,
+            "won": self.won,
+            "budget_exhausted": self.budget_exhausted,
+            "fire_rate": round(self.fired / self.calls, 4) if self.calls else 0.0,
+            "win_rate": round(self.won / self.fired, 4) if self.fired else 0.0,
+            "budget_tokens": round(self._tokens, 2),
+            "delays": {provider: round(delay, 4) for provider, (_, delay) in self._delays.items()}
+        }
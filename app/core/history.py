@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.agents.types import HistorySnapshot
+from app.core.cache import validation_cache, MISSING
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, insert_for_dialect
+from app.core.phone import normalize_key
+from app.core.write_behind import WriteBehindBuffer
+from app.db.models import ValidationHistory
+
+# Rows per INSERT statement, keeps SQLite under its bound-parameter limit
+UPSERT_CHUNK_SIZE = 500
+
+async def get_history(db: AsyncSession, phone_number: str, country_code: Optional[str] = None) -> Optional[HistorySnapshot]:
+    """
+    History lookup through the in-process cache (and the shared one, when configured).
+    Misses are cached too, so repeated unknown numbers skip the query as well.
+    """
+    key = normalize_key(phone_number, country_code)
+    await validation_cache.history.load([key])
+    cached = validation_cache.history.get(key)
+    if cached is not MISSING:
+        return cached
+    
+    row = (await db.execute(
+        select(ValidationHistory).where(ValidationHistory.phone_key == key)
+    )).scalar_one_or_none()
+    snapshot = HistorySnapshot.model_validate(row, from_attributes=True) if row else None
+    validation_cache.history.set(key, snapshot)
+    return snapshot
+
+async def get_history_many(
+    db: AsyncSession,
+    rows: List[Tuple[str, Optional[str]]],
+    chunk_size: int = settings.HISTORY_PREFETCH_CHUNK_SIZE
+) -> Tuple[Dict[str, Optional[HistorySnapshot]], int]:
+    """
+    History for many (phone, country) rows: cache first, then chunked
+    IN (...) queries for the rest. Returns ({normalize_key: snapshot or None}, queries run).
+    """
+    keys = list(dict.fromkeys(normalize_key(phone_number, country_code) for phone_number, country_code in rows))
+    await validation_cache.history.load(keys)
+    found: Dict[str, Optional[HistorySnapshot]] = {}
+    missing: List[str] = []
+    for key in keys:
+        cached = validation_cache.history.get(key)
+        found[key] = None if cached is MISSING else cached
+        if cached is MISSING:
+            missing.append(key)
+
+    queries = 0
+    for start in range(0, len(missing), chunk_size):
+        result = await db.execute(
+            select(ValidationHistory).where(ValidationHistory.phone_key.in_(missing[start:start + chunk_size]))
+        )
+        queries += 1
+        for row in result.scalars():
+            found[row.phone_key] = HistorySnapshot.model_validate(row, from_attributes=True)
+
+    for key in missing:
+        validation_cache.history.set(key, found[key])
+    return found, queries
+
+class HistoryWriter(WriteBehindBuffer):
+    """
+    Write-behind upserts into validation_history, one
+    INSERT ... ON CONFLICT(phone_key) DO UPDATE per chunk of rows.
+    """
+
+    async def _write(self, records: List[Dict[str, Any]]):
+        insert = insert_for_dialect()
+        async with AsyncSessionLocal() as db:
+            for start in range(0, len(records), UPSERT_CHUNK_SIZE):
+                stmt = insert(ValidationHistory).values(records[start:start + UPSERT_CHUNK_SIZE])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ValidationHistory.phone_key],
+                    set_={
+                        column: stmt.excluded[column]
+                        for column in (
+                            "phone_number", "country_code", "is_valid", "carrier", "line_type",
+                            "whatsapp_available", "confidence_score", "last_validated", "meta_data"
+                        )
+                    }
+                )
+                await db.execute(stmt)
+            await db.commit()
+
+    def record(
+        self,
+        phone_number: str,
+        country_code: str,
+        numverify_result: Dict[str, Any],
+        whatsapp_result: Dict[str, Any],
+        confidence_score: float
+    ):
+        """
+        Queues a validation outcome. Only outcomes backed by real data are stored:
+        invalid formats and answers from a real WhatsApp provider (not mock / skipped).
+        """
+        is_valid = bool(numverify_result.get("valid", False))
+        provider = whatsapp_result.get("provider")
+        if is_valid and provider in (None, "none", "mock", "skipped", "cache"):
+            return
+        
+        now = datetime.now(timezone.utc)
+        key = normalize_key(phone_number, country_code)
+        row = {
+            "phone_key": key,
+            "phone_number": phone_number,
+            "country_code": country_code,
+            "is_valid": is_valid,
+            "carrier": numverify_result.get("carrier") or None,
+            "line_type": numverify_result.get("line_type") or None,
+            "whatsapp_available": bool(whatsapp_result.get("available", False)),
+            "confidence_score": confidence_score,
+            "last_validated": now,
+            "meta_data": {
+                "format_source": numverify_result.get("source"),
+                "provider": provider
+            }
+        }
+        self.add(key, row)
+        
+        # Write-through: readers see the new outcome before the flush lands
+        validation_cache.invalidate(key)
+        validation_cache.history.set(key, HistorySnapshot(**{k: v for k, v in row.items() if k != "meta_data"}))
+
+history_writer = HistoryWriter(
+    "HistoryWriter",
+    max_size=settings.HISTORY_FLUSH_SIZE,
+    interval=settings.HISTORY_FLUSH_INTERVAL
+)
@@ -0,0 +1,274 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Set, Tuple
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.batch_engine import batch_engine
+from app.core.config import settings
+from app.core.csv_processor import extract_rows, format_result_row
+from app.core.database import AsyncSessionLocal
+from app.core.history import get_history_many
+from app.core.logger import logger
+from app.db.models import BatchJob, BatchJobRow
+
+class JobManager:
+    """
+    In-process worker pool for asynchronous batch jobs.
+    Input rows and results are checkpointed in the database, so a restarted
+    worker resumes a job from its first unfinished row. A job is leased to
+    one process at a time: every checkpoint renews the lease, and a job whose
+    lease ran out (JOB_LEASE_SECONDS) is resumed by whichever process finds it first.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.JOB_WORKERS,
+        checkpoint_rows: int = settings.JOB_CHECKPOINT_ROWS
+    ):
+        self.workers = max(1, workers)
+        self.checkpoint_rows = max(1, checkpoint_rows)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._token = uuid.uuid4().hex  # Lease holder id of this process
+        self._active: Set[str] = set()  # Jobs a worker of this process is on
+        # job_id -> (monotonic start of this run, processed rows at that point)
+        self._runs: Dict[str, Tuple[float, int]] = {}
+
+    async def start(self):
+        """
+        Starts the workers and picks up jobs left unfinished by stopped processes.
+        """
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self._queue_unfinished()
+        self._tasks.append(asyncio.create_task(self._watch()))
+
+    async def _queue_unfinished(self):
+        """
+        Queues unfinished jobs not running here; the lease decides whether they can be run.
+        """
+        async with AsyncSessionLocal() as db:
+            unfinished = (await db.execute(
+                select(BatchJob.id)
+                .where(BatchJob.status.in_(["queued", "running"]))
+                .order_by(BatchJob.created_at)
+            )).scalars().all()
+        for job_id in unfinished:
+            if job_id not in self._active:
+                self._queue.put_nowait(job_id)
+
+    async def _watch(self):
+        # Finds jobs whose process stopped while this one keeps running
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS)
+            try:
+                await self._queue_unfinished()
+            except Exception as e:
+                logger.error(f"Batch job watcher error: {e}")
+
+    async def _claim(self, db: AsyncSession, job_id: str) -> bool:
+        """
+        Takes the lease on a queued job, a running one whose lease expired, or one this process already holds.
+        """
+        now = datetime.now(timezone.utc)
+        result = await db.execute(
+            update(BatchJob)
+            .where(
+                BatchJob.id == job_id,
+                or_(
+                    BatchJob.status == "queued",
+                    and_(
+                        BatchJob.status == "running",
+                        or_(
+                            BatchJob.claim_token == self._token,
+                            BatchJob.heartbeat_at.is_(None),
+                            BatchJob.heartbeat_at < now - timedelta(seconds=settings.JOB_LEASE_SECONDS)
+                        )
+                    )
+                )
+            )
+            .values(status="running", claim_token=self._token, heartbeat_at=now)
+        )
+        await db.commit()
+        return result.rowcount == 1
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        # Hand interrupted jobs back right away instead of waiting for their lease to run out
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(BatchJob)
+                .where(BatchJob.claim_token == self._token, BatchJob.status == "running")
+                .values(status="queued", claim_token=None, heartbeat_at=None)
+            )
+            await db.commit()
+
+    async def submit(
+        self,
+        db: AsyncSession,
+        content: bytes,
+        filename: Optional[str] = None,
+        input_format: str = "csv"
+    ) -> BatchJob:
+        """
+        Stores the job and its input rows, then queues it for the workers.
+        """
+        # Parsing a large upload is CPU-bound: keep it off the event loop
+        rows = await asyncio.to_thread(extract_rows, content, input_format)
+        job = BatchJob(id=uuid.uuid4().hex, filename=filename, status="queued", total_rows=len(rows))
+        db.add(job)
+        await db.flush()
+        for offset in range(0, len(rows), settings.BATCH_READ_CHUNK_ROWS):
+            await db.execute(insert(BatchJobRow), [
+                {"job_id": job.id, "row_index": offset + i, "phone_number": phone, "country_code": country, "done": False}
+                for i, (phone, country) in enumerate(rows[offset:offset + settings.BATCH_READ_CHUNK_ROWS])
+            ])
+        await db.commit()
+        await db.refresh(job)
+
+        if self._queue is not None:
+            self._queue.put_nowait(job.id)
+        else:
+            logger.warning(f"Job workers not running; job {job.id} will start with the next worker startup")
+        logger.info(f"Submitted batch job {job.id} ({len(rows)} rows)")
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            if job_id in self._active:
+                # Queued twice (submit and the watcher); already running here
+                self._queue.task_done()
+                continue
+            self._active.add(job_id)
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Batch job {job_id} failed: {e}")
+                await self._mark_failed(job_id, str(e))
+            finally:
+                self._active.discard(job_id)
+                self._runs.pop(job_id, None)
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        # Short sessions only: no connection is held while a chunk is being validated
+        async with AsyncSessionLocal() as db:
+            if not await self._claim(db, job_id):
+                # Finished, or running in a live process
+                return
+            job = await db.get(BatchJob, job_id)
+            logger.info(f"Running batch job {job_id} from row {job.processed_rows}")
+            if job.started_at is None:
+                job.started_at = datetime.now(timezone.utc)
+            await db.commit()
+            self._runs[job_id] = (time.monotonic(), job.processed_rows)
+
+        while True:
+            # History is loaded once per block of BATCH_READ_CHUNK_ROWS rows, not per checkpoint
+            async with AsyncSessionLocal() as db:
+                block = (await db.execute(
+                    select(BatchJobRow.id, BatchJobRow.phone_number, BatchJobRow.country_code)
+                    .where(BatchJobRow.job_id == job_id, BatchJobRow.done == False)  # noqa: E712
+                    .order_by(BatchJobRow.row_index)
+                    .limit(settings.BATCH_READ_CHUNK_ROWS)
+                )).all()
+                if not block:
+                    break
+                known, _ = await get_history_many(db, [(row.phone_number, row.country_code) for row in block])
+
+            for offset in range(0, len(block), self.checkpoint_rows):
+                pending = block[offset:offset + self.checkpoint_rows]
+                results, stats = await batch_engine.run(
+                    [(row.phone_number, row.country_code) for row in pending], prefetched=known
+                )
+
+                # Checkpoint: one commit per chunk of rows, only while this process still holds the lease
+                async with AsyncSessionLocal() as db:
+                    if not await self._checkpoint(db, job_id, processed_rows=BatchJob.processed_rows + len(pending),
+                                                  failed_rows=BatchJob.failed_rows + stats.failed_rows):
+                        logger.warning(f"Batch job {job_id} was taken over by another worker; stopping here")
+                        return
+                    await db.execute(update(BatchJobRow), [
+                        {"id": row.id, "result": format_result_row(result), "done": True}
+                        for row, result in zip(pending, results)
+                    ])
+                    await db.commit()
+
+        async with AsyncSessionLocal() as db:
+            if await self._checkpoint(db, job_id, status="completed", finished_at=datetime.now(timezone.utc)):
+                await db.commit()
+                logger.info(f"Batch job {job_id} completed")
+
+    async def _checkpoint(self, db: AsyncSession, job_id: str, **values) -> bool:
+        """
+        Updates the job and renews its lease if this process still holds it; False once another process took it over.
+        """
+        result = await db.execute(
+            update(BatchJob)
+            .where(BatchJob.id == job_id, BatchJob.claim_token == self._token, BatchJob.status == "running")
+            .values(heartbeat_at=datetime.now(timezone.utc), **values)
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            return False
+        return True
+
+    async def _mark_failed(self, job_id: str, error: str):
+        async with AsyncSessionLocal() as db:
+            if await self._checkpoint(db, job_id, status="failed", error=error[:500],
+                                      finished_at=datetime.now(timezone.utc)):
+                await db.commit()
+
+    def progress(self, job: BatchJob) -> Dict[str, Any]:
+        """
+        Rows done, throughput of the current run and estimated time remaining.
+        """
+        rows_per_second = 0.0
+        run = self._runs.get(job.id)
+        if run:
+            started, processed_at_start = run
+            elapsed = time.monotonic() - started
+            if elapsed > 0:
+                rows_per_second = (job.processed_rows - processed_at_start) / elapsed
+        elif job.started_at:
+            # Finished, or running in another worker process (average since it started)
+            started = job.started_at if job.started_at.tzinfo else job.started_at.replace(tzinfo=timezone.utc)
+            finished = job.finished_at or datetime.now(timezone.utc)
+            if finished.tzinfo is None:
+                finished = finished.replace(tzinfo=timezone.utc)
+            elapsed = (finished - started).total_seconds()
+            if elapsed > 0:
+                rows_per_second = job.processed_rows / elapsed
+
+        remaining = max(job.total_rows - job.processed_rows, 0)
+        eta_seconds = None
+        if job.status in ("completed", "failed"):
+            eta_seconds = 0.0
+        elif rows_per_second > 0:
+            eta_seconds = remaining / rows_per_second
+
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "filename": job.filename,
+            "total_rows": job.total_rows,
+            "processed_rows": job.processed_rows,
+            "failed_rows": job.failed_rows,
+            "rows_per_second": round(rows_per_second, 2),
+            "eta_seconds": round(eta_seconds, 1) if eta_seconds is not None else None,
+            "error": job.error,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at
+        }
+
+job_manager = JobManager()
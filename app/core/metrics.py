@@ -0,0 +1,300 @@
+import math
+import time
+from collections import deque, defaultdict
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+class SlidingWindow:
+    """
+    Latency samples and outcomes from the last `window` seconds,
+    capped at `max_samples` (oldest dropped first).
+    """
+
+    def __init__(self, window: float, max_samples: int):
+        self.window = window
+        self._samples: Deque[Tuple[float, float, bool]] = deque(maxlen=max(1, max_samples))
+
+    def observe(self, latency: float, ok: bool):
+        now = time.monotonic()
+        self._samples.append((now, latency, ok))
+        self._prune(now)
+
+    def _prune(self, now: float):
+        cutoff = now - self.window
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def latencies(self) -> List[float]:
+        self._prune(time.monotonic())
+        return [latency for _, latency, _ in self._samples]
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._prune(time.monotonic())
+        latencies = sorted(latency for _, latency, _ in self._samples)
+        count = len(latencies)
+        errors = sum(1 for _, _, ok in self._samples if not ok)
+        return {
+            "count": count,
+            "errors": errors,
+            "error_rate": errors / count if count else 0.0,
+            "mean": sum(latencies) / count if count else 0.0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99)
+        }
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0.0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(q / 100.0 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+class ProviderMetrics:
+    """
+    Per-provider call latency, errors and retries.
+    Sliding windows drive percentiles and error rates; lifetime counters back Prometheus.
+    """
+
+    def __init__(self, window: float = settings.METRICS_WINDOW_SECONDS, max_samples: int = settings.METRICS_WINDOW_MAX_SAMPLES):
+        self.window = window
+        self.max_samples = max_samples
+        self._windows: Dict[str, SlidingWindow] = {}
+        self._retry_windows: Dict[str, Deque[float]] = defaultdict(deque)
+        self.requests_total: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.retries_total: Dict[str, int] = defaultdict(int)
+        self.latency_sum: Dict[str, float] = defaultdict(float)
+
+    def _window(self, provider: str) -> SlidingWindow:
+        if provider not in self._windows:
+            self._windows[provider] = SlidingWindow(self.window, self.max_samples)
+        return self._windows[provider]
+
+    def observe(self, provider: str, latency: float, ok: bool):
+        """One attempt against a provider (each retry counts as its own attempt)."""
+        self._window(provider).observe(latency, ok)
+        self.requests_total[(provider, "success" if ok else "error")] += 1
+        self.latency_sum[provider] += latency
+
+    def record_retry(self, provider: str):
+        now = time.monotonic()
+        retries = self._retry_windows[provider]
+        retries.append(now)
+        while retries and retries[0] < now - self.window:
+            retries.popleft()
+        self.retries_total[provider] += 1
+
+    def percentile(self, provider: str, q: float) -> Optional[float]:
+        latencies = self._window(provider).latencies()
+        return percentile(sorted(latencies), q) if latencies else None
+
+    def snapshot(self, provider: str) -> Dict[str, Any]:
+        snapshot = self._window(provider).snapshot()
+        now = time.monotonic()
+        snapshot["retries"] = sum(1 for t in self._retry_windows[provider] if t >= now - self.window)
+        snapshot["window_seconds"] = self.window
+        return snapshot
+
+    def providers(self) -> List[str]:
+        return sorted(set(self._windows) | set(self.retries_total))
+
+class BatchMetrics:
+    """Throughput counters across all batch runs (CSV, streaming, jobs)."""
+
+    def __init__(self):
+        self.batches_total = 0
+        self.rows_total = 0
+        self.rows_failed_total = 0
+        self.rows_duplicate_total = 0
+        self.seconds_total = 0.0
+        self.last_rows_per_second = 0.0
+
+    def record(self, rows: int, failed: int, duplicates: int, seconds: float, rows_per_second: float):
+        self.batches_total += 1
+        self.rows_total += rows
+        self.rows_failed_total += failed
+        self.rows_duplicate_total += duplicates
+        self.seconds_total += seconds
+        self.last_rows_per_second = rows_per_second
+
+provider_metrics = ProviderMetrics()
+batch_metrics = BatchMetrics()
+
+def _labels(**labels: Any) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+class _PrometheusText:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def metric(self, name: str, kind: str, help_text: str, samples: List[Tuple[Dict[str, Any], float]]):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(**labels)} {float(value):.6g}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+def render_prometheus(
+    cache_stats: Dict[str, Dict[str, Any]],
+    pool_stats: Dict[str, Any],
+    batching_stats: Dict[str, Any],
+    coalescing_stats: Dict[str, Any],
+    circuit_stats: Dict[str, Dict[str, Any]],
+    hedging_stats: Dict[str, Any],
+    rate_limit_stats: Dict[str, Dict[str, Any]]
+) -> str:
+    """
+    Prometheus text exposition of provider, circuit, cache, HTTP pool and batch metrics.
+    """
+    out = _PrometheusText()
+    providers = provider_metrics.providers()
+    snapshots = {p: provider_metrics.snapshot(p) for p in providers}
+
+    # Providers
+    quantiles = []
+    for p in providers:
+        for q in ("p50", "p95", "p99"):
+            quantiles.append(({"provider": p, "quantile": f"0.{q[1:]}"}, snapshots[p][q]))
+    out.metric("whacheck_provider_latency_seconds", "summary",
+               "Provider call latency per attempt (quantiles over the sliding window)", quantiles)
+    out.lines.extend(
+        f"whacheck_provider_latency_seconds_sum{_labels(provider=p)} {provider_metrics.latency_sum[p]:.6g}"
+        for p in providers
+    )
+    out.lines.extend(
+        f"whacheck_provider_latency_seconds_count{_labels(provider=p)} "
+        f"{provider_metrics.requests_total[(p, 'success')] + provider_metrics.requests_total[(p, 'error')]}"
+        for p in providers
+    )
+    out.metric("whacheck_provider_requests_total", "counter", "Provider call attempts by outcome", [
+        ({"provider": p, "outcome": outcome}, count)
+        for (p, outcome), count in sorted(provider_metrics.requests_total.items())
+    ])
+    out.metric("whacheck_provider_retries_total", "counter", "Provider retries scheduled by tenacity", [
+        ({"provider": p}, provider_metrics.retries_total[p]) for p in providers
+    ])
+    out.metric("whacheck_provider_error_ratio", "gauge", "Failed attempts / attempts over the sliding window", [
+        ({"provider": p}, snapshots[p]["error_rate"]) for p in providers
+    ])
+    out.metric("whacheck_provider_window_retries", "gauge", "Retries over the sliding window", [
+        ({"provider": p}, snapshots[p]["retries"]) for p in providers
+    ])
+
+    # Circuit breakers
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    out.metric("whacheck_circuit_state", "gauge", "Circuit state (0 closed, 1 half-open, 2 open)", [
+        ({"provider": p}, states[c["state"]]) for p, c in sorted(circuit_stats.items())
+    ])
+    out.metric("whacheck_circuit_opened_total", "counter", "Times the circuit opened", [
+        ({"provider": p}, c["opened_count"]) for p, c in sorted(circuit_stats.items())
+    ])
+    out.metric("whacheck_circuit_rejected_total", "counter", "Calls rejected by an open circuit", [
+        ({"provider": p}, c["rejected"]) for p, c in sorted(circuit_stats.items())
+    ])
+
+    # Rate limits and quotas
+    out.metric("whacheck_ratelimit_waiting", "gauge", "Calls queued for a rate-limit token by lane", [
+        ({"provider": p, "lane": lane}, count)
+        for p, limits in sorted(rate_limit_stats.items()) for lane, count in sorted(limits["waiting"].items())
+    ])
+    out.metric("whacheck_ratelimit_throttled_total", "counter", "Calls that had to wait for a token", [
+        ({"provider": p}, limits["throttled"]) for p, limits in sorted(rate_limit_stats.items())
+    ])
+    out.metric("whacheck_ratelimit_429_total", "counter", "Rate-limit answers from the provider", [
+        ({"provider": p}, limits["rate_limited"]) for p, limits in sorted(rate_limit_stats.items())
+    ])
+    out.metric("whacheck_quota_used", "gauge", "Provider requests counted against the quota", [
+        ({"provider": p, "period": period}, limits[f"used_{period}"])
+        for p, limits in sorted(rate_limit_stats.items()) for period in ("today", "month")
+    ])
+    out.metric("whacheck_quota_rejected_total", "counter", "Calls rejected with the quota used up", [
+        ({"provider": p}, limits["quota_rejected"]) for p, limits in sorted(rate_limit_stats.items())
+    ])
+
+    # Hedging
+    out.metric("whacheck_hedge_fired_total", "counter", "Hedge requests fired after the learned delay", [
+        ({}, hedging_stats.get("fired", 0))
+    ])
+    out.metric("whacheck_hedge_won_total", "counter", "Hedge requests that answered first", [
+        ({}, hedging_stats.get("won", 0))
+    ])
+    out.metric("whacheck_hedge_budget_exhausted_total", "counter", "Hedges skipped for lack of budget", [
+        ({}, hedging_stats.get("budget_exhausted", 0))
+    ])
+
+    # Cache tiers, then the shared backend behind them (CACHE_BACKEND other than memory)
+    shared_stats = cache_stats.get("shared")
+    tier_stats_by_name = {tier: stats for tier, stats in cache_stats.items() if tier != "shared"}
+    for stat, kind, help_text in (
+        ("hits", "counter", "Cache hits"),
+        ("misses", "counter", "Cache misses"),
+        ("evictions", "counter", "LRU evictions"),
+        ("expirations", "counter", "Entries dropped on expiry"),
+        ("size", "gauge", "Entries currently cached"),
+    ):
+        name = f"whacheck_cache_{stat}" + ("_total" if kind == "counter" else "")
+        out.metric(name, kind, help_text, [
+            ({"tier": tier}, tier_stats[stat]) for tier, tier_stats in tier_stats_by_name.items()
+        ])
+    if shared_stats is not None:
+        backend = {"backend": shared_stats["backend"]}
+        out.metric("whacheck_shared_cache_hits_total", "counter", "Entries found in the shared cache", [
+            (backend, shared_stats["hits"])
+        ])
+        out.metric("whacheck_shared_cache_errors_total", "counter", "Failed shared cache reads and writes", [
+            (backend, shared_stats["errors"])
+        ])
+        out.metric("whacheck_shared_cache_writes_total", "counter", "Entries written to the shared cache", [
+            (backend, shared_stats["records_written"])
+        ])
+        out.metric("whacheck_shared_cache_pending", "gauge", "Entries waiting for the next shared cache write", [
+            (backend, shared_stats["pending"])
+        ])
+
+    # HTTP pool, micro-batching, coalescing
+    out.metric("whacheck_http_pool_in_use", "gauge", "Outbound requests in flight by provider", [
+        ({"provider": p}, usage["in_use"]) for p, usage in pool_stats.get("by_provider", {}).items()
+    ])
+    out.metric("whacheck_http_pool_waiting", "gauge", "Outbound requests waiting for a provider slot", [
+        ({"provider": p}, usage["waiting"]) for p, usage in pool_stats.get("by_provider", {}).items()
+    ])
+    connections = pool_stats.get("connections", {})
+    out.metric("whacheck_http_connections_opened_total", "counter", "Connections opened by the outbound pool", [
+        ({}, connections.get("opened", 0))
+    ])
+    out.metric("whacheck_http_connections_reused_total", "counter", "Outbound requests sent on a kept-alive connection", [
+        ({}, connections.get("reused", 0))
+    ])
+    out.metric("whacheck_http_connections_queued_total", "counter", "Outbound requests that waited for a free pooled connection", [
+        ({}, connections.get("queued", 0))
+    ])
+    out.metric("whacheck_whapi_bulk_requests_total", "counter", "Bulk Whapi requests sent", [
+        ({}, batching_stats.get("batches_sent", 0))
+    ])
+    out.metric("whacheck_whapi_bulk_contacts_total", "counter", "Contacts sent in bulk Whapi requests", [
+        ({}, batching_stats.get("keys_sent", 0))
+    ])
+    out.metric("whacheck_coalesced_calls_total", "counter", "Lookups that joined an identical in-flight call", [
+        ({}, coalescing_stats.get("coalesced", 0))
+    ])
+
+    # Batch throughput
+    out.metric("whacheck_batches_total", "counter", "Batch runs finished", [({}, batch_metrics.batches_total)])
+    out.metric("whacheck_batch_rows_total", "counter", "Batch rows processed", [({}, batch_metrics.rows_total)])
+    out.metric("whacheck_batch_rows_failed_total", "counter", "Batch rows that failed", [
+        ({}, batch_metrics.rows_failed_total)
+    ])
+    out.metric("whacheck_batch_rows_duplicate_total", "counter", "Batch rows repeating a number in the same batch", [
+        ({}, batch_metrics.rows_duplicate_total)
+    ])
+    out.metric("whacheck_batch_seconds_total", "counter", "Wall time spent in batch runs", [
+        ({}, batch_metrics.seconds_total)
+    ])
+    out.metric("whacheck_batch_last_rows_per_second", "gauge", "Throughput of the most recent batch run", [
+        ({}, batch_metrics.last_rows_per_second)
+    ])
+    return out.render()
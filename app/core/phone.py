@@ -0,0 +1,89 @@
+import re
+from functools import lru_cache
+import phonenumbers
+from phonenumbers import carrier, geocoder, PhoneNumberType, PhoneNumberFormat, NumberParseException
+from typing import Dict, Any, Optional
+
+# phonenumbers line types mapped onto NumVerify's vocabulary
+LINE_TYPES = {
+    PhoneNumberType.MOBILE: "mobile",
+    PhoneNumberType.FIXED_LINE: "landline",
+    PhoneNumberType.FIXED_LINE_OR_MOBILE: "landline_or_mobile",
+    PhoneNumberType.TOLL_FREE: "toll_free",
+    PhoneNumberType.PREMIUM_RATE: "premium_rate",
+    PhoneNumberType.SHARED_COST: "special_services",
+    PhoneNumberType.VOIP: "voip",
+    PhoneNumberType.PERSONAL_NUMBER: "personal_number",
+    PhoneNumberType.PAGER: "paging",
+    PhoneNumberType.UAN: "special_services",
+    PhoneNumberType.VOICEMAIL: "special_services",
+    PhoneNumberType.UNKNOWN: "unknown",
+}
+
+def _region(country_code: Optional[str]) -> Optional[str]:
+    region = (country_code or "").strip().upper()
+    return region if region in phonenumbers.SUPPORTED_REGIONS else None
+
+# "14155550100.0": a number column that went through a float (Excel, pandas)
+_FLOAT_SUFFIX = re.compile(r"^(\+?\d+)\.0+$")
+
+def _clean_text(phone_number: str) -> str:
+    text = (phone_number or "").strip()
+    match = _FLOAT_SUFFIX.match(text)
+    return match.group(1) if match else text
+
+def parse_number(phone_number: str, country_code: Optional[str]) -> Dict[str, Any]:
+    """
+    Offline format check with libphonenumber metadata.
+    Returns a dict shaped like a NumVerify response (valid, number, international_format,
+    line_type, carrier, ...) plus 'e164' and source='phonenumbers'.
+    """
+    result = {
+        "valid": False,
+        "number": phone_number,
+        "line_type": "unknown",
+        "carrier": "",
+        "source": "phonenumbers"
+    }
+    try:
+        # Same cleanup as normalize_key: the parse and the history key must agree
+        parsed = phonenumbers.parse(_clean_text(phone_number), _region(country_code))
+    except NumberParseException as e:
+        result["error"] = str(e)
+        return result
+
+    if not phonenumbers.is_valid_number(parsed):
+        result["possible"] = phonenumbers.is_possible_number(parsed)
+        return result
+
+    e164 = phonenumbers.format_number(parsed, PhoneNumberFormat.E164)
+    result.update({
+        "valid": True,
+        "e164": e164,
+        "number": e164.lstrip("+"),
+        "local_format": str(parsed.national_number),
+        "international_format": e164,
+        "country_prefix": f"+{parsed.country_code}",
+        "country_code": phonenumbers.region_code_for_number(parsed),
+        "country_name": geocoder.country_name_for_number(parsed, "en"),
+        "location": geocoder.description_for_number(parsed, "en"),
+        "carrier": carrier.name_for_number(parsed, "en"),
+        "line_type": LINE_TYPES.get(phonenumbers.number_type(parsed), "unknown")
+    })
+    return result
+
+@lru_cache(maxsize=65_536)
+def normalize_key(phone_number: str, country_code: Optional[str] = None) -> str:
+    """
+    Canonical key for a number, used for the history store and every cache:
+    E.164 when it parses, otherwise its digits, otherwise the trimmed text
+    (so inputs without digits do not all share the empty key).
+    """
+    text = _clean_text(phone_number)
+    try:
+        parsed = phonenumbers.parse(text, _region(country_code))
+        if phonenumbers.is_possible_number(parsed):
+            return phonenumbers.format_number(parsed, PhoneNumberFormat.E164)
+    except NumberParseException:
+        pass
+    return re.sub(r"\D", "", text) or f"raw:{text}"
@@ -0,0 +1,317 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.core.logger import logger
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # /validate
+    BATCH = 1  # CSV, streaming and job rows
+
+# Lane of the current request; BatchEngine switches its rows to BATCH
+request_priority: ContextVar[Priority] = ContextVar("request_priority", default=Priority.INTERACTIVE)
+
+class QuotaExceededError(Exception):
+    """Raised instead of calling a provider whose daily or monthly quota is used up."""
+
+class RateLimitedError(Exception):
+    """A provider answered 429; `retry_after` is how long it asked us to wait."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} rate limited, retry after {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+def parse_retry_after(value: Optional[str], default: float = 1.0) -> float:
+    """Retry-After header (delta-seconds or HTTP date) -> seconds."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+class PrioritySemaphore:
+    """
+    Counting semaphore whose waiters are woken in priority order (interactive
+    before batch), FIFO within a lane, like ProviderLimiter's token queue.
+    """
+
+    def __init__(self, value: int):
+        self._value = max(1, value)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    async def acquire(self):
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(request_priority.get()), next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed a slot and cancelled in the same step: pass it on
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+class ProviderLimiter:
+    """
+    Token bucket (`rate` tokens/s, up to `burst` banked) plus daily and monthly
+    request quotas for one provider. Waiters are served in priority order
+    (interactive before batch), FIFO within a lane. A rate or quota of 0 means unlimited.
+    With several worker processes, SharedStateSync gives each its share of the
+    rate and burst and keeps quota usage, pauses and exhaustion in step.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, daily_quota: int = 0, monthly_quota: int = 0):
+        self.name = name
+        self.base_rate = rate
+        self.base_burst = max(1.0, burst)
+        self.workers = 1
+        self.rate = rate
+        self.burst = self.base_burst
+        self.daily_quota = daily_quota
+        self.monthly_quota = monthly_quota
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._day = ""
+        self._month = ""
+        self._exhausted_month = ""
+        self.used_today = 0
+        self.used_month = 0
+        self._unsynced = 0
+        self._publish_block: Optional[float] = None
+        self._publish_exhausted = False
+        self.granted = 0
+        self.throttled = 0
+        self.rate_limited = 0
+        self.quota_rejected = 0
+
+    def _refill(self, now: float):
+        # _updated sits in the future while a Retry-After pause is active
+        if now <= self._updated:
+            return
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _roll_quota_periods(self):
+        now = datetime.now(timezone.utc)
+        day, month = now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+        if day != self._day:
+            self._day, self.used_today = day, 0
+        if month != self._month:
+            self._month, self.used_month = month, 0
+
+    def _check_quota(self):
+        self._roll_quota_periods()
+        if (self.daily_quota and self.used_today >= self.daily_quota) or \
+                (self.monthly_quota and self.used_month >= self.monthly_quota) or \
+                self._exhausted_month == self._month:
+            self.quota_rejected += 1
+            raise QuotaExceededError(f"{self.name} quota exhausted")
+
+    def _take(self, now: float) -> bool:
+        if now < self._blocked_until:
+            return False
+        if self.rate <= 0:
+            return True
+        self._refill(now)
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    def _count_use(self):
+        self.granted += 1
+        self.used_today += 1
+        self.used_month += 1
+        self._unsynced += 1
+
+    async def acquire(self):
+        """
+        Waits for a token in the caller's priority lane and counts the request against the quotas.
+        """
+        self._check_quota()
+        if not self._waiters and self._take(time.monotonic()):
+            self._count_use()
+            return
+
+        self.throttled += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(request_priority.get()), next(self._seq), future))
+        self._dispatch()
+        await future
+        # The quota may have run out while this caller was queued
+        self._check_quota()
+        self._count_use()
+
+    def _dispatch(self):
+        self._timer = None
+        now = time.monotonic()
+        while self._waiters:
+            future = self._waiters[0][2]
+            if future.done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if not self._take(now):
+                break
+            heapq.heappop(self._waiters)
+            future.set_result(None)
+
+        if self._waiters and self._timer is None:
+            if now < self._blocked_until:
+                delay = self._blocked_until - now
+            else:
+                delay = max(0.0, (1.0 - self._tokens) / self.rate) if self.rate > 0 else 0.0
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def block(self, seconds: float):
+        """
+        Honors Retry-After: no request is let through for `seconds`, and the bucket restarts empty.
+        """
+        self.rate_limited += 1
+        self._publish_block = max(self._publish_block or 0.0, time.time() + seconds)
+        logger.warning(f"{self.name} rate limited; pausing calls for {seconds:.1f}s")
+        self._pause(seconds)
+
+    def _pause(self, seconds: float):
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._blocked_until
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._waiters:
+            self._dispatch()
+
+    def exhaust_quota(self):
+        """
+        The provider reported its monthly quota as used up: reject calls until the month rolls over.
+        """
+        self._roll_quota_periods()
+        self._exhausted_month = self._month
+        self._publish_exhausted = True
+        logger.error(f"{self.name} reported its quota as exhausted for {self._month}")
+
+    def set_share(self, workers: int):
+        """
+        Runs at 1/`workers` of the configured rate and burst, so the workers together stay within them.
+        """
+        workers = max(1, workers)
+        if workers == self.workers:
+            return
+        self._refill(time.monotonic())
+        self.workers = workers
+        self.rate = self.base_rate / workers
+        self.burst = max(1.0, self.base_burst / workers)
+        self._tokens = min(self._tokens, self.burst)
+
+    def periods(self) -> Tuple[str, str]:
+        """Current (UTC day, UTC month) quota periods."""
+        self._roll_quota_periods()
+        return self._day, self._month
+
+    def take_unsynced(self) -> int:
+        """Requests granted since the last call, to be added to the shared quota counters."""
+        used, self._unsynced = self._unsynced, 0
+        return used
+
+    def restore_unsynced(self, used: int):
+        """Puts back usage taken by take_unsynced() that could not be published."""
+        self._unsynced += used
+
+    def sync_usage(self, used_today: int, used_month: int):
+        """Adopts the quota usage summed over all workers."""
+        self._roll_quota_periods()
+        self.used_today = used_today + self._unsynced
+        self.used_month = used_month + self._unsynced
+
+    def take_published(self) -> Tuple[Optional[float], bool]:
+        """
+        (wall-clock end of a Retry-After pause, quota exhausted) seen here since the last call.
+        """
+        block, exhausted = self._publish_block, self._publish_exhausted
+        self._publish_block, self._publish_exhausted = None, False
+        return block, exhausted
+
+    def adopt_block(self, until: float):
+        """Applies a Retry-After pause another worker was given (wall-clock end)."""
+        remaining = until - time.time()
+        if remaining > self._blocked_until - time.monotonic() + 0.05:
+            logger.warning(f"{self.name} rate limited on another worker; pausing calls for {remaining:.1f}s")
+            self._pause(remaining)
+
+    def adopt_exhausted(self):
+        """Applies a quota exhaustion another worker was told about."""
+        self._roll_quota_periods()
+        if self._exhausted_month != self._month:
+            self._exhausted_month = self._month
+            logger.error(f"{self.name} quota exhausted for {self._month} (reported on another worker)")
+
+    def stats(self) -> Dict[str, Any]:
+        self._roll_quota_periods()
+        self._refill(time.monotonic())
+        waiting = {lane.name.lower(): 0 for lane in Priority}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                waiting[Priority(priority).name.lower()] += 1
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "workers": self.workers,
+            "tokens": round(max(self._tokens, 0.0), 2),
+            "blocked_for": round(max(0.0, self._blocked_until - time.monotonic()), 2),
+            "waiting": waiting,
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "rate_limited": self.rate_limited,
+            "quota_rejected": self.quota_rejected,
+            "used_today": self.used_today,
+            "daily_quota": self.daily_quota,
+            "used_month": self.used_month,
+            "monthly_quota": self.monthly_quota
+        }
+
+rate_limiters: Dict[str, ProviderLimiter] = {
+    "numverify": ProviderLimiter(
+        "numverify",
+        settings.NUMVERIFY_RATE_PER_SECOND,
+        settings.NUMVERIFY_BURST,
+        settings.NUMVERIFY_DAILY_QUOTA,
+        settings.NUMVERIFY_MONTHLY_QUOTA
+    ),
+    "whapi": ProviderLimiter(
+        "whapi",
+        settings.WHAPI_RATE_PER_SECOND,
+        settings.WHAPI_BURST,
+        settings.WHAPI_DAILY_QUOTA,
+        settings.WHAPI_MONTHLY_QUOTA
+    ),
+}
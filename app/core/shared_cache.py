@@ -0,0 +1,292 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.write_behind import WriteBehindBuffer
+
+class SharedBackend(ABC):
+    """
+    Key/value store shared by worker processes. Values are bytes and every
+    key expires after its TTL. Keys are namespaced with SHARED_KEY_PREFIX.
+    """
+
+    def __init__(self, prefix: str = settings.SHARED_KEY_PREFIX):
+        self.prefix = prefix
+
+    @abstractmethod
+    async def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        ...
+
+    @abstractmethod
+    async def set_many(self, items: Dict[str, Tuple[bytes, float]]):
+        """items: key -> (value, ttl seconds)"""
+        ...
+
+    @abstractmethod
+    async def delete_many(self, keys: List[str]):
+        ...
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int, ttl: float) -> int:
+        """Atomically adds `amount` to an integer counter and returns the new total."""
+        ...
+
+    @abstractmethod
+    async def count(self, prefix: str) -> int:
+        """Live keys starting with `prefix`."""
+        ...
+
+    async def close(self):
+        pass
+
+class SQLiteBackend(SharedBackend):
+    """
+    A SQLite file shared by the worker processes of one host, in WAL mode and
+    memory-mapped so reads mostly come straight from the page cache.
+    Calls run in a thread on one connection per process.
+    """
+
+    # Expired rows are purged every this many writes
+    PURGE_EVERY = 1000
+
+    def __init__(self, path: str = settings.CACHE_SQLITE_PATH, prefix: str = settings.SHARED_KEY_PREFIX):
+        super().__init__(prefix)
+        self.path = path
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+        self._conn.execute(f"PRAGMA mmap_size={settings.CACHE_SQLITE_MMAP_BYTES}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS shared_cache "
+            "(key TEXT PRIMARY KEY, value BLOB, expires_at REAL) WITHOUT ROWID"
+        )
+
+    async def _call(self, fn, *args):
+        def locked():
+            with self._lock:
+                return fn(*args)
+        return await asyncio.to_thread(locked)
+
+    def _get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), 500):
+            chunk = [self.prefix + key for key in keys[start:start + 500]]
+            rows = self._conn.execute(
+                f"SELECT key, value FROM shared_cache WHERE key IN ({','.join('?' * len(chunk))}) AND expires_at > ?",
+                chunk + [now]
+            )
+            for key, value in rows:
+                found[key[len(self.prefix):]] = value
+        return found
+
+    def _set_many(self, items: Dict[str, Tuple[bytes, float]]):
+        now = time.time()
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO shared_cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                [(self.prefix + key, value, now + ttl) for key, (value, ttl) in items.items()]
+            )
+        self._writes += len(items)
+        if self._writes >= self.PURGE_EVERY:
+            self._writes = 0
+            self._conn.execute("DELETE FROM shared_cache WHERE expires_at <= ?", (now,))
+
+    def _delete_many(self, keys: List[str]):
+        self._conn.executemany("DELETE FROM shared_cache WHERE key = ?", [(self.prefix + key,) for key in keys])
+
+    def _incr(self, key: str, amount: int, ttl: float) -> int:
+        now = time.time()
+        row = self._conn.execute(
+            "INSERT INTO shared_cache (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            " value = CASE WHEN expires_at > ? THEN CAST(value AS INTEGER) + excluded.value ELSE excluded.value END,"
+            " expires_at = CASE WHEN expires_at > ? THEN expires_at ELSE excluded.expires_at END "
+            "RETURNING value",
+            (self.prefix + key, amount, now + ttl, now, now)
+        ).fetchone()
+        return int(row[0])
+
+    def _count(self, prefix: str) -> int:
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM shared_cache WHERE key >= ? AND key < ? AND expires_at > ?",
+            (self.prefix + prefix, self.prefix + prefix + "￿", time.time())
+        ).fetchone()[0]
+
+    async def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        return await self._call(self._get_many, keys) if keys else {}
+
+    async def set_many(self, items: Dict[str, Tuple[bytes, float]]):
+        if items:
+            await self._call(self._set_many, items)
+
+    async def delete_many(self, keys: List[str]):
+        if keys:
+            await self._call(self._delete_many, keys)
+
+    async def incr(self, key: str, amount: int, ttl: float) -> int:
+        return await self._call(self._incr, key, amount, ttl)
+
+    async def count(self, prefix: str) -> int:
+        return await self._call(self._count, prefix)
+
+    async def close(self):
+        await self._call(self._conn.close)
+
+class RedisBackend(SharedBackend):
+    """
+    A Redis-compatible server (Redis, Valkey, KeyDB, ...) shared by workers on any number of hosts.
+    """
+
+    def __init__(self, url: str = settings.REDIS_URL, prefix: str = settings.SHARED_KEY_PREFIX):
+        super().__init__(prefix)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis needs the redis package (pip install redis)") from e
+        self._redis = redis.from_url(url)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        if not keys:
+            return {}
+        values = await self._redis.mget([self.prefix + key for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    async def set_many(self, items: Dict[str, Tuple[bytes, float]]):
+        if not items:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key, (value, ttl) in items.items():
+                pipe.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+            await pipe.execute()
+
+    async def delete_many(self, keys: List[str]):
+        if keys:
+            await self._redis.delete(*[self.prefix + key for key in keys])
+
+    async def incr(self, key: str, amount: int, ttl: float) -> int:
+        total = await self._redis.incrby(self.prefix + key, amount)
+        if total == amount:
+            # First increment created the counter
+            await self._redis.pexpire(self.prefix + key, max(1, int(ttl * 1000)))
+        return int(total)
+
+    async def count(self, prefix: str) -> int:
+        live = 0
+        async for _ in self._redis.scan_iter(match=f"{self.prefix}{prefix}*", count=500):
+            live += 1
+        return live
+
+    async def close(self):
+        await self._redis.aclose()
+
+def create_backend(name: str = settings.CACHE_BACKEND) -> Optional[SharedBackend]:
+    """
+    CACHE_BACKEND -> backend; "memory" keeps every cache and limiter per process (None).
+    """
+    name = name.lower()
+    if name == "memory":
+        return None
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "redis":
+        return RedisBackend()
+    raise ValueError(f"Unknown CACHE_BACKEND '{name}', expected memory, sqlite or redis")
+
+def _tier_key(tier: str, key: Hashable) -> str:
+    parts = key if isinstance(key, tuple) else (key,)
+    return f"cache:{tier}:" + ":".join(str(part) for part in parts)
+
+def _json_default(value: Any) -> Any:
+    # Pydantic models (history snapshots) go out as plain JSON; the tier decodes them back
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+class SharedCache(WriteBehindBuffer):
+    """
+    Second cache level behind the in-process TTLCache tiers. Values are stored
+    as JSON with their expiry (never pickled: anyone who can write to the
+    backend could otherwise run code in every worker); writes and invalidations
+    are sent to the backend in batches every SHARED_CACHE_FLUSH_INTERVAL. The
+    cache is best effort: a backend error is logged and the entries are
+    dropped, never retried.
+    """
+
+    def __init__(self, backend: SharedBackend):
+        super().__init__("SharedCache", max_size=500, interval=settings.SHARED_CACHE_FLUSH_INTERVAL)
+        self.backend = backend
+        self.hits = 0
+        self.errors = 0
+
+    def put(self, tier: str, key: Hashable, value: Any, ttl: float):
+        shared_key = _tier_key(tier, key)
+        try:
+            blob = json.dumps([value, time.time() + ttl], default=_json_default).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            self.errors += 1
+            logger.error(f"Shared cache entry {shared_key} not stored: {e}")
+            return
+        self.add(shared_key, (shared_key, blob, ttl))
+
+    def delete(self, tier: str, key: Hashable):
+        shared_key = _tier_key(tier, key)
+        self.add(shared_key, (shared_key, None, 0.0))
+
+    async def fetch(
+        self,
+        tier: str,
+        keys: List[Hashable],
+        decode: Optional[Callable[[Any], Any]] = None
+    ) -> Dict[Hashable, Tuple[Any, float]]:
+        """
+        {key: (value, seconds left)} for the keys another worker has cached.
+        `decode` turns a stored JSON value back into the tier's value type.
+        """
+        shared_keys = {_tier_key(tier, key): key for key in keys}
+        try:
+            found = await self.backend.get_many(list(shared_keys))
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Shared cache read failed: {e}")
+            return {}
+        now = time.time()
+        values = {}
+        for shared_key, blob in found.items():
+            try:
+                value, expires_at = json.loads(blob)
+                if expires_at > now:
+                    values[shared_keys[shared_key]] = (decode(value) if decode else value, expires_at - now)
+            except (TypeError, ValueError) as e:
+                # Written by an incompatible version, or not by us at all
+                self.errors += 1
+                logger.error(f"Shared cache entry {shared_key} ignored: {e}")
+        self.hits += len(values)
+        return values
+
+    async def _write(self, records: List[Tuple[str, Optional[bytes], float]]):
+        try:
+            await self.backend.set_many({key: (blob, ttl) for key, blob, ttl in records if blob is not None})
+            await self.backend.delete_many([key for key, blob, _ in records if blob is None])
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Shared cache write of {len(records)} entries failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "errors": self.errors
+        }
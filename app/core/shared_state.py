@@ -0,0 +1,173 @@
+import asyncio
+import os
+import socket
+import time
+from typing import Any, Dict, Optional
+from sqlalchemy import select, tuple_
+from app.core.circuit import breakers
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, insert_for_dialect
+from app.core.logger import logger
+from app.core.ratelimit import rate_limiters
+from app.core.shared_cache import SharedBackend
+from app.db.models import ProviderQuotaUsage
+
+# Identifies this process among the workers sharing the backend
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Counter lifetimes, a little past the period they count
+DAY_TTL = 2 * 86_400.0
+MONTH_TTL = 32 * 86_400.0
+
+class SharedStateSync:
+    """
+    Keeps the per-process provider state of worker processes in step through
+    the shared backend, every SHARED_STATE_SYNC_INTERVAL seconds:
+    - each worker heartbeats; with N alive, limiters run at 1/N of the configured rate and burst,
+    - quota usage is summed across workers in per-day / per-month counters,
+    - a Retry-After pause, an exhausted quota or an opened circuit on one worker is adopted by all.
+    Coordination is eventual: other workers follow within one interval.
+    Without a shared backend (CACHE_BACKEND=memory) only quota usage is synced,
+    through the provider_quota_usage table, so restarts do not reset it.
+    """
+
+    def __init__(self, interval: float = settings.SHARED_STATE_SYNC_INTERVAL):
+        self.interval = interval
+        self.backend: Optional[SharedBackend] = None
+        self.workers = 1
+        self.syncs = 0
+        self.errors = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, backend: Optional[SharedBackend]):
+        """
+        Starts syncing through `backend`; with None (CACHE_BACKEND=memory) every worker keeps
+        its own limits and circuits, and quota usage is synced through the database.
+        """
+        if self._task is not None:
+            return
+        self.backend = backend
+        await self._sync_safely()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            # Publish the last quota usage and leave the worker count
+            await self.sync_once()
+            if self.backend is not None:
+                await self.backend.delete_many([f"worker:{WORKER_ID}"])
+        except Exception as e:
+            logger.error(f"Shared state sync on shutdown failed: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._sync_safely()
+
+    async def _sync_safely(self):
+        try:
+            await self.sync_once()
+        except Exception as e:
+            # Limiters keep their last share and counts until the backend is back
+            self.errors += 1
+            logger.error(f"Shared state sync failed: {e}")
+
+    async def sync_once(self):
+        backend = self.backend
+        if backend is None:
+            await self._sync_quota_usage()
+            self.syncs += 1
+            return
+        now = time.time()
+        await backend.set_many({f"worker:{WORKER_ID}": (b"1", self.interval * 3)})
+        self.workers = max(1, await backend.count("worker:"))
+
+        publish: Dict[str, Any] = {}
+        watched = []
+        for name, limiter in rate_limiters.items():
+            limiter.set_share(self.workers)
+            day, month = limiter.periods()
+            used = limiter.take_unsynced()
+            try:
+                limiter.sync_usage(
+                    await backend.incr(f"quota:{name}:{day}", used, DAY_TTL),
+                    await backend.incr(f"quota:{name}:{month}", used, MONTH_TTL)
+                )
+            except Exception:
+                limiter.restore_unsynced(used)
+                raise
+            block, exhausted = limiter.take_published()
+            if block is not None and block > now:
+                publish[f"block:{name}"] = (str(block).encode(), block - now)
+            if exhausted:
+                publish[f"exhausted:{name}:{month}"] = (b"1", MONTH_TTL)
+            watched += [f"block:{name}", f"exhausted:{name}:{month}"]
+        for name, breaker in breakers.items():
+            opened = breaker.take_opened()
+            if opened is not None:
+                publish[f"circuit:{name}"] = (str(opened).encode(), breaker.recovery_timeout)
+            watched.append(f"circuit:{name}")
+        await backend.set_many(publish)
+
+        shared = await backend.get_many(watched)
+        for name, limiter in rate_limiters.items():
+            if f"block:{name}" in shared:
+                limiter.adopt_block(float(shared[f"block:{name}"]))
+            if f"exhausted:{name}:{limiter.periods()[1]}" in shared:
+                limiter.adopt_exhausted()
+        for name, breaker in breakers.items():
+            if f"circuit:{name}" in shared:
+                breaker.adopt_open(float(shared[f"circuit:{name}"]))
+        self.syncs += 1
+
+    async def _sync_quota_usage(self):
+        """
+        Adds the usage granted since the last sync to the per-day and per-month
+        provider_quota_usage rows and adopts their totals (summed over every
+        worker using the database, and kept across restarts).
+        """
+        insert = insert_for_dialect()
+        taken = {name: limiter.take_unsynced() for name, limiter in rate_limiters.items()}
+        periods = {name: limiter.periods() for name, limiter in rate_limiters.items()}
+        try:
+            async with AsyncSessionLocal() as db:
+                for name, used in taken.items():
+                    if not used:
+                        continue
+                    for period in periods[name]:
+                        stmt = insert(ProviderQuotaUsage).values(provider_name=name, period=period, used=used)
+                        await db.execute(stmt.on_conflict_do_update(
+                            index_elements=[ProviderQuotaUsage.provider_name, ProviderQuotaUsage.period],
+                            set_={"used": ProviderQuotaUsage.used + stmt.excluded.used}
+                        ))
+                totals = dict(((name, period), used) for name, period, used in (await db.execute(
+                    select(ProviderQuotaUsage.provider_name, ProviderQuotaUsage.period, ProviderQuotaUsage.used)
+                    .where(tuple_(ProviderQuotaUsage.provider_name, ProviderQuotaUsage.period).in_(
+                        [(name, period) for name in periods for period in periods[name]]
+                    ))
+                )).all())
+                await db.commit()
+        except Exception:
+            for name, used in taken.items():
+                rate_limiters[name].restore_unsynced(used)
+            raise
+        for name, limiter in rate_limiters.items():
+            day, month = periods[name]
+            limiter.sync_usage(totals.get((name, day), 0), totals.get((name, month), 0))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._task is not None,
+            "quota_usage": "database" if self.backend is None else "shared backend",
+            "worker_id": WORKER_ID,
+            "workers": self.workers,
+            "syncs": self.syncs,
+            "errors": self.errors
+        }
+
+shared_state = SharedStateSync()
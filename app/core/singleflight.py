@@ -0,0 +1,52 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+class CoalescedTally:
+    """Calls that joined an in-flight call, counted for one caller (e.g. one batch) rather than process-wide."""
+
+    def __init__(self):
+        self.count = 0
+
+# Set by a caller to count its own coalesced calls; tasks it starts inherit it
+coalesced_tally: ContextVar[Optional[CoalescedTally]] = ContextVar("coalesced_tally", default=None)
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    work, later callers await the same in-flight task instead of repeating it.
+    The work runs as its own task, so a cancelled caller doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+            tally = coalesced_tally.get()
+            if tally is not None:
+                tally.count += 1
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.shared,
+            "in_flight": len(self._inflight)
+        }
@@ -0,0 +1,113 @@
+import asyncio
+import itertools
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Hashable, Optional
+from app.core.config import settings
+from app.core.logger import logger
+
+class WriteBehindBuffer(ABC):
+    """
+    Collects records in memory and writes them in one transaction per flush.
+    A flush happens every `interval` seconds, as soon as `max_size` records
+    are pending, and on stop(). Records with the same key are combined by
+    _merge() (latest wins by default). Subclasses implement _write().
+    Records of a failed flush are kept for the next one, but at most
+    `max_pending` records are held: beyond that the oldest are dropped
+    (counted in `dropped`), so a database outage cannot exhaust memory.
+    """
+
+    def __init__(self, name: str, max_size: int, interval: float, max_pending: int = settings.WRITE_BEHIND_MAX_PENDING):
+        self.name = name
+        self.max_size = max(1, max_size)
+        self.max_pending = max(self.max_size, max_pending)
+        self.interval = interval
+        self._buffer: Dict[Hashable, Any] = {}
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.records_written = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def add(self, key: Hashable, record: Any):
+        existing = self._buffer.get(key)
+        self._buffer[key] = record if existing is None else self._merge(existing, record)
+        if len(self._buffer) > self.max_pending:
+            self._drop_oldest()
+        if len(self._buffer) >= self.max_size:
+            self._schedule_flush()
+
+    def _drop_oldest(self):
+        # Dicts keep insertion order: the first keys are the oldest records
+        excess = len(self._buffer) - self.max_pending
+        for key in list(itertools.islice(self._buffer, excess)):
+            del self._buffer[key]
+        self.dropped += excess
+        logger.warning(f"{self.name} holds more than {self.max_pending} unwritten records; dropped the {excess} oldest")
+
+    def _schedule_flush(self):
+        if self._size_flush is not None and not self._size_flush.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._size_flush = loop.create_task(self.flush())
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"{self.name} flush loop error: {e}")
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._buffer:
+                return
+            records, self._buffer = self._buffer, {}
+            try:
+                await self._write(list(records.values()))
+                self.flushes += 1
+                self.records_written += len(records)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"{self.name} flush of {len(records)} records failed: {e}")
+                # Put them back ahead of anything that arrived meanwhile (combined with it)
+                for key, newer in self._buffer.items():
+                    existing = records.get(key)
+                    records[key] = newer if existing is None else self._merge(existing, newer)
+                self._buffer = records
+                if len(self._buffer) > self.max_pending:
+                    self._drop_oldest()
+
+    def _merge(self, existing: Any, record: Any) -> Any:
+        return record
+
+    @abstractmethod
+    async def _write(self, records: list):
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._buffer),
+            "flushes": self.flushes,
+            "records_written": self.records_written,
+            "failures": self.failures,
+            "dropped": self.dropped
+        }
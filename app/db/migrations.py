@@ -0,0 +1,189 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+from app.core.logger import logger
+from app.core.phone import normalize_key
+
+# pg_advisory_lock key held while migrating, so concurrent workers migrate one at a time
+PG_LOCK_ID = 0x77686163  # "whac"
+
+# Rows per UPDATE batch while backfilling keys
+BACKFILL_CHUNK_SIZE = 1000
+
+def _backfill_phone_keys(conn: Connection, table: str) -> int:
+    """Computes phone_key for rows that have none; returns the number of rows updated."""
+    rows = conn.execute(
+        text(f"SELECT id, phone_number, country_code FROM {table} WHERE phone_key IS NULL")
+    ).all()
+    updates = [
+        {"id": row.id, "phone_key": normalize_key(row.phone_number or "", row.country_code)}
+        for row in rows
+    ]
+    for start in range(0, len(updates), BACKFILL_CHUNK_SIZE):
+        conn.execute(
+            text(f"UPDATE {table} SET phone_key = :phone_key WHERE id = :id"),
+            updates[start:start + BACKFILL_CHUNK_SIZE]
+        )
+    return len(updates)
+
+def _add_phone_key(conn: Connection, table: str):
+    columns = {column["name"] for column in inspect(conn).get_columns(table)}
+    if "phone_key" not in columns:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN phone_key VARCHAR"))
+        logger.info(f"Added {table}.phone_key")
+    backfilled = _backfill_phone_keys(conn, table)
+    if backfilled:
+        logger.info(f"Backfilled phone_key for {backfilled} {table} rows")
+
+def _history_phone_key(conn: Connection):
+    """
+    validation_history used the raw phone_number as its unique key, so spellings
+    of one number ("+1 (415) 555-0100", "14155550100", "14155550100.0") became
+    separate rows. Adds the canonical phone_key, keeps the most recently
+    validated row per key and moves the unique index onto phone_key.
+    """
+    _add_phone_key(conn, "validation_history")
+    indexes = {index["name"]: index for index in inspect(conn).get_indexes("validation_history")}
+    if "ix_validation_history_phone_key" in indexes:
+        return
+
+    deleted = conn.execute(text(
+        "DELETE FROM validation_history WHERE id NOT IN ("
+        " SELECT id FROM ("
+        "  SELECT id, ROW_NUMBER() OVER ("
+        "   PARTITION BY phone_key"
+        "   ORDER BY last_validated IS NULL, last_validated DESC, id DESC"
+        "  ) AS key_rank FROM validation_history"
+        " ) AS ranked WHERE ranked.key_rank = 1"
+        ")"
+    )).rowcount
+    if deleted:
+        logger.info(f"Removed {deleted} duplicate validation_history rows")
+
+    phone_index = indexes.get("ix_validation_history_phone_number")
+    if phone_index is not None and phone_index["unique"]:
+        conn.execute(text("DROP INDEX ix_validation_history_phone_number"))
+        phone_index = None
+    if phone_index is None:
+        conn.execute(text("CREATE INDEX ix_validation_history_phone_number ON validation_history (phone_number)"))
+    conn.execute(text("CREATE UNIQUE INDEX ix_validation_history_phone_key ON validation_history (phone_key)"))
+
+def _deferred_phone_key(conn: Connection):
+    _add_phone_key(conn, "deferred_validations")
+    indexes = {index["name"] for index in inspect(conn).get_indexes("deferred_validations")}
+    if "ix_deferred_validations_phone_key" not in indexes:
+        conn.execute(text("CREATE INDEX ix_deferred_validations_phone_key ON deferred_validations (phone_key)"))
+
+def _deferred_waiting_unique(conn: Connection):
+    """
+    At most one queued / running entry per number, enforced by a partial unique
+    index. Older duplicates (from racing enqueues) are failed, keeping the most
+    urgent, oldest entry of each number.
+    """
+    indexes = {index["name"] for index in inspect(conn).get_indexes("deferred_validations")}
+    if "ix_deferred_validations_waiting_key" in indexes:
+        return
+    duplicates = conn.execute(text(
+        "UPDATE deferred_validations SET status = 'failed', error = 'Duplicate queue entry'"
+        " WHERE id IN ("
+        "  SELECT id FROM ("
+        "   SELECT id, ROW_NUMBER() OVER ("
+        "    PARTITION BY phone_key ORDER BY priority, created_at, id"
+        "   ) AS key_rank FROM deferred_validations WHERE status IN ('queued', 'running')"
+        "  ) AS ranked WHERE ranked.key_rank > 1"
+        " )"
+    )).rowcount
+    if duplicates:
+        logger.info(f"Failed {duplicates} duplicate deferred_validations entries")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX ix_deferred_validations_waiting_key ON deferred_validations (phone_key)"
+        " WHERE status IN ('queued', 'running')"
+    ))
+
+def _add_columns(conn: Connection, table: str, columns: dict):
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    for name, ddl_type in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+            logger.info(f"Added {table}.{name}")
+
+def _lease_columns(conn: Connection):
+    """Claim leases that let several worker processes share the queues."""
+    timestamp = "TIMESTAMP WITH TIME ZONE" if conn.dialect.name == "postgresql" else "DATETIME"
+    _add_columns(conn, "deferred_validations", {"claim_token": "VARCHAR", "claimed_at": timestamp})
+    _add_columns(conn, "batch_jobs", {"claim_token": "VARCHAR", "heartbeat_at": timestamp})
+
+def upgrade(engine: Engine):
+    """
+    Brings tables created by older versions up to the current models.
+    Every step is idempotent and a no-op on a freshly created schema.
+    """
+    with engine.begin() as conn:
+        _history_phone_key(conn)
+        _deferred_phone_key(conn)
+        _lease_columns(conn)
+        _deferred_waiting_unique(conn)
+
+@contextmanager
+def _migration_lock(engine: Engine) -> Iterator[None]:
+    """
+    Serializes migrations across processes: a Postgres advisory lock, or an
+    exclusive lock on a file next to the SQLite database.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": PG_LOCK_ID})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": PG_LOCK_ID})
+        return
+
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or not database or database == ":memory:":
+        yield
+        return
+    with open(f"{database}.migrate.lock", "a+b") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            # LK_LOCK retries for about 10 seconds; loop until the other process is done
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def migrate(engine: Engine):
+    """
+    Creates missing tables, then upgrades ones created by older versions.
+    Safe to run from several worker processes at once: they take turns, and
+    everyone after the first finds nothing to do.
+    """
+    from app.core.database import Base
+    import app.db.models  # noqa: F401  registers the tables on Base.metadata
+
+    with _migration_lock(engine):
+        Base.metadata.create_all(bind=engine)
+        upgrade(engine)
+
+if __name__ == "__main__":
+    # python -m app.db.migrations (run once before starting workers with AUTO_MIGRATE=false)
+    from app.core.database import engine
+    migrate(engine)
+    logger.info(f"Schema is up to date ({engine.url.render_as_string(hide_password=True)})")
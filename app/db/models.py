@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, JSON, ForeignKey, Index, text
 from sqlalchemy.sql import func
 from app.core.database import Base
 
@@ -6,7 +6,8 @@ class ValidationHistory(Base):
     __tablename__ = "validation_history"
 
     id = Column(Integer, primary_key=True, index=True)
-    phone_number = Column(String, index=True, unique=True)
+    phone_key = Column(String, index=True, unique=True)  # phone.normalize_key (E.164), the lookup / upsert key
+    phone_number = Column(String, index=True)  # As last sent by a client
     country_code = Column(String)
     is_valid = Column(Boolean)
     carrier = Column(String, nullable=True)
@@ -16,6 +17,23 @@ class ValidationHistory(Base):
     last_validated = Column(DateTime(timezone=True), server_default=func.now())
     meta_data = Column(JSON, nullable=True)
 
+class FormatLookup(Base):
+    __tablename__ = "format_lookups"
+
+    # NumVerify results for valid numbers, see core.format_store
+    phone_key = Column(String, primary_key=True)  # phone.normalize_key (E.164)
+    country_code = Column(String, primary_key=True)  # Country hint of the lookup, upper case, "" if none
+    number = Column(String)
+    local_format = Column(String, nullable=True)
+    international_format = Column(String, nullable=True)
+    country_prefix = Column(String, nullable=True)
+    region = Column(String, nullable=True)  # NumVerify's country_code for the number
+    country_name = Column(String, nullable=True)
+    location = Column(String, nullable=True)
+    carrier = Column(String, nullable=True)
+    line_type = Column(String, nullable=True)
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class AgentDecision(Base):
     __tablename__ = "agent_decisions"
 
@@ -34,3 +52,73 @@ class ProviderHealth(Base):
     failure_count = Column(Integer, default=0)
     avg_response_time = Column(Float, default=0.0)
     last_updated = Column(DateTime(timezone=True), onupdate=func.now())
+
+class ProviderQuotaUsage(Base):
+    __tablename__ = "provider_quota_usage"
+
+    provider_name = Column(String, primary_key=True)
+    period = Column(String, primary_key=True)  # UTC day (YYYY-MM-DD) or month (YYYY-MM)
+    used = Column(Integer, default=0)
+
+# DeferredValidation priorities, lower drains first
+PRIORITY_REQUEST = 100  # /validate deferred a standard-priority market
+PRIORITY_REFRESH = 200  # Background re-validation of stale history
+WAITING_STATUSES = ("queued", "running")  # A number has at most one deferred entry in these
+
+class DeferredValidation(Base):
+    __tablename__ = "deferred_validations"
+    __table_args__ = (
+        Index("ix_deferred_validations_claim", "status", "priority", "created_at"),
+        # Enqueue is INSERT ... ON CONFLICT DO NOTHING against this index
+        Index(
+            "ix_deferred_validations_waiting_key", "phone_key", unique=True,
+            sqlite_where=text("status IN ('queued', 'running')"),
+            postgresql_where=text("status IN ('queued', 'running')")
+        ),
+    )
+
+    id = Column(String, primary_key=True, index=True)  # uuid4 hex, returned as deferred_id
+    phone_key = Column(String, index=True)  # phone.normalize_key, used to skip numbers already queued
+    phone_number = Column(String)
+    country_code = Column(String)
+    priority = Column(Integer, default=PRIORITY_REQUEST)  # Lower is drained first
+    status = Column(String, default="queued")  # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    not_before = Column(DateTime(timezone=True), nullable=True)  # Retry backoff
+    claim_token = Column(String, nullable=True)  # Set by the worker that claimed the entry
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # Lease start, see DEFERRED_LEASE_SECONDS
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class BatchJob(Base):
+    __tablename__ = "batch_jobs"
+
+    id = Column(String, primary_key=True, index=True)  # uuid4 hex
+    filename = Column(String, nullable=True)
+    status = Column(String, default="queued")  # queued, running, completed, failed
+    total_rows = Column(Integer, default=0)
+    processed_rows = Column(Integer, default=0)
+    failed_rows = Column(Integer, default=0)
+    error = Column(String, nullable=True)
+    claim_token = Column(String, nullable=True)  # Set by the worker process running the job
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # Last checkpoint, see JOB_LEASE_SECONDS
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+class BatchJobRow(Base):
+    __tablename__ = "batch_job_rows"
+    __table_args__ = (
+        Index("ix_batch_job_rows_job_row", "job_id", "row_index", unique=True),
+        Index("ix_batch_job_rows_job_done", "job_id", "done"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, ForeignKey("batch_jobs.id"))
+    row_index = Column(Integer)
+    phone_number = Column(String)
+    country_code = Column(String)
+    done = Column(Boolean, default=False)
+    result = Column(JSON, nullable=True)  # Output row, see csv_processor.RESULT_COLUMNS
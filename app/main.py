@@ -1,16 +1,57 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.core.config import settings
-from app.core.database import engine, Base
+from app.core.database import engine
 from app.core.logger import logger
+from app.core.cache import validation_cache
+from app.core.shared_cache import create_backend
+from app.core.shared_state import shared_state
+from app.agents.retry import retry_agent
+from app.agents.learning import learning_agent
+from app.core.jobs import job_manager
+from app.core.deferred import deferred_queue
+from app.core.history import history_writer
+from app.core.freshness import refresh_scheduler
+from app.core.format_store import format_store
+from app.db.migrations import migrate
 
 from app.api import endpoints
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: schema first (each worker takes the migration lock in turn)
+    if settings.AUTO_MIGRATE:
+        migrate(engine)
+    # Cache and provider state shared between worker processes (none with CACHE_BACKEND=memory)
+    shared_backend = create_backend(settings.CACHE_BACKEND)
+    await validation_cache.connect(shared_backend)
+    await shared_state.start(shared_backend)
+    # Open long-lived provider connections
+    await retry_agent.startup()
+    await history_writer.start()
+    await refresh_scheduler.start()
+    await format_store.start()
+    await learning_agent.start()
+    await job_manager.start()
+    await deferred_queue.start()
+    yield
+    # Shutdown (flushes buffered writes)
+    await deferred_queue.stop()
+    await job_manager.stop()
+    await learning_agent.stop()
+    await format_store.stop()
+    await refresh_scheduler.stop()
+    await history_writer.stop()
+    await retry_agent.shutdown()
+    await shared_state.stop()
+    await validation_cache.disconnect()
+    if shared_backend is not None:
+        await shared_backend.close()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 from fastapi.staticfiles import StaticFiles
@@ -0,0 +1,135 @@
+"""
+Throughput of the API under `uvicorn --workers N`, for N = 1, 2, 4 ...
+
+Each run starts a fresh server on its own SQLite database with the shared
+cache backend of your choice, drives POST /api/v1/validate with concurrent
+clients for a fixed time, then one large /api/v1/validate/bulk request.
+Provider keys are blanked, so numbers are validated offline and WhatsApp
+checks answer from the mock provider: this measures the service, not the
+providers.
+
+    python benchmark_workers.py --workers 1 2 4 --backend sqlite
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+PORT = 8765
+BASE_URL = f"http://127.0.0.1:{PORT}/api/v1"
+
+def phone_numbers(count: int, offset: int = 0):
+    # Distinct US numbers, so every request does the full validation (no cache hits)
+    return (f"1415{(offset + i) % 10_000_000:07d}" for i in range(count))
+
+async def wait_until_up(session: aiohttp.ClientSession, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{BASE_URL}/openapi.json") as r:
+                if r.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("Server did not start")
+
+async def drive_validate(session: aiohttp.ClientSession, seconds: float, concurrency: int) -> float:
+    """Requests/sec of /validate with `concurrency` clients, each sending distinct numbers."""
+    done = 0
+    deadline = time.monotonic() + seconds
+
+    async def client(worker: int):
+        nonlocal done
+        numbers = phone_numbers(1_000_000, offset=worker * 1_000_000)
+        while time.monotonic() < deadline:
+            payload = {"phone_number": next(numbers), "country_code": "US"}
+            async with session.post(f"{BASE_URL}/validate", json=payload) as r:
+                await r.read()
+                if r.status == 200:
+                    done += 1
+
+    start = time.monotonic()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return done / (time.monotonic() - start)
+
+async def drive_bulk(session: aiohttp.ClientSession, items: int, requests: int) -> float:
+    """Items/sec of `requests` concurrent /validate/bulk calls of `items` numbers each."""
+    async def one(offset: int) -> int:
+        body = "\n".join(
+            json.dumps({"phone_number": n, "country_code": "US"}) for n in phone_numbers(items, offset)
+        )
+        async with session.post(
+            f"{BASE_URL}/validate/bulk?compact=true",
+            data=body,
+            headers={"Content-Type": "application/x-ndjson"}
+        ) as r:
+            return len((await r.read()).splitlines())
+
+    start = time.monotonic()
+    lines = await asyncio.gather(*(one(5_000_000 + i * items) for i in range(requests)))
+    return sum(lines) / (time.monotonic() - start)
+
+def start_server(workers: int, backend: str, workdir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+        "CACHE_BACKEND": backend,
+        "CACHE_SQLITE_PATH": f"{workdir}/shared_cache.db",
+        "NUMVERIFY_API_KEY": "",
+        "WHAPI_API_TOKEN": "",
+        "DEFERRED_ENABLED": "false",
+    }
+    # Schema once, before the workers start
+    subprocess.run([sys.executable, "-m", "app.db.migrations"], env=env, check=True, capture_output=True)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT),
+         "--workers", str(workers), "--log-level", "warning"],
+        env={**env, "AUTO_MIGRATE": "false"},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+async def run(workers: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(workers, args.backend, workdir)
+        try:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+                await wait_until_up(session)
+                await drive_validate(session, 2.0, args.concurrency)  # Warm-up
+                validate_rps = await drive_validate(session, args.seconds, args.concurrency)
+                bulk_ips = await drive_bulk(session, args.bulk_items, args.bulk_requests)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return {"workers": workers, "validate_rps": validate_rps, "bulk_items_per_sec": bulk_ips}
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--backend", default="sqlite", choices=["memory", "sqlite", "redis"])
+    parser.add_argument("--seconds", type=float, default=10.0, help="Duration of the /validate run")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent /validate clients")
+    parser.add_argument("--bulk-items", type=int, default=5000, help="Numbers per /validate/bulk request")
+    parser.add_argument("--bulk-requests", type=int, default=4, help="Concurrent /validate/bulk requests")
+    args = parser.parse_args()
+
+    print(f"CPUs: {os.cpu_count()}, backend: {args.backend}")
+    print(f"{'workers':>7} | {'/validate req/s':>15} | {'/validate/bulk items/s':>22}")
+    baseline = None
+    for workers in args.workers:
+        result = await run(workers, args)
+        baseline = baseline or result
+        print(
+            f"{workers:>7} | {result['validate_rps']:>8.1f} ({result['validate_rps'] / baseline['validate_rps']:.2f}x) | "
+            f"{result['bulk_items_per_sec']:>15.1f} ({result['bulk_items_per_sec'] / baseline['bulk_items_per_sec']:.2f}x)"
+        )
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+# Settings are read when app modules are imported: point them at a throwaway
+# database and blank provider keys (offline format data, mock WhatsApp answers).
+_tmp = tempfile.mkdtemp(prefix="whacheck-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["NUMVERIFY_API_KEY"] = ""
+os.environ["WHAPI_API_TOKEN"] = ""
+os.environ["DEFERRED_ENABLED"] = "false"
+
+import pytest
+from fastapi.testclient import TestClient
+
+@pytest.fixture(scope="session")
+def app():
+    from app.main import app
+    return app
+
+@pytest.fixture
+def client(app):
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture(autouse=True)
+def fresh_async_pool():
+    # Every test runs on its own event loop; pooled async connections must not outlive it
+    yield
+    from app.core.database import async_engine
+    async_engine.sync_engine.dispose(close=False)
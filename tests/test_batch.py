@@ -0,0 +1,146 @@
+import csv
+import io
+
+CSV = "phone,country\n+14155552671,US\n+442071838750,GB\nnot a number,US\n"
+
+def _rows(text):
+    return list(csv.DictReader(io.StringIO(text)))
+
+def test_batch_stream_raw_body(client):
+    r = client.post("/api/v1/validate/batch/stream", content=CSV, headers={"Content-Type": "text/csv"})
+    assert r.status_code == 200
+    rows = _rows(r.text)
+    assert len(rows) == 3
+
+def test_batch_stream_multipart(client):
+    r = client.post("/api/v1/validate/batch/stream", files={"file": ("numbers.csv", CSV, "text/csv")})
+    assert r.status_code == 200
+    assert len(_rows(r.text)) == 3
+
+def test_history_rows_skip_format_lookup(monkeypatch):
+    import asyncio
+    from datetime import datetime, timezone
+    from app.agents.retry import retry_agent
+    from app.agents.types import HistorySnapshot, ValidationStrategy
+    from app.core.batch_engine import batch_engine
+    from app.core.phone import normalize_key
+
+    lookups = []
+
+    async def validate_format(phone, country, need_carrier=None):
+        lookups.append(phone)
+        return {"valid": True, "international_format": phone}
+
+    monkeypatch.setattr(retry_agent, "validate_format", validate_format)
+    key = normalize_key("+14155552671", "US")
+    history = HistorySnapshot(
+        phone_number="+14155552671", phone_key=key, country_code="US", is_valid=True,
+        carrier="Carrier", whatsapp_available=True, last_validated=datetime.now(timezone.utc)
+    )
+    results, stats = asyncio.run(batch_engine.run([("+14155552671", "US")], prefetched={key: history}))
+    assert lookups == []
+    assert stats.history_rows == 1
+    assert results[0]["strategy"] == ValidationStrategy.SKIP
+    assert results[0]["numverify"]["international_format"] == "+14155552671"
+    assert results[0]["numverify"]["carrier"] == "Carrier"
+
+def test_batch_rejects_corrupt_uploads(client):
+    for name, content in (
+        ("numbers.parquet", b"not parquet"),
+        ("numbers.ndjson", b'{"phone": "+14155552671"}\n{bad json\n'),
+        ("numbers.ndjson", b'["+14155552671"]\n'),
+        ("numbers.xlsx", b"PK\x03\x04 truncated"),
+        ("numbers.arrow", b"ARROW1\x00\x00 not arrow"),
+    ):
+        r = client.post("/api/v1/validate/batch", files={"file": (name, content)})
+        assert r.status_code == 400, name
+        assert "detail" in r.json()
+
+def _table_uploads():
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet
+    frame = pd.DataFrame({"phone": ["+14155552671", "+442071838750"], "country": ["US", "GB"]})
+    table = pa.Table.from_pandas(frame)
+    parquet, arrow, xlsx = io.BytesIO(), io.BytesIO(), io.BytesIO()
+    pa.parquet.write_table(table, parquet)
+    with pa.ipc.new_file(arrow, table.schema) as writer:
+        writer.write_table(table)
+    frame.to_excel(xlsx, index=False)
+    return {"parquet": parquet.getvalue(), "arrow": arrow.getvalue(), "xlsx": xlsx.getvalue()}
+
+def test_batch_table_formats_round_trip(client):
+    for fmt, content in _table_uploads().items():
+        r = client.post("/api/v1/validate/batch", files={"file": (f"numbers.{fmt}", content)})
+        assert r.status_code == 200, fmt
+        assert r.headers["X-Rows-Processed"] == "2", fmt
+
+def test_batch_rejects_truncated_table_uploads(client):
+    for fmt, content in _table_uploads().items():
+        for cut in (len(content) // 2, 8):
+            r = client.post("/api/v1/validate/batch", files={"file": (f"numbers.{fmt}", content[:cut])})
+            assert r.status_code == 400, (fmt, cut)
+            assert r.json()["detail"].startswith(f"Could not read the {fmt} upload"), (fmt, cut)
+
+def test_batch_rejects_empty_uploads_in_every_format(client):
+    for fmt in ("csv", "parquet", "arrow", "ndjson", "xlsx"):
+        for content in (b"", b"\n \n"):
+            r = client.post("/api/v1/validate/batch", files={"file": (f"numbers.{fmt}", content)})
+            assert r.status_code == 400, fmt
+            assert r.json()["detail"] == f"The {fmt} upload is empty"
+    r = client.post("/api/v1/validate/batch/jobs", files={"file": ("numbers.ndjson", b"")})
+    assert r.status_code == 400
+
+def test_batch_job_rejects_corrupt_upload(client):
+    r = client.post("/api/v1/validate/batch/jobs", files={"file": ("numbers.parquet", b"not parquet")})
+    assert r.status_code == 400
+
+def test_batch_stream_reports_bad_input_as_error_row(client):
+    body = "phone\n+14155552671\n\"" + "x" * 200_000 + "\"\n"
+    r = client.post("/api/v1/validate/batch/stream", content=body, headers={"Content-Type": "text/csv"})
+    assert r.status_code == 200
+    rows = _rows(r.text)
+    assert rows[-1]["Validation_Trace"].startswith("Error: Could not read the csv upload")
+
+def test_float_suffixed_row_does_not_poison_history(client):
+    # A number column that went through a float must parse like the clean number
+    r = client.post("/api/v1/validate/batch/stream", content="phone,country\n14155550137.0,US\n",
+                    headers={"Content-Type": "text/csv"})
+    assert r.status_code == 200
+    assert _rows(r.text)[0]["Formatted_Number"] == "+14155550137"
+
+    r = client.post("/api/v1/validate", json={"phone_number": "+14155550137", "country_code": "US"})
+    assert r.status_code == 200
+    assert r.json()["validation_strategy"] != "skip"
+    assert r.json()["formatted_number"] == "+14155550137"
+
+def test_record_split_tracks_quotes_across_chunks():
+    import asyncio
+    from app.core.csv_processor import _iter_csv_record_batches
+
+    text = 'phone,note\n+14155552671,"a, ""quoted""\nnote"\n+442071838750,plain\n'
+
+    async def records(size):
+        async def chunks():
+            data = text.encode()
+            for i in range(0, len(data), size):
+                yield data[i:i + size]
+        return [record async for batch in _iter_csv_record_batches(chunks()) for record in batch]
+
+    expected = [["phone", "note"], ["+14155552671", 'a, "quoted"\nnote'], ["+442071838750", "plain"]]
+    for size in (1, 2, 3, 7, len(text)):
+        assert asyncio.run(records(size)) == expected, size
+
+def test_batch_stream_caps_unclosed_quote(client, monkeypatch):
+    from app.core.config import settings
+    monkeypatch.setattr(settings, "BATCH_STREAM_MAX_RECORD_CHARS", 1000)
+
+    def body():
+        yield b"phone\n+14155552671\n\""
+        for _ in range(100):
+            yield b"x" * 100 + b"\n"
+
+    r = client.post("/api/v1/validate/batch/stream", content=body(), headers={"Content-Type": "text/csv"})
+    assert r.status_code == 200
+    rows = _rows(r.text)
+    assert rows[-1]["Validation_Trace"].startswith("Error: Could not read the csv upload: a record runs past")
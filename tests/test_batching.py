@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+from app.core.batching import MicroBatcher
+from app.core.ratelimit import Priority, request_priority
+
+def test_concurrent_keys_share_one_bulk_call():
+    calls = []
+
+    async def handler(keys):
+        calls.append((list(keys), request_priority.get()))
+        return {key: key.upper() for key in keys}
+
+    async def submit(batcher, key, priority):
+        request_priority.set(priority)
+        return await batcher.submit(key)
+
+    async def run():
+        batcher = MicroBatcher(handler, max_size=3, max_wait=0.05)
+        results = await asyncio.gather(
+            submit(batcher, "a", Priority.BATCH),
+            submit(batcher, "a", Priority.BATCH),
+            submit(batcher, "b", Priority.INTERACTIVE),
+            submit(batcher, "c", Priority.BATCH),
+            submit(batcher, "d", Priority.BATCH),
+        )
+        return results, batcher.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["A", "A", "B", "C", "D"]
+    # Full at 3 distinct keys (the duplicate is sent once); "d" goes after max_wait
+    assert calls == [(["a", "b", "c"], Priority.INTERACTIVE), (["d"], Priority.BATCH)]
+    assert stats["batches_sent"] == 2 and stats["keys_sent"] == 4 and stats["calls"] == 5
+
+def test_bulk_errors_and_missing_keys_reach_each_caller():
+    async def failing(keys):
+        raise ConnectionError("down")
+
+    async def partial(keys):
+        return {"a": 1}
+
+    async def run(handler, keys):
+        batcher = MicroBatcher(handler, max_size=10, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(key) for key in keys), return_exceptions=True)
+
+    assert all(isinstance(r, ConnectionError) for r in asyncio.run(run(failing, ["a", "b"])))
+    found, missing = asyncio.run(run(partial, ["a", "b"]))
+    assert found == 1
+    assert isinstance(missing, KeyError)
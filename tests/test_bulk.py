@@ -0,0 +1,51 @@
+import json
+from app.core.config import settings
+
+def _lines(r):
+    return sorted((json.loads(line) for line in r.text.splitlines()), key=lambda line: line["index"])
+
+def test_bulk_json_array(client):
+    body = [{"phone_number": "+14155552671", "country_code": "US"}, {"country_code": "US"}]
+    r = client.post("/api/v1/validate/bulk", json=body)
+    assert r.status_code == 200
+    assert r.headers["X-Items-Invalid"] == "1"
+    lines = _lines(r)
+    assert [line["success"] for line in lines] == [True, False]
+
+def test_bulk_ndjson_streamed_in_pieces(client):
+    body = "".join(json.dumps({"phone_number": f"+1415555{i:04d}", "country_code": "US"}) + "\n" for i in range(250))
+    body += "{not json\n"
+
+    def pieces():
+        data = body.encode()
+        for i in range(0, len(data), 700):
+            yield data[i:i + 700]
+
+    r = client.post("/api/v1/validate/bulk", content=pieces(), headers={"Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200
+    lines = _lines(r)
+    assert [line["index"] for line in lines] == list(range(251))
+    assert lines[-1]["success"] is False and lines[-1]["error"].startswith("Invalid JSON")
+
+def test_bulk_rejects_undecodable_array(client):
+    r = client.post("/api/v1/validate/bulk", content=b'[{"phone_number": "\\xff"}, "\xff"]')
+    assert r.status_code == 400
+
+def test_bulk_undecodable_ndjson_line_is_reported(client):
+    r = client.post("/api/v1/validate/bulk", content=b'{"phone_number": "+14155552671"}\n\xff\xfe\n')
+    assert r.status_code == 200
+    lines = _lines(r)
+    assert lines[1]["error"].startswith("Invalid UTF-8")
+
+def test_bulk_array_size_cap(client, monkeypatch):
+    monkeypatch.setattr(settings, "BULK_MAX_BODY_BYTES", 100)
+    r = client.post("/api/v1/validate/bulk", json=[{"phone_number": "+14155552671"}] * 10)
+    assert r.status_code == 413
+
+def test_bulk_ndjson_item_cap(client, monkeypatch):
+    monkeypatch.setattr(settings, "BULK_MAX_ITEMS", 2)
+    body = "".join(json.dumps({"phone_number": "+14155552671"}) + "\n" for _ in range(5))
+    r = client.post("/api/v1/validate/bulk", content=body)
+    lines = _lines(r)
+    assert len(lines) == 3
+    assert "At most 2 items" in lines[-1]["error"]
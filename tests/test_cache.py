@@ -0,0 +1,70 @@
+import asyncio
+from app.core import cache as cache_module
+from app.core.cache import MISSING, TTLCache
+from app.core.shared_cache import SharedCache, SQLiteBackend
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = TTLCache(10, 60.0)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=5.0)
+    clock.now += 5.0
+    assert cache.get("a") == 1
+    assert cache.get("b") is MISSING
+    clock.now += 55.0
+    assert cache.get("a", None) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["size"]) == (1, 2, 2, 0)
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(2, 60.0)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+def test_load_fills_misses_from_the_shared_level(tmp_path, monkeypatch):
+    async def run():
+        backend = SQLiteBackend(str(tmp_path / "shared.db"))
+        shared = SharedCache(backend)
+        writer = TTLCache(10, 60.0, "format")
+        reader = TTLCache(10, 60.0, "format")
+        writer.shared = reader.shared = shared
+        writer.set("+14155552671", {"valid": True})
+        writer.set("+14155550000", {"valid": False})
+        reader.set("+14155550000", {"valid": "local"})
+        await shared.flush()
+
+        fetched = []
+        fetch = shared.fetch
+
+        async def counting_fetch(tier, keys, decode=None):
+            fetched.append(list(keys))
+            return await fetch(tier, keys, decode)
+
+        monkeypatch.setattr(shared, "fetch", counting_fetch)
+        await reader.load(["+14155552671", "+14155550000", "+14155559999"])
+        await reader.load(["+14155552671"])
+        await backend.close()
+        return fetched, [reader.get(k, None) for k in ("+14155552671", "+14155550000", "+14155559999")]
+
+    fetched, values = asyncio.run(run())
+    # Entries already held are not fetched; the second load is served in process
+    assert fetched == [["+14155552671", "+14155559999"]]
+    assert values == [{"valid": True}, {"valid": "local"}, None]
+
+def test_load_without_a_shared_level_is_a_no_op():
+    cache = TTLCache(10, 60.0)
+    asyncio.run(cache.load(["a"]))
+    assert len(cache) == 0
@@ -0,0 +1,15 @@
+import itertools
+from app.agents.confidence import confidence_agent
+
+FLAGS = [True, False, None, float("nan"), 0, 1]
+PROVIDERS = ["whapi", "mock", "none", "cache", None, float("nan")]
+
+def test_calculate_scores_matches_calculate_score():
+    rows = list(itertools.product(FLAGS, FLAGS, PROVIDERS, FLAGS))
+    records = confidence_agent.score_records(confidence_agent.calculate_scores(*zip(*rows)))
+    assert len(records) == len(rows)
+    for row, record in zip(rows, records):
+        assert record == confidence_agent.calculate_score(*row), row
+
+def test_calculate_scores_empty():
+    assert confidence_agent.score_records(confidence_agent.calculate_scores([], [], [], [])) == []
@@ -0,0 +1,62 @@
+import itertools
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.agents.decision import decision_agent
+from app.agents.types import HistorySnapshot
+from app.core.config import settings
+
+DAY = timedelta(days=1)
+
+def _history(is_valid, whatsapp, age, country="US"):
+    return HistorySnapshot(
+        phone_number="+14155552671", country_code=country, is_valid=is_valid, whatsapp_available=whatsapp,
+        last_validated=None if age is None else datetime.now(timezone.utc) - age
+    )
+
+HISTORIES = {
+    "none": None,
+    "positive fresh": _history(True, True, DAY),
+    "positive stale": _history(True, True, 33 * DAY),
+    "positive expired": _history(True, True, 60 * DAY),
+    "negative fresh": _history(True, False, DAY),
+    "negative stale": _history(True, False, 10 * DAY),
+    "invalid fresh": _history(False, False, 30 * DAY),
+    "missing fields": HistorySnapshot(phone_number="+14155552671", last_validated=datetime.now(timezone.utc) - DAY),
+    "never validated": _history(True, True, None),
+}
+
+FORMATS = {
+    "none": None,
+    "empty": {},
+    "numverify valid": {"valid": True, "line_type": "mobile", "source": "numverify"},
+    "offline valid": {"valid": True, "line_type": "mobile", "source": "phonenumbers"},
+    "offline invalid": {"valid": False, "source": "phonenumbers"},
+    "invalid, no source": {"valid": False},
+    "no valid field": {"line_type": "mobile"},
+    "nan valid": {"valid": float("nan"), "line_type": float("nan")},
+}
+
+COUNTRIES = ["US", "us", "BR", "GB", "de"]
+
+ROWS = list(itertools.product(COUNTRIES, HISTORIES, FORMATS))
+
+@pytest.mark.parametrize("allow_deferred,allow_stale,deferred_enabled", list(itertools.product([True, False], repeat=3)))
+def test_decide_batch_matches_decide(monkeypatch, allow_deferred, allow_stale, deferred_enabled):
+    monkeypatch.setattr(settings, "DEFERRED_ENABLED", deferred_enabled)
+    frame = decision_agent.decide_batch(
+        [country for country, _, _ in ROWS],
+        [HISTORIES[history] for _, history, _ in ROWS],
+        [FORMATS[fmt] for _, _, fmt in ROWS],
+        allow_deferred=allow_deferred,
+        allow_stale=allow_stale
+    )
+    assert len(frame) == len(ROWS)
+    for (country, history, fmt), batch in zip(ROWS, frame.to_dict("records")):
+        trace = decision_agent.decide(
+            "+14155552671", country, HISTORIES[history], FORMATS[fmt],
+            allow_deferred=allow_deferred, allow_stale=allow_stale
+        )
+        row = (country, history, fmt)
+        assert batch["strategy"] == trace.final_decision, row
+        assert batch["reasoning"] == trace.reasoning, row
+        assert bool(batch["refresh"]) == trace.refresh, row
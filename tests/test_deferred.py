@@ -0,0 +1,74 @@
+import asyncio
+from sqlalchemy import create_engine, func, select, text
+from app.core.database import AsyncSessionLocal
+from app.core.deferred import deferred_queue
+from app.db.migrations import migrate
+from app.db.models import DeferredValidation, PRIORITY_REFRESH, PRIORITY_REQUEST
+
+def test_concurrent_enqueue_shares_one_entry(client):
+    async def enqueue(priority):
+        async with AsyncSessionLocal() as db:
+            return await deferred_queue.enqueue(db, "+14155550123", "US", priority)
+
+    async def run():
+        entries = await asyncio.gather(*(
+            enqueue(PRIORITY_REFRESH if i % 2 else PRIORITY_REQUEST) for i in range(20)
+        ))
+        async with AsyncSessionLocal() as db:
+            waiting = (await db.execute(
+                select(func.count()).select_from(DeferredValidation)
+                .where(DeferredValidation.phone_key == entries[0].phone_key)
+            )).scalar_one()
+        return entries, waiting
+
+    entries, waiting = asyncio.run(run())
+    assert waiting == 1
+    assert len({entry.id for entry in entries}) == 1
+    assert entries[-1].priority == PRIORITY_REQUEST
+
+def test_migration_fails_duplicate_waiting_entries(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/old.db")
+    with engine.begin() as conn:
+        # deferred_validations as created before the unique index
+        conn.execute(text(
+            "CREATE TABLE deferred_validations (id VARCHAR PRIMARY KEY, phone_key VARCHAR, phone_number VARCHAR,"
+            " country_code VARCHAR, priority INTEGER, status VARCHAR, attempts INTEGER, not_before DATETIME,"
+            " result JSON, error VARCHAR, created_at DATETIME, finished_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO deferred_validations (id, phone_key, phone_number, country_code, priority, status, attempts, created_at)"
+            " VALUES ('a', '+14155550123', '+14155550123', 'US', 200, 'queued', 0, '2026-01-01'),"
+            " ('b', '+14155550123', '+14155550123', 'US', 100, 'queued', 0, '2026-01-02'),"
+            " ('c', '+14155550123', '+14155550123', 'US', 100, 'done', 1, '2025-12-31')"
+        ))
+    migrate(engine)
+    migrate(engine)
+    with engine.connect() as conn:
+        statuses = dict(conn.execute(text("SELECT id, status FROM deferred_validations")).all())
+    assert statuses == {"a": "failed", "b": "queued", "c": "done"}
+
+def test_drain_holds_no_connection_during_provider_calls(monkeypatch):
+    from app.core.batch_engine import batch_engine
+    from app.core.database import async_engine, engine
+    # No app lifespan: its background tasks would share the pool being counted
+    migrate(engine)
+    checked_out = []
+
+    async def run_rows(rows, allow_stale=True):
+        checked_out.append(async_engine.sync_engine.pool.checkedout())
+        return [{"numverify": {"valid": True}, "whatsapp": {"available": True}} for _ in rows], None
+
+    monkeypatch.setattr(batch_engine, "run", run_rows)
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            entry = await deferred_queue.enqueue(db, "+14155550188", "US")
+        while await deferred_queue._drain_once():
+            pass
+        async with AsyncSessionLocal() as db:
+            return await db.get(DeferredValidation, entry.id)
+
+    entry = asyncio.run(run())
+    assert checked_out and set(checked_out) == {0}
+    assert entry.status == "done"
+    assert entry.result["valid"] is True
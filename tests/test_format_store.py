@@ -0,0 +1,56 @@
+import asyncio
+from app.core.database import engine
+from app.core.format_store import FormatStore
+from app.db.migrations import migrate
+
+ANSWER = {
+    "valid": True, "number": "14155552671", "local_format": "4155552671",
+    "international_format": "+14155552671", "country_prefix": "+1", "country_code": "US",
+    "country_name": "United States of America", "location": "Novato", "carrier": "AT&T", "line_type": "mobile"
+}
+
+def _store(ttl=3600.0):
+    return FormatStore("test format store", max_size=100, interval=60.0, ttl=ttl)
+
+def test_answers_survive_a_restart():
+    # No app lifespan: the store under test is the only writer
+    migrate(engine)
+
+    async def run():
+        writer = _store()
+        writer.record("+14155552671", "us", ANSWER)
+        pending = await writer.get("+14155552671", "US")
+        await writer.flush()
+        writer.record("+14155552671", "US", {**ANSWER, "carrier": "Verizon"})
+        await writer.flush()
+
+        reader = _store()
+        found, other_country, unknown = await asyncio.gather(
+            reader.get("+14155552671", "US"),
+            reader.get("+14155552671", "CA"),
+            reader.get("+14155550000", "US")
+        )
+        return pending, found, other_country, unknown, reader.stats()
+
+    pending, found, other_country, unknown, stats = asyncio.run(run())
+    expected = {**ANSWER, "e164": "+14155552671", "source": "numverify"}
+    assert pending == expected
+    assert found == {**expected, "carrier": "Verizon"}
+    assert other_country is None and unknown is None
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    # Concurrent lookups share one query
+    assert stats["reads"]["batches_sent"] == 1
+
+def test_answers_older_than_the_ttl_are_misses():
+    migrate(engine)
+
+    async def run():
+        writer = _store()
+        writer.record("+14155552672", "US", ANSWER)
+        await writer.flush()
+        await asyncio.sleep(0.05)
+        return await _store(ttl=0.01).get("+14155552672", "US"), await _store().get("+14155552672", "US")
+
+    expired, fresh = asyncio.run(run())
+    assert expired is None
+    assert fresh["carrier"] == "AT&T"
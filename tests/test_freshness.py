@@ -0,0 +1,81 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import select
+from app.agents.types import HistorySnapshot
+from app.core.database import AsyncSessionLocal, engine
+from app.core.freshness import EXPIRED, FRESH, STALE, FreshnessPolicy, RefreshScheduler
+from app.core.phone import normalize_key
+from app.db.migrations import migrate
+from app.db.models import DeferredValidation, PRIORITY_REFRESH
+
+DAY = 86_400.0
+NOW = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+def _history(is_valid, whatsapp, age_days, country="US"):
+    return HistorySnapshot(
+        phone_number="+14155552671", country_code=country, is_valid=is_valid, whatsapp_available=whatsapp,
+        last_validated=NOW - timedelta(days=age_days)
+    )
+
+POLICY = FreshnessPolicy(
+    positive=30 * DAY, negative=7 * DAY, invalid=90 * DAY,
+    by_country={"br": {"negative": 2 * DAY}}, stale_window=5 * DAY
+)
+
+@pytest.mark.parametrize("is_valid,whatsapp,age_days,country,state", [
+    (True, True, 30, "US", FRESH),
+    (True, True, 35, "US", STALE),
+    (True, True, 35.5, "US", EXPIRED),
+    (True, False, 7, "US", FRESH),
+    (True, False, 8, "US", STALE),
+    (True, False, 13, "US", EXPIRED),
+    (False, False, 90, "US", FRESH),
+    (False, True, 95, "US", STALE),  # Invalid wins over a stale WhatsApp flag
+    (True, False, 3, "BR", STALE),  # Country override, matched case-insensitively
+    (True, False, 8, "BR", EXPIRED),
+    (True, True, 30, "BR", FRESH),  # Only the overridden outcome changes
+])
+def test_state_by_outcome_and_country(is_valid, whatsapp, age_days, country, state):
+    assert POLICY.state(_history(is_valid, whatsapp, age_days, country), now=NOW) == state
+
+def test_naive_timestamps_are_read_as_utc():
+    history = _history(True, True, 31)
+    history.last_validated = history.last_validated.replace(tzinfo=None)
+    assert POLICY.state(history, now=NOW) == STALE
+
+def test_usable_drops_expired_and_unvalidated_rows():
+    policy = FreshnessPolicy(positive=30 * DAY, negative=7 * DAY, invalid=90 * DAY, by_country={}, stale_window=5 * DAY)
+    now = datetime.now(timezone.utc)
+    stale = HistorySnapshot(phone_number="+14155552671", is_valid=True, whatsapp_available=True,
+                            last_validated=now - timedelta(days=32))
+    expired = HistorySnapshot(phone_number="+14155552671", is_valid=True, whatsapp_available=True,
+                              last_validated=now - timedelta(days=40))
+    never = HistorySnapshot(phone_number="+14155552671", is_valid=True, whatsapp_available=True)
+    assert policy.usable(stale, "US") is stale
+    assert policy.usable(expired, "US") is None
+    assert policy.usable(never, "US") is None
+    assert policy.usable(None) is None
+    assert policy.expired == 2
+
+def test_refresh_is_queued_once_per_number():
+    # No app lifespan: its drain loop would claim the entries being counted
+    migrate(engine)
+    scheduler = RefreshScheduler("test refresh", max_size=100, interval=60.0)
+
+    async def run():
+        scheduler.request("+1 (415) 555-0199", "US")
+        scheduler.request("4155550199", "US")
+        scheduler.request("+14155550198", "US")
+        await scheduler.flush()
+        scheduler.request("+14155550199", "US")
+        await scheduler.flush()
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(
+                select(DeferredValidation.phone_key, DeferredValidation.priority, DeferredValidation.status)
+                .where(DeferredValidation.phone_key.in_([normalize_key("+14155550199"), normalize_key("+14155550198")]))
+            )).all()
+
+    rows = asyncio.run(run())
+    assert sorted(rows) == [("+14155550198", PRIORITY_REFRESH, "queued"), ("+14155550199", PRIORITY_REFRESH, "queued")]
+    assert scheduler.queued == 2
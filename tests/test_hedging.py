@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from app.core.hedging import Hedger
+
+def _hedger(**kwargs):
+    options = dict(percentile=0.95, min_delay=0.01, default_delay=0.05, min_samples=10,
+                   budget_ratio=0.0, budget_burst=5.0)
+    options.update(kwargs)
+    return Hedger(**options)
+
+def _call(value, delay, log, name, error=None):
+    async def call():
+        log.append(f"{name} start")
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            log.append(f"{name} cancelled")
+            raise
+        if error is not None:
+            raise error
+        return value
+    return call
+
+def test_fast_primary_fires_no_hedge():
+    hedger, log = _hedger(), []
+    result = asyncio.run(hedger.run(_call("p", 0.0, log, "primary"), _call("h", 0.0, log, "hedge"), 0.05))
+    assert result == ("p", False)
+    assert log == ["primary start"]
+    assert (hedger.calls, hedger.fired) == (1, 0)
+
+def test_winning_hedge_cancels_the_slow_primary():
+    hedger, log = _hedger(), []
+    result = asyncio.run(hedger.run(_call("p", 5.0, log, "primary"), _call("h", 0.0, log, "hedge"), 0.02))
+    assert result == ("h", True)
+    assert log == ["primary start", "hedge start", "primary cancelled"]
+    assert (hedger.fired, hedger.won) == (1, 1)
+
+def test_winning_primary_cancels_the_hedge():
+    hedger, log = _hedger(), []
+    result = asyncio.run(hedger.run(_call("p", 0.05, log, "primary"), _call("h", 5.0, log, "hedge"), 0.02))
+    assert result == ("p", False)
+    assert log == ["primary start", "hedge start", "hedge cancelled"]
+    assert (hedger.fired, hedger.won) == (1, 0)
+
+def test_failed_call_falls_back_to_the_other():
+    hedger, log = _hedger(), []
+    failing = _call(None, 0.03, log, "primary", ConnectionError("primary down"))
+    assert asyncio.run(hedger.run(failing, _call("h", 0.05, log, "hedge"), 0.01)) == ("h", True)
+    with pytest.raises(ConnectionError, match="primary down"):
+        asyncio.run(hedger.run(failing, _call(None, 0.0, log, "hedge", TimeoutError("hedge down")), 0.01))
+
+def test_hedges_are_limited_by_the_budget():
+    hedger, log = _hedger(budget_ratio=0.5, budget_burst=1.0), []
+
+    async def run():
+        results = []
+        for _ in range(4):
+            results.append(await hedger.run(_call("p", 0.03, log, "primary"), _call("h", 0.0, log, "hedge"), 0.01))
+        return results
+
+    results = asyncio.run(run())
+    # The burst allows the first hedge; after that a token is earned every second call
+    assert [won for _, won in results] == [True, False, True, False]
+    assert (hedger.calls, hedger.fired, hedger.budget_exhausted) == (4, 2, 2)
+    assert hedger.stats()["budget_tokens"] <= hedger.budget_burst
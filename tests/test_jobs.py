@@ -0,0 +1,47 @@
+import asyncio
+import time
+from sqlalchemy import update
+from app.core.database import AsyncSessionLocal
+from app.core.jobs import job_manager
+from app.db.models import BatchJob, BatchJobRow
+
+CSV = b"phone,country\n+14155552671,US\n+442071838750,GB\nnot a number,US\n"
+
+def _wait_for(client, job_id, status="completed", timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/v1/validate/batch/jobs/{job_id}").json()
+        if job["status"] == status:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+def test_job_runs_to_completion(client):
+    r = client.post("/api/v1/validate/batch/jobs", files={"file": ("numbers.csv", CSV, "text/csv")})
+    assert r.status_code == 202
+    job = _wait_for(client, r.json()["job_id"])
+    assert job["processed_rows"] == 3
+    results = client.get(f"/api/v1/validate/batch/jobs/{job['job_id']}/results")
+    assert len(results.text.strip().splitlines()) == 4
+
+def test_checkpoint_stops_after_takeover(client):
+    r = client.post("/api/v1/validate/batch/jobs", files={"file": ("numbers.csv", CSV, "text/csv")})
+    job_id = _wait_for(client, r.json()["job_id"])["job_id"]
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            # Another process holds the lease now
+            await db.execute(
+                update(BatchJob).where(BatchJob.id == job_id)
+                .values(status="running", claim_token="other-worker", processed_rows=0)
+            )
+            await db.execute(update(BatchJobRow).where(BatchJobRow.job_id == job_id).values(done=False))
+            await db.commit()
+        async with AsyncSessionLocal() as db:
+            assert not await job_manager._checkpoint(db, job_id, processed_rows=3)
+        async with AsyncSessionLocal() as db:
+            return await db.get(BatchJob, job_id)
+
+    job = asyncio.run(run())
+    assert job.claim_token == "other-worker"
+    assert job.processed_rows == 0
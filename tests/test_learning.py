@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from sqlalchemy import delete, select
+from app.agents.learning import LearningWriter
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, engine
+from app.db.migrations import migrate
+from app.db.models import ProviderHealth
+
+def _writer(successes, failures, seconds_each):
+    writer = LearningWriter("LearningWriter", max_size=1_000, interval=60)
+    for ok in [True] * successes + [False] * failures:
+        writer.add(("provider", "test"), {
+            "provider_name": "test", "success": int(ok), "failure": int(not ok), "total_time": seconds_each
+        })
+    return writer
+
+def test_concurrent_flushes_add_up():
+    migrate(engine)
+    writers = [_writer(3, 1, 0.2) for _ in range(8)]
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(ProviderHealth).where(ProviderHealth.provider_name == "test"))
+            await db.commit()
+        await asyncio.gather(*(writer.flush() for writer in writers))
+        await _writer(0, 2, 1.2).flush()
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(ProviderHealth).where(ProviderHealth.provider_name == "test"))).scalar_one()
+
+    row = asyncio.run(run())
+    assert [writer.failures for writer in writers] == [0] * 8
+    assert (row.success_count, row.failure_count) == (24, 10)
+    # The first flush sets the latency, later ones blend in with the EWMA weight
+    alpha = settings.PROVIDER_LATENCY_EWMA_ALPHA
+    assert row.avg_response_time == pytest.approx((1 - alpha) * 0.2 + alpha * 1.2)
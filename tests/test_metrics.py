@@ -0,0 +1,20 @@
+import asyncio
+from app.core.cache import validation_cache
+from app.core.metrics import render_prometheus
+from app.core.shared_cache import SharedCache, SQLiteBackend
+
+def test_metrics_scrape(client):
+    client.post("/api/v1/validate", json={"phone_number": "+14155552671", "country_code": "US"})
+    r = client.get("/api/v1/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert 'whacheck_cache_hits_total{tier="history"}' in r.text
+    assert 'tier="shared"' not in r.text
+
+def test_metrics_render_shared_backend(tmp_path, monkeypatch):
+    backend = SQLiteBackend(str(tmp_path / "shared.db"))
+    monkeypatch.setattr(validation_cache, "shared", SharedCache(backend))
+    text = render_prometheus(validation_cache.stats(), {}, {}, {}, {}, {}, {})
+    asyncio.run(backend.close())
+    assert 'whacheck_shared_cache_hits_total{backend="SQLiteBackend"} 0' in text
+    assert 'tier="shared"' not in text
@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from app.agents.retry import retry_agent
+from app.core.cache import validation_cache
+from app.core.config import settings
+from app.core.phone import normalize_key, parse_number
+
+@pytest.mark.parametrize("phone,country", [
+    ("+14155552671", "US"),
+    ("14155552671", "US"),
+    ("(415) 555-2671", "US"),
+    ("415.555.2671", "us"),
+    (" +1 415 555 2671 ", None),
+    ("14155552671.0", "US"),
+    ("+14155552671", "GB"),
+])
+def test_normalize_key_is_e164_for_every_spelling(phone, country):
+    assert normalize_key(phone, country) == "+14155552671"
+
+def test_normalize_key_without_a_possible_number():
+    assert normalize_key("12", "US") == "12"
+    assert normalize_key("call me", "US") == "raw:call me"
+    assert normalize_key("", None) == "raw:"
+
+def test_parse_number_offline():
+    result = parse_number("020 7183 8750", "GB")
+    assert result["valid"] is True
+    assert result["e164"] == "+442071838750"
+    assert result["country_code"] == "GB"
+    assert result["source"] == "phonenumbers"
+    assert parse_number("+1415", "US")["valid"] is False
+    assert "error" in parse_number("not a number", "XX")
+
+def test_invalid_numbers_never_reach_numverify(monkeypatch):
+    monkeypatch.setattr(settings, "NUMVERIFY_API_KEY", "key")
+    monkeypatch.setattr(settings, "FORMAT_STORE_ENABLED", False)
+    validation_cache.format.clear()
+
+    async def no_http():
+        raise AssertionError("NumVerify was called")
+
+    monkeypatch.setattr(retry_agent, "_get_session", no_http)
+    result = asyncio.run(retry_agent.validate_format("+1415", "US", need_carrier=True))
+    assert result["valid"] is False
+    assert result["source"] == "phonenumbers"
+    # Without a carrier lookup, valid numbers are answered offline too
+    result = asyncio.run(retry_agent.validate_format("+14155552671", "US", need_carrier=False))
+    assert result["valid"] is True
+    assert result["source"] == "phonenumbers"
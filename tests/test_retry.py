@@ -0,0 +1,185 @@
+import asyncio
+import time
+import aiohttp
+import pytest
+from tenacity import RetryError
+from app.agents.retry import retry_agent
+from app.core.circuit import CircuitBreaker, CircuitState, breakers
+from app.core.config import settings
+from app.core.ratelimit import Priority, ProviderLimiter, rate_limiters, request_priority
+
+def test_whapi_retry_stops_once_circuit_rejects(monkeypatch):
+    breaker = CircuitBreaker("whapi", failure_threshold=1)
+    monkeypatch.setitem(breakers, "whapi", breaker)
+    attempts = []
+
+    async def failing_post(phone_numbers):
+        attempts.append(phone_numbers)
+        breaker.record_failure()
+        raise aiohttp.ClientError("Whapi Error: 503")
+
+    monkeypatch.setattr(retry_agent, "_post_whapi_contacts", failing_post)
+    start = time.perf_counter()
+    with pytest.raises(RetryError):
+        asyncio.run(retry_agent._call_whapi_bulk(["+14155552671"]))
+    # No backoff sleep and no second attempt once the circuit is open
+    assert len(attempts) == 1
+    assert time.perf_counter() - start < 1.0
+    assert breaker.rejected == 1
+
+def test_provider_health_counts_answers_not_availability(monkeypatch):
+    recorded = []
+
+    async def not_on_whatsapp(phone_number):
+        return False
+
+    monkeypatch.setitem(breakers, "whapi", CircuitBreaker("whapi"))
+    monkeypatch.setitem(retry_agent._whatsapp_providers, "whapi", not_on_whatsapp)
+    monkeypatch.setattr("app.agents.retry.learning_agent.update_provider_metrics",
+                        lambda provider, success, response_time: recorded.append((provider, success)))
+    result = asyncio.run(retry_agent._check_whatsapp_uncached("+14155550000", "+14155550000"))
+    assert result["available"] is False
+    assert recorded == [("whapi", True)]
+
+def _half_open_breaker(name):
+    breaker = CircuitBreaker(name, failure_threshold=1, recovery_timeout=0, half_open_max_calls=1)
+    breaker.record_failure()
+    assert breaker.state == CircuitState.HALF_OPEN
+    return breaker
+
+class _Throttled:
+    status = 429
+    headers = {"Retry-After": "0"}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+def test_throttled_half_open_trial_gives_back_its_admission(monkeypatch):
+    breaker = _half_open_breaker("numverify")
+    monkeypatch.setitem(breakers, "numverify", breaker)
+    monkeypatch.setitem(rate_limiters, "numverify", ProviderLimiter("numverify", 0, 1))
+    monkeypatch.setattr(settings, "NUMVERIFY_API_KEY", "key")
+    monkeypatch.setattr(settings, "FORMAT_STORE_ENABLED", False)
+    requests = []
+
+    class Session:
+        def get(self, url):
+            requests.append(url)
+            return _Throttled()
+
+    async def get_session():
+        return Session()
+
+    monkeypatch.setattr(retry_agent, "_get_session", get_session)
+
+    async def run():
+        for phone in ("+14155552671", "+14155552672"):
+            await retry_agent._validate_format_uncached(phone, "US", True, (phone, True))
+
+    asyncio.run(run())
+    # A 429 is no outcome: the single trial slot is free again for the next caller
+    assert len(requests) == 2
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+
+def test_cancelled_half_open_trial_gives_back_its_admission(monkeypatch):
+    breaker = _half_open_breaker("whapi")
+    monkeypatch.setitem(breakers, "whapi", breaker)
+    monkeypatch.setattr(settings, "HEDGE_ENABLED", False)
+
+    async def hanging(phone_number):
+        await asyncio.sleep(60)
+
+    monkeypatch.setitem(retry_agent._whatsapp_providers, "whapi", hanging)
+
+    async def run():
+        task = asyncio.create_task(retry_agent._check_whatsapp_uncached("+14155552671", "+14155552671"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+
+def test_provider_calls_keep_rate_and_priority_under_contention(monkeypatch):
+    rate = 20.0
+    monkeypatch.setitem(breakers, "whapi", CircuitBreaker("whapi"))
+    monkeypatch.setitem(rate_limiters, "whapi", ProviderLimiter("whapi", rate, 1))
+    monkeypatch.setattr(settings, "WHAPI_API_TOKEN", "token")
+    monkeypatch.setattr(settings, "WHAPI_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(retry_agent, "_semaphores", None)
+    sent = []
+
+    class Answer:
+        status = 200
+
+        def __init__(self, slow):
+            self.slow = slow
+
+        async def __aenter__(self):
+            if self.slow:
+                # A slow provider answer: others queue up meanwhile, then it speeds up
+                await asyncio.sleep(0.3)
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def json(self):
+            return {"contacts": []}
+
+    class Session:
+        def post(self, url, json, headers):
+            sent.append((time.monotonic(), json["contacts"][0]))
+            return Answer(slow=not sent[1:])
+
+    async def get_session():
+        return Session()
+
+    monkeypatch.setattr(retry_agent, "_get_session", get_session)
+
+    async def call(phone, priority):
+        request_priority.set(priority)
+        await retry_agent._post_whapi_contacts([phone])
+
+    async def run():
+        batch = [asyncio.create_task(call(f"b{i}", Priority.BATCH)) for i in range(4)]
+        await asyncio.sleep(0.2)
+        interactive = [asyncio.create_task(call(f"i{i}", Priority.INTERACTIVE)) for i in range(2)]
+        await asyncio.gather(*batch, *interactive)
+
+    asyncio.run(run())
+    # Interactive callers overtake queued batch callers; nobody sends faster than the rate
+    assert [phone for _, phone in sent] == ["b0", "i0", "i1", "b1", "b2", "b3"]
+    gaps = [b - a for (a, _), (b, _) in zip(sent, sent[1:])]
+    assert min(gaps) >= 0.9 / rate
+
+def test_pool_counts_connection_reuse():
+    from aiohttp import web
+    from app.agents.retry import RetryAgent
+
+    async def run():
+        server = web.Application()
+        server.router.add_get("/", lambda request: web.Response(text="ok"))
+        runner = web.AppRunner(server)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        agent = RetryAgent()
+        try:
+            session = await agent._get_session()
+            for _ in range(3):
+                async with session.get(f"http://127.0.0.1:{port}/") as response:
+                    await response.text()
+            return agent.pool_stats()
+        finally:
+            await agent.shutdown()
+            await runner.cleanup()
+
+    stats = asyncio.run(run())
+    assert stats["connections"] == {"opened": 1, "reused": 2, "queued": 0}
@@ -0,0 +1,63 @@
+import asyncio
+import pickle
+import pytest
+from datetime import datetime, timezone
+from app.agents.types import HistorySnapshot
+from app.core.cache import TTLCache, _decode_history
+from app.core.shared_cache import SharedCache, SQLiteBackend
+
+def test_tiers_round_trip_through_json(tmp_path):
+    async def run():
+        backend = SQLiteBackend(str(tmp_path / "shared.db"))
+        shared = SharedCache(backend)
+        writer = TTLCache(10, 60.0, "history", _decode_history)
+        reader = TTLCache(10, 60.0, "history", _decode_history)
+        writer.shared = reader.shared = shared
+        snapshot = HistorySnapshot(phone_number="+14155552671", whatsapp_available=True,
+                                   last_validated=datetime.now(timezone.utc))
+        writer.set("+14155552671", snapshot)
+        writer.set("+14155550000", None)
+        await shared.flush()
+        await reader.load(["+14155552671", "+14155550000"])
+        await backend.close()
+        return snapshot, reader.get("+14155552671"), reader.get("+14155550000")
+
+    snapshot, loaded, miss = asyncio.run(run())
+    assert loaded == snapshot
+    assert miss is None
+
+def test_pickled_entries_are_ignored(tmp_path):
+    class Payload:
+        def __reduce__(self):
+            return (exec, ("raise SystemExit('unpickled')",))
+
+    async def run():
+        backend = SQLiteBackend(str(tmp_path / "shared.db"))
+        shared = SharedCache(backend)
+        await backend.set_many({"cache:format:+14155552671": (pickle.dumps((Payload(), 2e9)), 60.0)})
+        found = await shared.fetch("format", ["+14155552671"])
+        await backend.close()
+        return found, shared.errors
+
+    found, errors = asyncio.run(run())
+    assert found == {}
+    assert errors == 1
+
+def test_incomplete_backend_fails_at_construction():
+    from app.core.shared_cache import SharedBackend
+
+    class NoCount(SharedBackend):
+        async def get_many(self, keys):
+            return {}
+
+        async def set_many(self, items):
+            pass
+
+        async def delete_many(self, keys):
+            pass
+
+        async def incr(self, key, amount, ttl):
+            return amount
+
+    with pytest.raises(TypeError, match="count"):
+        NoCount()
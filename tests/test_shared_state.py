@@ -0,0 +1,23 @@
+import asyncio
+from app.core.database import engine
+from app.core.ratelimit import ProviderLimiter
+from app.core.shared_state import SharedStateSync
+from app.db.migrations import migrate
+
+def test_quota_usage_survives_restart_without_shared_backend(monkeypatch):
+    migrate(engine)
+
+    async def run_worker(calls):
+        # A fresh process: new limiter, usage only known from the database
+        limiter = ProviderLimiter("quota-test", 0, 1, daily_quota=1_000)
+        monkeypatch.setattr("app.core.shared_state.rate_limiters", {"quota-test": limiter})
+        sync = SharedStateSync(interval=60)
+        await sync.start(None)
+        for _ in range(calls):
+            await limiter.acquire()
+        await sync.stop()
+        return limiter
+
+    asyncio.run(run_worker(3))
+    limiter = asyncio.run(run_worker(2))
+    assert (limiter.used_today, limiter.used_month) == (5, 5)
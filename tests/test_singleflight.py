@@ -0,0 +1,24 @@
+import asyncio
+from app.core.singleflight import SingleFlight, CoalescedTally, coalesced_tally
+
+def test_coalesced_calls_counted_per_caller():
+    flight = SingleFlight()
+
+    async def lookup():
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def caller(calls):
+        tally = CoalescedTally()
+        coalesced_tally.set(tally)
+        await asyncio.gather(*(flight.do("key", lookup) for _ in range(calls)))
+        return tally.count
+
+    async def run():
+        # Both callers share one lookup; each counts only its own joined calls
+        return await asyncio.gather(caller(3), caller(2))
+
+    first, second = asyncio.run(run())
+    assert first + second == 4
+    assert flight.stats()["coalesced"] == 4
+    assert (first, second) == (2, 2)
@@ -0,0 +1,29 @@
+import asyncio
+import httpx
+from app.core.config import settings
+
+def test_validate(client):
+    r = client.post("/api/v1/validate", json={"phone_number": "+14155552671", "country_code": "US"})
+    assert r.status_code == 200
+    assert r.json()["formatted_number"] == "+14155552671"
+
+def test_validate_concurrency_beyond_pool(app, monkeypatch):
+    """
+    More concurrent requests than the async pool holds, all needing a format
+    store read: requests must not keep their connection while they wait on it.
+    """
+    monkeypatch.setattr(settings, "CARRIER_LOOKUP_ENABLED", True)
+    # The SQLite async pool holds 5 connections + 10 overflow
+    concurrent = 40
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await asyncio.wait_for(asyncio.gather(*(
+                    client.post("/api/v1/validate", json={"phone_number": f"1415555{i:04d}", "country_code": "US"})
+                    for i in range(concurrent)
+                )), timeout=20)
+
+    responses = asyncio.run(run())
+    assert [r.status_code for r in responses] == [200] * concurrent
@@ -0,0 +1,47 @@
+import asyncio
+from app.core.write_behind import WriteBehindBuffer
+
+class FlakyBuffer(WriteBehindBuffer):
+    def __init__(self, **kwargs):
+        super().__init__("FlakyBuffer", max_size=1_000, interval=60, **kwargs)
+        self.down = True
+        self.written = []
+
+    async def _write(self, records):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        self.written.extend(records)
+
+def test_failed_flush_keeps_records_for_the_next_one():
+    buffer = FlakyBuffer()
+
+    async def run():
+        buffer.add("a", 1)
+        await buffer.flush()
+        buffer.add("b", 2)
+        buffer.add("a", 3)
+        buffer.down = False
+        await buffer.flush()
+
+    asyncio.run(run())
+    # Latest record per key wins, the older key keeps its place
+    assert buffer.written == [3, 2]
+    assert buffer.stats()["failures"] == 1
+    assert buffer.stats()["pending"] == 0
+
+def test_retained_records_are_bounded_while_writes_fail():
+    buffer = FlakyBuffer(max_pending=1_000)
+
+    async def run():
+        for i in range(5_000):
+            buffer.add(i, i)
+            if i % 500 == 0:
+                await buffer.flush()
+        assert len(buffer._buffer) == 1_000
+        buffer.down = False
+        await buffer.flush()
+
+    asyncio.run(run())
+    # The newest records survive the outage, the oldest are dropped and counted
+    assert buffer.written == list(range(4_000, 5_000))
+    assert buffer.stats()["dropped"] == 4_000